@@ -0,0 +1,632 @@
+# Copyright 2018 Tim Hatch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+What the parts of a parse tree can match, for the backtracking checkers.
+
+The answers are over-approximations built from CodeSets: which characters a
+node can consume, whether it can match the empty string, and whether it always
+matches exactly one character.  Nodes the analysis doesn't understand (like
+backreferences and conditionals) give None, and callers should assume the
+worst about them.
+"""
+
+import re
+
+from pygments.token import Other
+
+from regexlint.codeset import MAX_CODE, CodeSet, case_closure, unicode_category
+from regexlint.parser import CATEGORY_ITEMS, CharClass, Repetition
+from regexlint.util import LRUCache, eval_char
+
+__all__ = ["Analysis", "SEQUENCES", "ASSERTIONS", "is_a", "is_assertion"]
+
+# Nodes whose children match one after another.
+SEQUENCES = (
+    Other.Progression,
+    Other.Open.Capturing,
+    Other.Open.NonCapturing,
+    Other.Open.NamedCapturing,
+)
+
+LOOKAROUNDS = (
+    Other.Open.Lookahead,
+    Other.Open.NegativeLookahead,
+    Other.Open.Lookbehind,
+    Other.Open.NegativeLookbehind,
+)
+
+# Nodes that consume nothing but can still fail.
+ASSERTIONS = LOOKAROUNDS + (Other.Anchor,)
+
+# Nodes that consume nothing and always match.
+IGNORED = (Other.Directive, Other.Comment)
+
+# Escapes that are assertions, but that the parser doesn't know about.
+UNKNOWN_ASSERTIONS = ("\\B",)
+
+# The parser puts everything after a "-" (outside a class) up to the next
+# group, alternation or class in one Literals node, so these can be in one
+# without meaning themselves.
+METACHARS = frozenset(".^$*+?{}")
+
+# Tried in order after an attack string, to make the pattern fail.
+SUFFIXES = ("", "!", "\x00", "\n", " ", "a", "0", "\uffff", "\n!\n!")
+
+# Membership of token types (which includes subtypes) is slow to test, and the
+# same few questions get asked for every node.
+_IS_A = {}
+
+# The two checkers ask about the same tree one after the other.
+_ANALYSES = LRUCache(maxsize=8)
+
+
+def is_a(t, types):
+    """Returns whether the token type `t` is in one of `types`."""
+    key = (t, types)
+    try:
+        return _IS_A[key]
+    except KeyError:
+        pass
+    result = _IS_A[key] = any(t in a for a in types)
+    return result
+
+
+def is_assertion(node):
+    """Returns whether `node` consumes nothing but can still fail."""
+    return is_a(node.type, ASSERTIONS) or node.data in UNKNOWN_ASSERTIONS
+
+
+class Analysis(object):
+    """Answers questions about the nodes of one parse tree, `reg`, which are
+    remembered since the checkers ask about the same nodes repeatedly."""
+
+    def __init__(self, reg):
+        self.reg = reg
+        flags = reg.effective_flags
+        self.unicode = bool(flags & re.UNICODE)
+        self.ignorecase = bool(flags & re.IGNORECASE)
+        # Without re.UNICODE, CharClass works in 8 bits, and so does this.
+        self.everything = CodeSet.from_range(0, MAX_CODE if self.unicode else 255)
+        self.dot = self.everything
+        if not flags & re.DOTALL:
+            self.dot -= CodeSet.from_codes([10])
+        self._chars = {}
+        self._nullable = {}
+        self._first = {}
+        self._plain = {}
+
+    @classmethod
+    def of(cls, reg):
+        """Returns an Analysis of `reg`, shared with recent callers."""
+        # Holding on to reg keeps its id from being reused while cached.
+        analysis = _ANALYSES.get(id(reg))
+        if analysis is None or analysis.reg is not reg:
+            analysis = cls(reg)
+            _ANALYSES.put(id(reg), analysis)
+        return analysis
+
+    def chars(self, node):
+        """Returns the CodeSet of characters `node` can consume, or None if
+        that's not known."""
+        key = id(node)
+        try:
+            return self._chars[key]
+        except KeyError:
+            pass
+        codes = self._chars[key] = self._find_chars(node)
+        return codes
+
+    def _find_chars(self, node):
+        t = node.type
+        if isinstance(node, CharClass):
+            if self.unicode:
+                return node.unicode_code_set(self.ignorecase)
+            codes = node.code_set
+            if self.ignorecase:
+                codes = case_closure(codes) & self.everything
+            return codes
+        elif t in Other.BuiltinCharclass:
+            if self.unicode:
+                return unicode_category(node.data)
+            return CATEGORY_ITEMS[node.data][0]
+        elif t in Other.Dot:
+            return self.dot
+        elif t in Other.Alternation or t in SEQUENCES or t in Other.Repetition:
+            union = CodeSet()
+            for child in node.children:
+                codes = self.chars(child)
+                if codes is None:
+                    return None
+                union |= codes
+            return union
+        elif is_a(t, IGNORED) or is_assertion(node):
+            return CodeSet()
+        elif t in Other.Backref or t in Other.Open or not node.data:
+            return None
+        elif t in Other.Literals:
+            # A run of plain characters, unless it isn't.
+            if not METACHARS.isdisjoint(node.data):
+                return None
+            codes = CodeSet.from_codes(map(ord, node.data))
+        else:
+            try:
+                code = eval_char(node.data)
+                if not isinstance(code, int):
+                    code = ord(code)
+            except Exception:
+                return None
+            codes = CodeSet.from_codes([code])
+        if self.ignorecase:
+            codes = case_closure(codes)
+        return codes
+
+    def nullable(self, node):
+        """Returns whether `node` can match the empty string.  Assertions
+        count as empty, and unknown nodes as not."""
+        key = id(node)
+        try:
+            return self._nullable[key]
+        except KeyError:
+            pass
+        result = self._nullable[key] = self._find_nullable(node)
+        return result
+
+    def _find_nullable(self, node):
+        t = node.type
+        if isinstance(node, Repetition):
+            return node.min == 0 or self.nullable(node.children[0])
+        elif t in Other.Alternation:
+            return any(self.nullable(c) for c in node.children)
+        elif t in SEQUENCES:
+            return all(self.nullable(c) for c in node.children)
+        elif is_a(t, IGNORED) or is_assertion(node):
+            return True
+        return False
+
+    def first(self, node):
+        """Returns the CodeSet of characters a match of `node` can start with,
+        maybe with more.  Assertions count as empty, and unknown nodes as
+        starting with anything."""
+        key = id(node)
+        try:
+            return self._first[key]
+        except KeyError:
+            pass
+        codes = self._first[key] = self._find_first(node)
+        return codes
+
+    def _find_first(self, node):
+        t = node.type
+        if isinstance(node, Repetition):
+            return self.first(node.children[0])
+        elif t in Other.Alternation or t in SEQUENCES:
+            union = CodeSet()
+            for child in node.children:
+                union |= self.first(child)
+                if t in SEQUENCES and not self.nullable(child):
+                    break
+            return union
+        elif is_a(t, IGNORED) or is_assertion(node):
+            return CodeSet()
+        elif t in Other.Literals and self.chars(node) is not None:
+            codes = CodeSet.from_codes([ord(node.data[0])])
+            if self.ignorecase:
+                codes = case_closure(codes)
+            return codes
+        codes = self.chars(node)
+        if codes is None:
+            return self.everything
+        return codes
+
+    def single(self, node):
+        """Returns the CodeSet of characters if `node` always matches exactly
+        one character, else None."""
+        t = node.type
+        if t in Other.Alternation:
+            branches = [self.single(c) for c in node.children]
+            if None in branches:
+                return None
+            return CodeSet(r for codes in branches for r in codes.ranges)
+        elif t in SEQUENCES:
+            parts = [c for c in node.children if not is_a(c.type, IGNORED)]
+            if len(parts) != 1:
+                return None
+            return self.single(parts[0])
+        elif isinstance(node, Repetition):
+            if node.min == node.max == 1:
+                return self.single(node.children[0])
+            return None
+        elif isinstance(node, CharClass) or not node.children:
+            if self.nullable(node) or (t in Other.Literals and len(node.data) > 1):
+                return None
+            return self.chars(node)
+        return None
+
+    def can_fail(self, node):
+        """Returns whether `node` can fail to match, once the text before it
+        has matched."""
+        t = node.type
+        if isinstance(node, Repetition):
+            return node.min > 0 and self.can_fail(node.children[0])
+        elif t in Other.Alternation:
+            return all(self.can_fail(c) for c in node.children)
+        elif t in SEQUENCES:
+            return any(self.can_fail(c) for c in node.children)
+        elif is_a(t, IGNORED):
+            return False
+        return True
+
+    def can_fail_after(self, node):
+        """Returns whether something after `node` in the pattern can fail, so
+        the engine may come back to try other ways of matching it."""
+        parent = node.parent()
+        while parent is not None:
+            if parent.type in SEQUENCES:
+                siblings = parent.children
+                i = next(k for k, c in enumerate(siblings) if c is node)
+                if any(self.can_fail(c) for c in siblings[i + 1 :]):
+                    return True
+            elif is_a(parent.type, LOOKAROUNDS):
+                # Whatever it's in decides whether the lookaround succeeds.
+                return True
+            node = parent
+            parent = node.parent()
+        return False
+
+    def plain(self, node):
+        """Returns whether `node` is understood, and asserts nothing."""
+        key = id(node)
+        try:
+            return self._plain[key]
+        except KeyError:
+            pass
+        result = self._plain[key] = (
+            not is_assertion(node)
+            and self.chars(node) is not None
+            and all(self.plain(c) for c in node.children)
+        )
+        return result
+
+    def ambiguous_iteration(self, rep):
+        """Returns the node that lets iterations of the unbounded repetition
+        `rep` match the same text in more than one way, or None.
+
+        That's either an unbounded repetition inside it that lets one
+        iteration match what two would (like a+ in (a+b?)+ or .*? in (.*?,)+),
+        an alternation with one-character branches that overlap (like
+        (\\w|\\d)+), or a longer branch of an alternation that one iteration
+        can match twice, or two iterations once (like aa in (a|aa)+ or ab in
+        (a|b|ab)+).  For the first kind, candidates are found from what
+        characters each part can match, and confirmed by having re match twice
+        an example of an iteration using one iteration.
+        """
+        for node, rest in self._spine(rep.children[0], ()):
+            if node.type in Other.Alternation:
+                seen = CodeSet()
+                for branch in node.children:
+                    codes = self.single(branch)
+                    if codes is None:
+                        if self.matches_twice(rep, branch) or self.matches_in_two(
+                            rep, branch
+                        ):
+                            return branch
+                        continue
+                    if seen.overlaps(codes):
+                        return node
+                    seen |= codes
+                continue
+
+            inner = self.chars(node.children[0])
+            if not inner or any(self.chars(r) is None for r in rest):
+                continue
+            if not all(self.nullable(r) for r in rest) and not all(
+                self.chars(r) <= inner for r in rest
+            ):
+                continue
+            if self.matches_twice(rep, node):
+                return node
+        return None
+
+    def matches_twice(self, rep, inner):
+        """Returns whether one iteration of `rep` can match the same text as
+        two copies of an example iteration going through `inner`."""
+        text = self.iteration_example(rep, inner)
+        if not text:
+            return False
+        body = self.reg.raw[rep.start : rep.end - len(rep.end_data)]
+        try:
+            return all(
+                re.fullmatch(pattern % body, text * 2, self.reg.effective_flags)
+                for pattern in ("(?:%s)", "(?:%s){2}")
+            )
+        except Exception:
+            # Like a group reference that's outside the body.
+            return False
+
+    def matches_in_two(self, rep, inner):
+        """Returns whether two iterations of `rep`, neither of them empty, can
+        match an example iteration going through `inner`."""
+        text = self.iteration_example(rep, inner)
+        if not text:
+            return False
+        body = "(?:%s)" % self.reg.raw[rep.start : rep.end - len(rep.end_data)]
+        try:
+            return any(
+                re.fullmatch(body, text[:i], self.reg.effective_flags)
+                and re.fullmatch(body, text[i:], self.reg.effective_flags)
+                for i in range(1, len(text))
+            )
+        except Exception:
+            return False
+
+    def iteration_example(self, rep, inner):
+        """Returns an example of what one iteration of `rep` can match, going
+        through `inner`, or None."""
+        path = set()
+        node = inner
+        while node is not rep:
+            path.add(id(node))
+            node = node.parent()
+        return self.example(rep.children[0], path)
+
+    def example(self, node, path=()):
+        """Returns a short string that `node` can match, taking the branches
+        that lead to nodes whose ids are in `path`, or None if it can't make
+        one up."""
+        t = node.type
+        if isinstance(node, Repetition):
+            text = self.example(node.children[0], path)
+            if text is None:
+                return None
+            return text * node.min
+        elif t in Other.Alternation:
+            examples = []
+            for branch in node.children:
+                text = self.example(branch, path)
+                if text is not None and id(branch) in path:
+                    return text
+                examples.append(text)
+            examples = [e for e in examples if e is not None]
+            return min(examples, key=len) if examples else None
+        elif t in SEQUENCES:
+            parts = [self.example(c, path) for c in node.children]
+            if None in parts:
+                return None
+            return "".join(parts)
+        elif is_a(t, IGNORED) or is_assertion(node):
+            return ""
+        elif t in Other.Literals:
+            return node.data
+        codes = self.chars(node)
+        if not codes:
+            return None
+        return chr(codes.min())
+
+    def _spine(self, node, rest):
+        # Yields (node, rest) for the unbounded repetitions and alternations
+        # that can be matched as part of one match of `node`, where `rest` is
+        # what else has to match along with them.
+        if isinstance(node, Repetition):
+            if node.max is None:
+                yield node, rest
+            elif node.max == 1:
+                yield from self._spine(node.children[0], rest)
+        elif node.type in Other.Alternation:
+            yield node, rest
+            for branch in node.children:
+                yield from self._spine(branch, rest)
+        elif node.type in SEQUENCES:
+            children = tuple(node.children)
+            for i, child in enumerate(children):
+                yield from self._spine(child, rest + children[:i] + children[i + 1 :])
+
+    def adjacent_chains(self, seq):
+        """Yields lists of unbounded repetitions among the children of the
+        sequence `seq` where each one can take over text from the next one
+        (like \\w+\\s*\\w+), so a match can be split between them in
+        polynomially many ways."""
+        children = seq.children
+        i = 0
+        while i < len(children):
+            chain = [i]
+            while True:
+                j = self._overlapping_next(children, chain[-1])
+                if j is None:
+                    break
+                chain.append(j)
+            if len(chain) > 1:
+                yield [children[j] for j in chain]
+            i = chain[-1] + 1
+
+    def _overlapping_next(self, children, i):
+        # The index of the unbounded repetition after children[i] that can
+        # take text from it, if only things it could also match are between.
+        if not isinstance(children[i], Repetition) or children[i].max is not None:
+            return None
+        codes = self.chars(children[i].children[0])
+        if not codes or not self.plain(children[i]):
+            return None
+        for j in range(i + 1, len(children)):
+            node = children[j]
+            if not self.plain(node):
+                return None
+            if isinstance(node, Repetition) and node.max is None:
+                shared = codes & self.chars(node.children[0])
+                if (
+                    shared
+                    and not self.stopped_early(node, shared)
+                    and self.splits_two_ways(children[i], children[i + 1 : j], node)
+                ):
+                    return j
+            if not self.nullable(node) and not self.chars(node) <= codes:
+                return None
+        return None
+
+    def stopped_early(self, rep, codes):
+        """Returns whether the lazy repetition `rep` gives up on its match as
+        soon as it's followed by one of `codes`, because the rest of the
+        pattern matches the empty string there (like .+?(?=\\s) at the
+        end)."""
+        if not rep.end_data.endswith("?"):
+            return False
+        node = rep
+        parent = node.parent()
+        while parent is not None:
+            if parent.type in SEQUENCES:
+                siblings = parent.children
+                i = next(k for k, c in enumerate(siblings) if c is node)
+                if not codes <= self.passes(siblings[i + 1 :]):
+                    return False
+            elif parent.type not in Other.Alternation:
+                # Another iteration, or a lookaround, could still fail.
+                return False
+            node = parent
+            parent = node.parent()
+        return True
+
+    def passes(self, nodes):
+        """Returns the CodeSet of characters before which the sequence `nodes`
+        can match the empty string."""
+        codes = self.everything
+        for node in nodes:
+            t = node.type
+            if is_a(t, IGNORED) or (self.plain(node) and self.nullable(node)):
+                continue
+            elif t in Other.Open.Lookahead:
+                codes &= self.accepts(node.children)
+            elif t in Other.Alternation:
+                found = CodeSet()
+                for branch in node.children:
+                    found |= self.passes([branch])
+                codes &= found
+            elif t in SEQUENCES:
+                codes &= self.passes(node.children)
+            elif t in Other.Anchor.End and self.reg.effective_flags & re.MULTILINE:
+                codes &= CodeSet.from_codes([10])
+            else:
+                return CodeSet()
+        return codes
+
+    def accepts(self, nodes):
+        """Returns the CodeSet of characters that the sequence `nodes` matches
+        a start of, whatever follows them."""
+        codes = self.passes(nodes)
+        parts = [n for n in nodes if not is_a(n.type, IGNORED)]
+        if len(parts) == 1:
+            node = parts[0]
+            if node.type in Other.Alternation:
+                for branch in node.children:
+                    codes |= self.accepts([branch])
+            elif node.type in SEQUENCES:
+                codes |= self.accepts(node.children)
+            elif isinstance(node, Repetition) and node.min == 1:
+                codes |= self.accepts(node.children)
+            else:
+                codes |= self.single(node) or CodeSet()
+        return codes
+
+    def splits_two_ways(self, first, between, last):
+        """Returns whether re, matching an example text, gives the unbounded
+        repetition `first` different amounts of it when it's greedy and when
+        it's lazy, with `between` and the repetition `last` after it."""
+        parts = [self.example(n) for n in between]
+        if None in parts:
+            return False
+        middle = "".join(parts)
+        start = self.example(first)
+        end = self.example(last)
+        shared = self.chars(first.children[0]) & self.chars(last.children[0])
+        c = chr(shared.min())
+        raw = self.reg.raw
+        body = raw[first.start : first.end - len(first.end_data)]
+        greedy = first.end_data.rstrip("?")
+        after = raw[first.end : last.end]
+        ends = set()
+        for quantifier in (greedy, greedy + "?"):
+            pattern = "(%s%s)(?:%s)" % (body, quantifier, after)
+            for text in (middle + c, middle + middle):
+                try:
+                    m = re.fullmatch(
+                        pattern, start + text + end, self.reg.effective_flags
+                    )
+                except Exception:
+                    return False
+                if m:
+                    ends.add((text, m.end(1)))
+        return len(ends) > len(set(text for text, _ in ends))
+
+    def attack(self, nodes):
+        """Returns (prefix, pump, suffix) strings where the pattern can't
+        match prefix + pump * n + suffix, but tries many ways of matching the
+        pumped part with `nodes`, or None if they can't be made up.
+
+        `nodes` is either an unbounded repetition that check 126 reports, or
+        a chain that check 127 reports."""
+        if len(nodes) == 1:
+            inner = self.ambiguous_iteration(nodes[0])
+            if inner is None:
+                return None
+            pump = self.iteration_example(nodes[0], inner)
+        else:
+            parts = []
+            for first, last in zip(nodes, nodes[1:]):
+                between = self._between(first, last)
+                texts = [self.example(n) for n in between]
+                if None in texts:
+                    return None
+                shared = self.chars(first.children[0]) & self.chars(
+                    last.children[0]
+                )
+                parts.extend(texts)
+                parts.append(chr(shared.min()))
+            pump = "".join(parts)
+        prefix = self.prefix(nodes[0])
+        if not pump or prefix is None:
+            return None
+        text = prefix + pump * 4
+        for suffix in SUFFIXES:
+            try:
+                m = re.match(self.reg.raw, text + suffix, self.reg.effective_flags)
+                if m is None:
+                    return prefix, pump, suffix
+            except Exception:
+                return None
+        return None
+
+    def prefix(self, node):
+        """Returns an example of what the pattern matches before `node`, or
+        None if it can't make one up."""
+        parts = []
+        parent = node.parent()
+        while parent is not None:
+            if parent.type in SEQUENCES:
+                before = []
+                for child in parent.children:
+                    if child is node:
+                        break
+                    before.append(self.example(child))
+                if None in before:
+                    return None
+                parts[:0] = before
+            node = parent
+            parent = node.parent()
+        return "".join(parts)
+
+    def _between(self, first, last):
+        # The siblings between `first` and `last` in their sequence.
+        siblings = first.parent().children
+        i = next(k for k, c in enumerate(siblings) if c is first)
+        j = next(k for k, c in enumerate(siblings) if c is last)
+        return siblings[i + 1 : j]
@@ -0,0 +1,304 @@
+# Copyright 2018 Tim Hatch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Finite automata for the languages of parse trees.
+
+build() makes a Thompson NFA with CodeSet-labeled edges from a tree.  With
+exact=True it has the same language as the pattern, and raises Unsupported for
+anything that can't be done that way (anchors, lookarounds, backreferences,
+possessive repetitions).  With exact=False those are over-approximated
+instead: assertions match the empty string and backreferences match anything,
+so every string the pattern can match is accepted, and maybe more.
+
+covers() answers whether every string one automaton accepts starts with a
+string some others accept, building the DFA states it needs as it goes.  Both
+have budgets, so a huge pattern gives up (TooBig, or None) instead of taking
+forever.
+"""
+
+from pygments.token import Other
+
+from regexlint.analysis import IGNORED, SEQUENCES, Analysis, is_a, is_assertion
+from regexlint.codeset import CodeSet, case_closure
+from regexlint.parser import CharClass, Repetition
+
+__all__ = ["NFA", "TooBig", "Unsupported", "build", "covers"]
+
+MAX_NFA_STATES = 2000
+MAX_DFA_STATES = 2000
+
+
+class Unsupported(Exception):
+    """The tree has something an exact automaton can't represent."""
+
+
+class TooBig(Exception):
+    """The automaton would have more than its budget of states."""
+
+
+class NFA(object):
+    """A nondeterministic automaton whose states are ints.  `edges[s]` is a
+    list of (CodeSet, t) and `eps[s]` a list of t, for the transitions out of
+    s; `start` and `accept` are set by build()."""
+
+    def __init__(self, max_states=MAX_NFA_STATES):
+        self.max_states = max_states
+        self.edges = []
+        self.eps = []
+        self.start = None
+        self.accept = None
+
+    def add_state(self):
+        if len(self.edges) >= self.max_states:
+            raise TooBig("more than %d NFA states" % self.max_states)
+        self.edges.append([])
+        self.eps.append([])
+        return len(self.edges) - 1
+
+    def closure(self, states):
+        """Returns the frozenset of states reachable from `states` by empty
+        transitions."""
+        seen = set(states)
+        todo = list(states)
+        while todo:
+            for t in self.eps[todo.pop()]:
+                if t not in seen:
+                    seen.add(t)
+                    todo.append(t)
+        return frozenset(seen)
+
+    def examples(self):
+        """Yields a short string the automaton accepts for each edge out of
+        the start (and the empty one, if it's accepted), made of the lowest
+        character of each label."""
+        start = self.closure([self.start])
+        if self.accept in start:
+            yield ""
+        for s in sorted(start):
+            for label, t in self.edges[s]:
+                rest = self._example(t)
+                if rest is not None:
+                    yield chr(label.min()) + rest
+
+    def _example(self, state):
+        # Breadth first over single states, so this is linear in the edges.
+        paths = {state: ""}
+        todo = [state]
+        for s in todo:
+            if s == self.accept:
+                return paths[s]
+            steps = [("", t) for t in self.eps[s]]
+            steps.extend((chr(label.min()), t) for label, t in self.edges[s])
+            for c, t in steps:
+                if t not in paths:
+                    paths[t] = paths[s] + c
+                    todo.append(t)
+        return None
+
+    def accepts_prefix(self, text):
+        """Returns whether the automaton accepts some prefix of `text`."""
+        states = self.closure([self.start])
+        for c in text:
+            if self.accept in states:
+                return True
+            code = ord(c)
+            states = self.closure(
+                [t for s in states for label, t in self.edges[s] if code in label]
+            )
+            if not states:
+                return False
+        return self.accept in states
+
+
+class _Builder(object):
+    def __init__(self, reg, exact, max_states):
+        self.analysis = Analysis.of(reg)
+        self.exact = exact
+        self.nfa = NFA(max_states)
+        self.literals = {}
+
+    def unsupported(self, node):
+        raise Unsupported("can't make an exact automaton with %r" % (node.data,))
+
+    def anything(self, s):
+        # Loops on every character, for what's over-approximated as .*
+        self.nfa.edges[s].append((self.analysis.everything, s))
+        return s
+
+    def literal(self, c):
+        codes = self.literals.get(c)
+        if codes is None:
+            codes = CodeSet.from_codes([ord(c)])
+            if self.analysis.ignorecase:
+                codes = case_closure(codes)
+            self.literals[c] = codes
+        return codes
+
+    def chain(self, s, codes):
+        t = self.nfa.add_state()
+        self.nfa.edges[s].append((codes, t))
+        return t
+
+    def add(self, node, s):
+        """Adds states matching `node` after state s, returning the state
+        where they end."""
+        t = node.type
+        nfa = self.nfa
+        if isinstance(node, Repetition):
+            return self.add_repetition(node, s)
+        elif t in SEQUENCES:
+            for child in node.children:
+                s = self.add(child, s)
+            return s
+        elif t in Other.Alternation:
+            end = nfa.add_state()
+            for branch in node.children:
+                start = nfa.add_state()
+                nfa.eps[s].append(start)
+                nfa.eps[self.add(branch, start)].append(end)
+            return end
+        elif is_a(t, IGNORED):
+            return s
+        elif is_assertion(node):
+            if self.exact:
+                self.unsupported(node)
+            # A lookaround's contents don't consume anything.
+            return s
+        elif isinstance(node, CharClass):
+            pass
+        elif t in Other.Backref or t in Other.Open or not node.data:
+            if self.exact:
+                self.unsupported(node)
+            return self.anything(s)
+        elif t in Other.Literals and self.analysis.chars(node) is not None:
+            for c in node.data:
+                s = self.chain(s, self.literal(c))
+            return s
+
+        codes = self.analysis.chars(node)
+        if codes is None:
+            if self.exact:
+                self.unsupported(node)
+            return self.anything(s)
+        return self.chain(s, codes)
+
+    def add_repetition(self, node, s):
+        nfa = self.nfa
+        body = node.children[0]
+        if isinstance(body, Repetition) and self.exact:
+            # Like a*+, which is possessive since Python 3.11.
+            self.unsupported(node)
+        for _ in range(node.min):
+            s = self.add(body, s)
+        if node.max is None:
+            start = nfa.add_state()
+            nfa.eps[s].append(start)
+            nfa.eps[self.add(body, start)].append(start)
+            return start
+        end = nfa.add_state()
+        for _ in range(node.max - node.min):
+            nfa.eps[s].append(end)
+            s = self.add(body, s)
+        nfa.eps[s].append(end)
+        return end
+
+
+def build(reg, exact=True, max_states=MAX_NFA_STATES):
+    """Returns an NFA for the parse tree `reg`, as described above."""
+    builder = _Builder(reg, exact, max_states)
+    nfa = builder.nfa
+    nfa.start = nfa.add_state()
+    nfa.accept = builder.add(reg, nfa.start)
+    return nfa
+
+
+def _groups(labels):
+    # Splits the characters of the first list of `labels` into pieces that
+    # are in the same labels of every list, returning the distinct tuples of
+    # (indices of the labels in each list) for them.  This sweeps over the
+    # ends of the ranges, which are clipped to the first list's characters,
+    # with equal labels in a list taken together.
+    mine = CodeSet(r for codes in labels[0] for r in codes.ranges)
+    events = []
+    for g, group in enumerate(labels):
+        same = {}
+        for i, codes in enumerate(group):
+            same.setdefault(codes, []).append(i)
+        for codes, indices in same.items():
+            if g:
+                codes &= mine
+            indices = tuple(indices)
+            for lo, hi in codes.ranges:
+                events.append((lo, 1, g, indices))
+                events.append((hi + 1, -1, g, indices))
+    events.sort()
+    active = [set() for _ in labels]
+    found = set()
+    for n, (code, change, g, indices) in enumerate(events):
+        if change > 0:
+            active[g].add(indices)
+        else:
+            active[g].discard(indices)
+        if n + 1 < len(events) and events[n + 1][0] == code:
+            continue
+        if active[0]:
+            found.add(tuple(frozenset(a) for a in active))
+    return [tuple(tuple(sorted(i for t in a for i in t)) for a in key) for key in found]
+
+
+def covers(covering, nfa, max_states=MAX_DFA_STATES):
+    """Returns whether every string `nfa` accepts starts with a string one of
+    the NFAs in `covering` accepts, or None if that takes more than
+    `max_states` states of the combined DFA to find out."""
+    def step(automaton, states, key):
+        # The states after taking edges with the labels numbered in `key`.
+        edges = [e for s in sorted(states) for e in automaton.edges[s]]
+        return automaton.closure([edges[i][1] for i in key])
+
+    for text in nfa.examples():
+        # One string nothing else matches the start of settles it.
+        if not any(a.accepts_prefix(text) for a in covering):
+            return False
+
+    start = (
+        nfa.closure([nfa.start]),
+        tuple(a.closure([a.start]) for a in covering),
+    )
+    seen = {start}
+    todo = [start]
+    while todo:
+        mine, theirs = todo.pop()
+        if any(a.accept in states for a, states in zip(covering, theirs)):
+            # Anything from here on starts with a string they accept.
+            continue
+        if nfa.accept in mine:
+            return False
+        labels = [[label for s in sorted(mine) for label, _ in nfa.edges[s]]]
+        for a, states in zip(covering, theirs):
+            labels.append([label for s in sorted(states) for label, _ in a.edges[s]])
+        for key in _groups(labels):
+            after = (
+                step(nfa, mine, key[0]),
+                tuple(
+                    step(a, states, k)
+                    for a, states, k in zip(covering, theirs, key[1:])
+                ),
+            )
+            if after not in seen:
+                if len(seen) >= max_states:
+                    return None
+                seen.add(after)
+                todo.append(after)
+    return True
@@ -0,0 +1,400 @@
+# Copyright 2018 Tim Hatch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Character class checks for many parse trees at once, using NumPy.
+
+The classes of a whole job are laid out as rows of 256-column boolean
+matrices.  Checks 117 and 122 are answered for all of them with a few array
+operations, and only the trees that have something to report run the regular
+checker (so the messages are exactly the same).  Check 123 still runs per
+class, but which categories fit each distinct class is found with one matrix
+product, and the simplification left in charclass.SIMPLIFY_CACHE for it.
+
+In Unicode mode that's split at 256: a class is done here when what it has
+past 0xff is either nothing or everything, give or take case forms that
+aren't the preferred spelling.  Then the part past 0xff of whatever's left
+once some categories are taken out doesn't depend on the class, and is
+worked out once per combination of categories.  Other Unicode classes are
+left to the checker.
+
+Trees with a class that doesn't fit in 8 bits, or an item that eval_char
+can't make a code of, are left to the regular checkers for 117 and 122, as
+is everything when NumPy isn't installed.
+"""
+
+import re
+
+from pygments.token import Other
+
+from regexlint import checkers
+from regexlint.bitvector import bitvector, population, unpack_bitvector
+from regexlint.charclass import (
+    ALNUM,
+    COMBINATIONS,
+    HEX,
+    SIMPLIFY_CACHE,
+    UNICODE_KEYS,
+    build_code_ranges,
+    build_output,
+    choose_unicode_items,
+    simplify_charclass,
+    unicode_cats,
+)
+from regexlint.codeset import MAX_CODE, CodeSet, case_variants
+from regexlint.parser import CharRange
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ["available", "run_all_checkers"]
+
+BATCHED = (
+    checkers.check_charclass_overlap,
+    checkers.check_charclass_case_insensitive_overlap,
+)
+
+# Built on first use: for each ignorecase, a (len(COMBINATIONS), 256) matrix
+# of the codes in each combination of categories.
+_masks = None
+
+# Where each of UNICODE_KEYS is in the rows of _UnicodeTables.
+KEY_INDEX = {k: j for j, k in enumerate(UNICODE_KEYS)}
+BYTE = (1 << 256) - 1
+HIGH = CodeSet.from_range(256, MAX_CODE)
+
+# Built on first use, for each ignorecase: see _unicode_tables().
+_unicode = [None, None]
+
+
+def available():
+    return numpy is not None
+
+
+def run_all_checkers(items):
+    """Returns the result of checkers.run_all_checkers(reg, expected_groups)
+    for each (reg, expected_groups) in `items`.  Findings of one kind come in
+    the same order, but kinds may be in a different order, which doesn't
+    matter once they're sorted by (level, num) as cmdline does."""
+    if numpy is None:
+        return [checkers.run_all_checkers(reg, groups) for reg, groups in items]
+
+    results = [None] * len(items)
+    batch = []
+    for n, (reg, groups) in enumerate(items):
+        if fits_8_bits(reg):
+            batch.append(n)
+        else:
+            results[n] = checkers.run_all_checkers(reg, groups)
+
+    regs = [items[n][0] for n in batch]
+    overlapping = find_overlaps(regs)
+    case_overlapping = find_case_overlaps(regs)
+    prime_simplify_cache(regs)
+
+    for n, reg, overlap, case_overlap in zip(
+        batch, regs, overlapping, case_overlapping
+    ):
+        errs = checkers.run_all_checkers(reg, items[n][1], skip=BATCHED)
+        if overlap:
+            checkers.run_checker(BATCHED[0], reg, errs)
+        if case_overlap:
+            checkers.run_checker(BATCHED[1], reg, errs)
+        results[n] = errs
+    return results
+
+
+def fits_8_bits(reg):
+    for cc in checkers.visited(reg, Other.CharClass):
+        for codes in cc.item_code_sets():
+            if codes is None or (codes and codes.max() > 255):
+                return False
+    return True
+
+
+def _rows(code_sets):
+    matrix = numpy.zeros((len(code_sets), 256), dtype=bool)
+    for i, codes in enumerate(code_sets):
+        for lo, hi in codes.ranges:
+            matrix[i, lo : hi + 1] = True
+    return matrix
+
+
+def _bit_rows(bitvectors):
+    data = b"".join(bv.to_bytes(32, "little") for bv in bitvectors)
+    return numpy.unpackbits(
+        numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, 32),
+        axis=1,
+        bitorder="little",
+    ).astype(bool)
+
+
+def find_overlaps(regs):
+    """Returns, for each tree, whether check 117 finds anything in it: whether
+    two items of some class (that isn't negated) share a code."""
+    owners = []
+    starts = []
+    code_sets = []
+    for n, reg in enumerate(regs):
+        for cc in checkers.visited(reg, Other.CharClass):
+            if cc.negated or not cc.chars:
+                continue
+            owners.append(n)
+            starts.append(len(code_sets))
+            code_sets.extend(cc.item_code_sets())
+
+    result = [False] * len(regs)
+    if code_sets:
+        counts = numpy.add.reduceat(
+            _rows(code_sets), starts, axis=0, dtype=numpy.int32
+        )
+        for i in numpy.flatnonzero((counts > 1).any(axis=1)):
+            result[owners[i]] = True
+    return result
+
+
+def find_case_overlaps(regs):
+    """Returns, for each tree, whether check 122 finds anything in it: whether
+    some class has two ranges that are the same once folded to uppercase."""
+    owners = []
+    rows = []
+    for n, reg in enumerate(regs):
+        if not reg.effective_flags & re.IGNORECASE:
+            continue
+        for cc in checkers.visited(reg, Other.CharClass):
+            for c in cc.chars:
+                if isinstance(c, CharRange):
+                    rows.append((len(owners), c.codepoint_a, c.codepoint_b))
+            owners.append(n)
+
+    result = [False] * len(regs)
+    if rows:
+        rows = numpy.array(rows, dtype=numpy.int32)
+        lower = (rows[:, 1:] >= 97) & (rows[:, 1:] <= 122)
+        rows[:, 1:] -= 32 * lower
+        unique, counts = numpy.unique(rows, axis=0, return_counts=True)
+        for i in unique[counts > 1, 0]:
+            result[owners[i]] = True
+    return result
+
+
+def _lowercase_rows(rows):
+    rows = rows.copy()
+    rows[:, 97:123] |= rows[:, 65:91]
+    rows[:, 65:91] = False
+    return rows
+
+
+def _fits(masks, targets):
+    # A combination fits when none of its codes are outside the target.
+    return (~targets).astype(numpy.int32) @ masks.T.astype(numpy.int32) == 0
+
+
+def prime_simplify_cache(regs):
+    """Works out the 8-bit simplifications check 123 will want for `regs`,
+    for the classes that aren't already in SIMPLIFY_CACHE."""
+    global _masks
+    if _masks is None:
+        _masks = tuple(
+            _bit_rows([c[1][ignorecase] for c in COMBINATIONS])
+            for ignorecase in (0, 1)
+        )
+
+    wanted = {}
+    wanted_unicode = {}
+    for reg in regs:
+        ignorecase = bool(reg.effective_flags & re.I)
+        if reg.effective_flags & re.UNICODE:
+            for cc in checkers.visited(reg, Other.CharClass):
+                codes = cc.unicode_code_set(ignorecase)
+                if SIMPLIFY_CACHE.get((True, codes, ignorecase)) is None:
+                    wanted_unicode[codes, ignorecase] = True
+            continue
+        if any(ord(c) > 255 for c in reg.raw):
+            continue
+        for cc in checkers.visited(reg, Other.CharClass):
+            codes = cc.matching_character_codes
+            if not codes:
+                continue
+            bv = bitvector(codes)
+            if SIMPLIFY_CACHE.get((False, bv, ignorecase)) is None:
+                wanted[bv, ignorecase] = codes
+
+    for ignorecase in (False, True):
+        todo = [(bv, codes) for (bv, ic), codes in wanted.items() if ic == ignorecase]
+        if not todo:
+            continue
+        rows = _bit_rows([bv for bv, _ in todo])
+        if ignorecase:
+            targets = (_lowercase_rows(rows), _lowercase_rows(~rows))
+        else:
+            targets = (rows, ~rows)
+        masks = _masks[ignorecase]
+        feasible = (_fits(masks, targets[0]), _fits(masks, targets[1]))
+        for i, (_, codes) in enumerate(todo):
+            try:
+                simplify_charclass(
+                    codes, ignorecase, feasible=(feasible[0][i], feasible[1][i])
+                )
+            except Exception:
+                # The checker will run into it again, and report it.
+                pass
+
+    for ignorecase in (False, True):
+        todo = [codes for codes, ic in wanted_unicode if ic == ignorecase]
+        if todo:
+            _prime_unicode(todo, ignorecase)
+
+
+class _UnicodeTables(object):
+    # What _prime_unicode needs for one ignorecase: for each of UNICODE_KEYS,
+    # its codes below 256 as a matrix row and as a bitvector, and the same
+    # for the codes that aren't the preferred spelling of their case forms.
+    # `usable` is whether every category has some other code past 0xff.
+
+    def __init__(self, ignorecase):
+        self.ignorecase = ignorecase
+        self.noncanonical = case_variants()[2] if ignorecase else CodeSet()
+        self.low_noncanonical = bitvector(_low_codes(self.noncanonical))
+        cats = [unicode_cats(k, ignorecase=ignorecase) for k in UNICODE_KEYS]
+        self.low_cats = [bitvector(_low_codes(codes)) for codes in cats]
+        self.rows = _bit_rows(self.low_cats)
+        self.usable = all(
+            (codes & HIGH) - self.noncanonical for codes in cats
+        )
+        self._high = {}
+
+    def high(self, keys):
+        """Returns (items, length of their output) for what's past 0xff in
+        any class once the categories `keys` and the noncanonical codes are
+        taken out of it."""
+        result = self._high.get(tuple(keys))
+        if result is None:
+            rest = HIGH - unicode_cats(*keys, ignorecase=self.ignorecase)
+            items = build_code_ranges(rest - self.noncanonical)
+            result = self._high[tuple(keys)] = (items, len(build_output(items)))
+        return result
+
+
+def _unicode_tables(ignorecase):
+    if _unicode[ignorecase] is None:
+        _unicode[ignorecase] = _UnicodeTables(ignorecase)
+    return _unicode[ignorecase]
+
+
+def _low_codes(codes):
+    return [
+        c for lo, hi in codes.ranges if lo < 256 for c in range(lo, min(hi, 255) + 1)
+    ]
+
+
+def _join_high(low_items, high_items):
+    # A run through 0xff continues in the high part instead of ending there.
+    if not low_items or not high_items:
+        return low_items + high_items
+    last = low_items[-1]
+    first = high_items[0]
+    if (last if isinstance(last, int) else last[1]) != 255:
+        return low_items + high_items
+    if (first if isinstance(first, int) else first[0]) != 256:
+        return low_items + high_items
+    lo = last if isinstance(last, int) else last[0]
+    hi = first if isinstance(first, int) else first[1]
+    return low_items[:-1] + [(lo, hi)] + high_items[1:]
+
+
+def _prime_unicode(todo, ignorecase):
+    """Works out what simplify_unicode_charclass says about each CodeSet in
+    `todo` that doesn't go past 0xff (or goes all the way), with the same
+    choose_unicode_items, and puts it in SIMPLIFY_CACHE.
+
+    Every category has codes past 0xff that a class like that doesn't, so
+    they can only fit the way round where the class covers the high codes;
+    and there, whether they fit is down to the low 256 (for the ones that
+    are case forms of what's past 0xff, of the low ones too).  The high part
+    of what's left over is the same for every class."""
+    tables = _unicode_tables(ignorecase)
+    if not tables.usable:
+        return
+
+    classes = []
+    for codes in todo:
+        low = bitvector(_low_codes(codes))
+        if not codes or low & HEX == HEX and not low & 1 << ord("g"):
+            continue
+        if low & ALNUM == ALNUM and not low & 1 << ord("_"):
+            continue
+        high = codes & HIGH
+        if high <= tables.noncanonical:
+            covers_high = False
+        elif high.complement(256, MAX_CODE) <= tables.noncanonical:
+            covers_high = True
+        else:
+            continue
+        classes.append((codes, low, covers_high))
+    if not classes:
+        return
+
+    rows = _bit_rows([low for _, low, _ in classes])
+    masks = tables.rows
+    feasible = (_fits(masks, rows), _fits(masks, ~rows))
+    for i, (codes, low, covers_high) in enumerate(classes):
+        result = choose_unicode_items(
+            *_split_class(tables, low, covers_high, feasible, i)
+        )
+        if result is not None:
+            SIMPLIFY_CACHE.put((True, codes, ignorecase), result)
+
+
+def _split_class(tables, low, covers_high, feasible, i):
+    # The fits, rest_of and items_of functions for choose_unicode_items, for
+    # class `i` of the ones _prime_unicode handles, whose codes below 256 are
+    # the bitvector `low`.  The rest is kept as a bitvector of the low codes.
+
+    def has_high(negated):
+        return covers_high != bool(negated)
+
+    def fits(negated, key):
+        return has_high(negated) and feasible[negated][i, KEY_INDEX[key]]
+
+    def rest_of(chosen_keys, negated):
+        rest = (BYTE & ~low if negated else low) & ~tables.low_noncanonical
+        for k in chosen_keys:
+            rest &= ~tables.low_cats[KEY_INDEX[k]]
+        # One item for each run of codes left.
+        count = population(rest & ~(rest << 1))
+        if has_high(negated):
+            # Less one for a run through 0xff.
+            count += len(tables.high(chosen_keys)[0]) - 1
+        return rest, count
+
+    def items_of(chosen_keys, negated, rest):
+        low_items = build_code_ranges(CodeSet.from_codes(unpack_bitvector(rest)))
+        items = chosen_keys + low_items
+        length = len(build_output(items))
+        if has_high(negated):
+            high_items, high_length = tables.high(chosen_keys)
+            items = chosen_keys + _join_high(low_items, high_items)
+            length += high_length
+            if len(items) < len(chosen_keys) + len(low_items) + len(high_items):
+                # The output is that of the parts, but for the run through
+                # 0xff.
+                merged = items[len(chosen_keys) + len(low_items) - 1]
+                length += len(build_output([merged]))
+                length -= len(build_output([low_items[-1], high_items[0]]))
+        return items, length
+
+    return fits, rest_of, items_of
@@ -13,6 +13,18 @@
 # limitations under the License.
 
 
+__all__ = ["bitvector", "unpack_bitvector", "iter_bits", "population"]
+
+# BYTE_BITS[k][i] is the positions of the set bits in byte value i when it's
+# byte k of a bitvector, for the first TABLE_BYTES bytes (enough for 8-bit
+# character classes).  Later bytes use the positions from BYTE_BITS[0].
+TABLE_BYTES = 32
+BYTE_BITS = tuple(
+    tuple(tuple(8 * k + b for b in range(8) if i & (1 << b)) for i in range(256))
+    for k in range(TABLE_BYTES)
+)
+
+
 def bitvector(nums):
     i = 0
     for n in nums:
@@ -20,22 +32,40 @@ def bitvector(nums):
     return i
 
 
+def _byte_positions(bv):
+    for k, byte in enumerate(bv.to_bytes((bv.bit_length() + 7) // 8, "little")):
+        if byte:
+            if k < TABLE_BYTES:
+                yield BYTE_BITS[k][byte]
+            else:
+                yield [8 * k + b for b in BYTE_BITS[0][byte]]
+
+
+def iter_bits(bv):
+    """Yields the positions of the set bits in `bv`, lowest first."""
+    for positions in _byte_positions(bv):
+        for i in positions:
+            yield i
+
+
 def unpack_bitvector(bv):
+    # Same as list(iter_bits(bv)), inlined since this is check 123's inner loop.
     ret = []
-    code = 0
-    mask = 1
-    while mask <= bv:
-        if bv & mask:
-            ret.append(code)
-        code += 1
-        mask <<= 1
+    for k, byte in enumerate(bv.to_bytes((bv.bit_length() + 7) // 8, "little")):
+        if byte:
+            if k < TABLE_BYTES:
+                ret.extend(BYTE_BITS[k][byte])
+            else:
+                ret.extend([8 * k + b for b in BYTE_BITS[0][byte]])
     return ret
 
 
-def population(i):
-    n = 0
-    while i:
-        if i & 1:
-            n += 1
-        i >>= 1
-    return n
+if hasattr(int, "bit_count"):
+
+    def population(i):
+        return i.bit_count()
+
+else:
+
+    def population(i):
+        return bin(i).count("1")
@@ -0,0 +1,220 @@
+# Copyright 2018 Tim Hatch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+On-disk cache of checker results, so that rerunning regexlint over lexers
+that haven't changed doesn't need to parse or check their patterns again.
+
+Results are stored in a SQLite database under the cache directory, keyed by
+a hash of everything that can change the findings for one rule: the pattern
+text, the lexer flags, the shape of its bygroups() action, how the rule looks
+to manual_check_for_empty_string_match, and the regexlint source itself.
+Which rules of a state are shadowed (W129) is stored per state, keyed by the
+rules it tries, includes and all.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from pygments.util import Future
+
+DEFAULT_SIZE = 1000000
+
+_version = None
+
+
+def code_version():
+    """Returns a hash of the regexlint sources and the Python version, which
+    both affect what the checkers report."""
+    global _version
+    if _version is None:
+        h = hashlib.sha1(sys.version.encode("utf-8"))
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in sorted(os.listdir(here)):
+            if name.endswith(".py"):
+                h.update(name.encode("utf-8"))
+                with open(os.path.join(here, name), "rb") as f:
+                    h.update(f.read())
+        _version = h.hexdigest()
+    return _version
+
+
+def result_key(pattern, flags, groups, token_action, has_transition, ignore_w123):
+    """Returns the cache key for one rule.
+
+    `groups` is the argument tuple of a bygroups() action (or None); only
+    which entries are None matters to the checkers.  `token_action` and
+    `has_transition` describe the rest of the rule for the empty string check.
+    """
+    if groups is not None:
+        groups = [g is None for g in groups]
+    data = json.dumps(
+        [
+            code_version(),
+            pattern,
+            flags,
+            groups,
+            bool(token_action),
+            bool(has_transition),
+            bool(ignore_w123),
+        ]
+    )
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def shadow_key(state, rules, flags):
+    """Returns the cache key for the shadowed rules of `state`.
+
+    `rules` is what util.effective_rules() returns for it; only where each
+    rule comes from and its pattern (None for a default()) matter.  The state
+    itself is part of the key because the findings are numbered by its own
+    rules, and a state that only include()s another has the same `rules`.
+    """
+    patterns = []
+    for origin, i, tdef in rules:
+        pat = None if hasattr(tdef, "state") else tdef[0]
+        if isinstance(pat, Future):
+            pat = pat.get()
+        patterns.append([origin, i, pat])
+    data = json.dumps([code_version(), "shadowed", state, flags, patterns])
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+class ResultCache(object):
+    """Finding lists stored in `directory`, keeping at most `max_entries` of
+    the most recently used ones (None means no limit).
+
+    Each process opens its own connection on first use, so an instance can be
+    created before forking workers.  Writes are buffered until flush().
+    """
+
+    def __init__(self, directory, max_entries=DEFAULT_SIZE):
+        self.path = os.path.join(directory, "results.sqlite")
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        # The process the connection and buffered writes belong to.
+        self._pid = os.getpid()
+        self._pending = {}
+        self._touched = set()
+
+    def _open(self):
+        dirname = os.path.dirname(self.path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        conn = sqlite3.connect(self.path, timeout=60)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results "
+            "(key TEXT PRIMARY KEY, findings TEXT NOT NULL, used REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS timings "
+            "(name TEXT PRIMARY KEY, seconds REAL NOT NULL)"
+        )
+        conn.commit()
+        return conn
+
+    def _connection(self):
+        if self._pid != os.getpid():
+            # Forked: the parent writes what it had buffered itself.
+            self._conn = None
+            self._pid = os.getpid()
+            self._pending = {}
+            self._touched = set()
+        if self._conn is None:
+            self._conn = self._open()
+        return self._conn
+
+    def get(self, key):
+        """Returns the list of (num, level, pos, text) findings stored for
+        `key`, or None."""
+        if key in self._pending:
+            findings = self._pending[key]
+        else:
+            row = (
+                self._connection()
+                .execute("SELECT findings FROM results WHERE key = ?", (key,))
+                .fetchone()
+            )
+            if row is None:
+                self.misses += 1
+                return None
+            findings = json.loads(row[0])
+            self._touched.add(key)
+        self.hits += 1
+        return [tuple(f) for f in findings]
+
+    def put(self, key, findings):
+        self._pending[key] = [list(f) for f in findings]
+
+    def flush(self):
+        if not self._pending and not self._touched:
+            return
+        conn = self._connection()
+        now = time.time()
+        with conn:
+            conn.executemany(
+                "UPDATE results SET used = ? WHERE key = ?",
+                [(now, k) for k in self._touched],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO results (key, findings, used) VALUES (?, ?, ?)",
+                [(k, json.dumps(v), now) for k, v in self._pending.items()],
+            )
+        self._pending = {}
+        self._touched = set()
+
+    def get_timings(self):
+        """Returns {name: seconds} as stored by put_timings().  This uses its
+        own connection, so it's safe to call before forking workers."""
+        conn = self._open()
+        try:
+            return dict(conn.execute("SELECT name, seconds FROM timings"))
+        finally:
+            conn.close()
+
+    def put_timings(self, timings):
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO timings (name, seconds) VALUES (?, ?)",
+                timings.items(),
+            )
+
+    def prune(self):
+        """Drops the least recently used entries beyond max_entries.  Ones
+        used in the same clock tick go in the order they were written."""
+        self.flush()
+        if self.max_entries is None:
+            return
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "DELETE FROM results WHERE key IN "
+                "(SELECT key FROM results ORDER BY used DESC, rowid DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def close(self):
+        self.prune()
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
@@ -12,9 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import heapq
+
 from regexlint.bitvector import bitvector, unpack_bitvector
+from regexlint.codeset import CodeSet, case_closure, case_variants, unicode_category
 from regexlint.parser import DIGITS, WHITESPACE, WORD, CharClass
-from regexlint.util import build_ranges, esc, lowercase_code
+from regexlint.util import LRUCache, build_ranges, esc, lowercase_code
 
 __all__ = ["simplify_charclass", "charclass_score", "build_output", "WontOptimize"]
 
@@ -32,43 +35,123 @@ HEX = bitvector(map(ord, "0123456789abcdef"))
 ALNUM = bitvector(range(ord("a"), ord("z") + 1)) | bitvector(map(ord, "0123456789"))
 ASCII = (1 << 256) - 1
 INSENSITIVE_ASCII = bitvector(map(lowercase_code, range(256)))
+UPPER = bitvector(range(ord("A"), ord("Z") + 1))
+
+HEX_CODES = CodeSet.from_codes(map(ord, "0123456789abcdef"))
+ALNUM_CODES = CodeSet.from_range(ord("a"), ord("z")) | CodeSet.from_range(
+    ord("0"), ord("9")
+)
+
+# The categories in the order simplify_unicode_charclass tries them.
+UNICODE_KEYS = sorted(CATS.keys(), reverse=True)
+
+# Unions of the Unicode versions of CATS, with and without case folding, built
+# on first use.
+_unicode_cats = {}
 
 
 class WontOptimize(Exception):
     pass
 
 
-def simplify_charclass(matching_codes, ignorecase=False):
+# simplify_charclass results, or WontOptimize arguments, by code set.
+SIMPLIFY_CACHE = LRUCache(maxsize=4096)
+
+
+def simplify_charclass(matching_codes, ignorecase=False, unicode=False, feasible=None):
     """Given a sequence of ordinals, return a (seq, negated) tuple.
 
-    `ignorecase` is whether the regex flags include re.IGNORECASE.
+    `ignorecase` is whether the regex flags include re.IGNORECASE, and
+    `unicode` whether they include re.UNICODE, in which case categories and
+    negation cover all of Unicode and `matching_codes` may be a CodeSet.
 
     If the class shouldn't be optimized, raises WontOptimize with a basic reason
     string.
+
+    Results (including WontOptimize) are cached in SIMPLIFY_CACHE, keyed by
+    the set of codes, since the same classes turn up in many lexers.
+
+    `feasible` is only for the 8-bit path: a pair of sequences saying, for
+    each entry of COMBINATIONS, whether it fits in the class and in its
+    negation, when the caller has already worked that out (see batch.py).
     """
-    if max(matching_codes) > 255:
-        raise WontOptimize("Unicode")
+    ignorecase = bool(ignorecase)
+    if unicode:
+        if not isinstance(matching_codes, CodeSet):
+            matching_codes = CodeSet.from_codes(matching_codes)
+        key = (True, matching_codes, ignorecase)
+    else:
+        if max(matching_codes) > 255:
+            raise WontOptimize("Unicode")
+        key = (False, bitvector(matching_codes), ignorecase)
+
+    result = SIMPLIFY_CACHE.get(key)
+    if result is None:
+        try:
+            if unicode:
+                result = simplify_unicode_charclass(matching_codes, ignorecase)
+            else:
+                result = _simplify_bitvector(key[1], ignorecase, feasible)
+        except WontOptimize as e:
+            result = e.args
+        SIMPLIFY_CACHE.put(key, result)
+
+    if len(result) != 2:
+        raise WontOptimize(*result)
+    # The list is the caller's to change.
+    return (list(result[0]), result[1])
+
+
+def _lowercase_bits(bv):
+    return (bv & ~UPPER) | ((bv & UPPER) << 32)
 
+
+def _combinations():
+    """Returns (chosen_keys, masks, has_negated_category, score, discount) for
+    every combination of CATS, where masks[ignorecase] is their union limited
+    to the matching base, and score is what the keys cost to write."""
+    keys = sorted(CATS.keys(), reverse=True)
+    combinations = []
+    for i in range(2 ** len(keys)):
+        chosen_keys = [keys[b] for b in range(len(keys)) if i & 1 << b]
+        chosen = 0
+        for k in chosen_keys:
+            chosen |= CATS[k]
+        combinations.append(
+            (
+                chosen_keys,
+                # N.b. don't need to conditionally lowercase_code here because
+                # all our categories contain lower if they contain upper.
+                (chosen & ASCII, chosen & INSENSITIVE_ASCII),
+                any(k[1].isupper() for k in chosen_keys),
+                len("".join(chosen_keys)),
+                1 if chosen_keys == ["\\w", "\\W"] else 0,
+            )
+        )
+    return combinations
+
+
+COMBINATIONS = _combinations()
+
+
+def _simplify_bitvector(bv, ignorecase, feasible=None):
     # HACK: Don't simplify something that looks fairly like a hex digit pattern.
     # They look arguably prettier as '0-9a-f' than '\da-f'
-    bv = bitvector(matching_codes)
-    if (bv & HEX) == HEX and ord("g") not in matching_codes:
+    if (bv & HEX) == HEX and not bv & (1 << ord("g")):
         raise WontOptimize("Hex digit")
-    if (bv & ALNUM) == ALNUM and ord("_") not in matching_codes:
+    if (bv & ALNUM) == ALNUM and not bv & (1 << ord("_")):
         raise WontOptimize("Alphanumeric without _")
 
     if ignorecase:
-        bv = bitvector(map(lowercase_code, matching_codes))
+        bv = _lowercase_bits(bv)
         base = INSENSITIVE_ASCII
     else:
         base = ASCII
 
-    # Tries all possibilities of categories first.
-    keys = sorted(CATS.keys(), reverse=True)
     # Strategy: since we have a small number of categories, try each of them to
     # see if it's legal; add in remaining ranges; score.
-    # when negated=0, there are 64 (=2**6) combinations to check.
-    # when negated=1, there are only 8 (=2**3) combinations.
+    # when negated=0, there are 32 (=2**5) combinations to check.
+    # when negated=1, there are only 4 (=2**2) combinations.
     possibilities = []
     for negated in (0, 1):
         #  target is the set of all characters we want to match, and none of the
@@ -76,56 +159,167 @@ def simplify_charclass(matching_codes, ignorecase=False):
         #  comparing later).
         if negated:
             if ignorecase:
-                target = bitvector(
-                    map(
-                        lowercase_code,
-                        [i for i in range(256) if i not in unpack_bitvector(bv)],
-                    )
-                )
+                target = _lowercase_bits(ASCII & ~bv)
             else:
                 target = base ^ (base & bv)
         else:
             target = bv
 
-        for i in range(2 ** len(keys)):
-            chosen_keys = [keys[b] for b in range(len(keys)) if i & 1 << b]
+        for j, combination in enumerate(COMBINATIONS):
+            chosen_keys, masks, has_negated, keys_score, discount = combination
             # Humans are terrible at double-negatives.  If this involves a
             # negation of the charclass as well as the category, tough cookies.
             # This will cause suggested _expansion_ of any such uses already in
             # the codebase, which should be ignored by the caller.
-            if negated:
-                if any(k[1].isupper() for k in chosen_keys):
-                    continue
-
-            t = target
-            chosen = 0
-            for k in chosen_keys:
-                chosen |= CATS[k]
-            # N.b. don't need to conditionally lowercase_code here because all
-            # our categories contain lower if they contain upper.
-            chosen &= base
+            if negated and has_negated:
+                continue
 
+            chosen = masks[ignorecase]
             # True iff. the chosen categories fit entirely in the target.
-            if chosen & t == chosen:
-                # print chosen_keys, "t", unpack_bitvector(t), unpack_bitvector(chosen)
-                t ^= chosen
-                # print "  ", unpack_bitvector(t)
-                r = build_ranges(unpack_bitvector(t))
-                r[:0] = chosen_keys
-                discount = 1 if chosen_keys == ["\\w", "\\W"] else 0
-
-                if r:
+            if feasible is not None:
+                fits = feasible[negated][j]
+            else:
+                fits = chosen & target == chosen
+            if fits:
+                ranges = build_ranges(unpack_bitvector(target ^ chosen))
+                if chosen_keys or ranges:
+                    # Same as charclass_score(chosen_keys + ranges, negated).
+                    score = keys_score + len(build_output(ranges)) + negated
                     possibilities.append(
-                        (charclass_score(r, negated) - discount, r, negated)
+                        (score - discount, chosen_keys + ranges, negated)
                     )
 
-    # print "possibilities", possibilities
     # There will always be one, since we include no-categories above, and it's
     # not on the WontOptimize list.
     possibilities.sort(key=lambda i: i[0])
     return (possibilities[0][1], possibilities[0][2])
 
 
+def unicode_cats(*keys, **kwargs):
+    """Returns the union of the Unicode categories `keys`, closed under case
+    folding if `ignorecase` is passed and true."""
+    ignorecase = bool(kwargs.get("ignorecase"))
+    try:
+        return _unicode_cats[keys, ignorecase]
+    except KeyError:
+        pass
+    codes = CodeSet(r for k in keys for r in unicode_category(k).ranges)
+    if ignorecase:
+        codes = case_closure(codes)
+    _unicode_cats[keys, ignorecase] = codes
+    return codes
+
+
+def simplify_unicode_charclass(codes, ignorecase=False):
+    """The Unicode version of simplify_charclass, working on CodeSets.
+
+    With `ignorecase`, only one case form of each character is kept (the
+    lowercase one, where there is one).
+    """
+    if not isinstance(codes, CodeSet):
+        codes = CodeSet.from_codes(codes)
+    if not codes:
+        raise WontOptimize("Empty")
+
+    if HEX_CODES <= codes and ord("g") not in codes:
+        raise WontOptimize("Hex digit")
+    if ALNUM_CODES <= codes and ord("_") not in codes:
+        raise WontOptimize("Alphanumeric without _")
+
+    if ignorecase:
+        codes = case_closure(codes)
+        noncanonical = case_variants()[2]
+    else:
+        noncanonical = CodeSet()
+    targets = (codes, codes.complement())
+
+    def fits(negated, key):
+        return unicode_cats(key, ignorecase=ignorecase) <= targets[negated]
+
+    def rest_of(chosen_keys, negated):
+        rest = targets[negated] - unicode_cats(*chosen_keys, ignorecase=ignorecase)
+        rest -= noncanonical
+        return rest, len(rest.ranges)
+
+    def items_of(chosen_keys, negated, rest):
+        items = chosen_keys + build_code_ranges(rest)
+        return items, len(build_output(items))
+
+    return choose_unicode_items(fits, rest_of, items_of)
+
+
+def choose_unicode_items(fits, rest_of, items_of):
+    """Returns the (items, negated) that simplify_unicode_charclass suggests
+    for some class, or None.  This is the search and the scoring, the class
+    comes in through three functions (batch.py has its own):
+
+    fits(negated, key) is whether the category `key` fits entirely in the
+    class, or in its complement if `negated`.
+
+    rest_of(chosen_keys, negated) returns what's left to write once those
+    categories are taken out, and at least how many items that takes.
+
+    items_of(chosen_keys, negated, rest) returns the items for that and the
+    length of their build_output().
+    """
+    # Candidates are scored most promising first, and only until nothing left
+    # can beat the best (or tie with it from earlier in this order).  Their
+    # bounds start as what the categories cost to write, and get refined by
+    # the number of items left once the categories are taken out.
+    heap = []
+    for negated in (0, 1):
+        # Only categories that fit entirely in the target can be used, which
+        # usually leaves very few combinations to try.
+        keys = [
+            k
+            for k in UNICODE_KEYS
+            if not (negated and k[1].isupper()) and fits(negated, k)
+        ]
+        for i in range(2 ** len(keys)):
+            chosen_keys = [keys[b] for b in range(len(keys)) if i & 1 << b]
+            discount = 1 if chosen_keys == ["\\w", "\\W"] else 0
+            least = 2 * len(chosen_keys) + negated - discount
+            heap.append((least, len(heap), chosen_keys, negated, None))
+    heapq.heapify(heap)
+
+    best = None
+    while heap:
+        least, n, chosen_keys, negated, rest = heapq.heappop(heap)
+        if best is not None and (least, n) > best[:2]:
+            break
+        if rest is None:
+            rest, count = rest_of(chosen_keys, negated)
+            # Every item left takes at least a char to write.
+            heapq.heappush(heap, (least + count, n, chosen_keys, negated, rest))
+            continue
+
+        items, length = items_of(chosen_keys, negated, rest)
+        if not items:
+            continue
+        # Same as charclass_score(items, negated), less the discount.
+        discount = 1 if chosen_keys == ["\\w", "\\W"] else 0
+        score = length + negated - discount
+        if best is None or (score, n) < best[:2]:
+            best = (score, n, items, negated)
+
+    return (best[2], best[3]) if best is not None else None
+
+
+def build_code_ranges(codes):
+    """Like util.build_ranges, but for a CodeSet.  Past ASCII, any run of
+    consecutive codes becomes a range."""
+    ranges = []
+    for lo, hi in codes.ranges:
+        if lo < 128:
+            ranges.extend(build_ranges(range(lo, min(hi, 127) + 1)))
+            lo = 128
+        if lo == hi:
+            ranges.append(lo)
+        elif lo < hi:
+            ranges.append((lo, hi))
+    return ranges
+
+
 def charclass_score(items, negated=False):
     r"""Returns a number representing complexity of this charclass.
 
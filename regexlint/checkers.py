@@ -12,23 +12,32 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 import logging
+import math
 import re
+import subprocess
 import sys
 
 from pygments.token import Other, Token
+from pygments.util import Future
 
+from regexlint.analysis import SEQUENCES, Analysis
+from regexlint.automaton import TooBig, Unsupported, build, covers
 from regexlint.charclass import (
     WontOptimize,
     build_output,
     charclass_score,
     simplify_charclass,
 )
-from regexlint.parser import CharRange, Regex
+from regexlint.codeset import CodeSet
+from regexlint.parser import CharRange, Regex, RootNode
 from regexlint.util import (
     Break,
+    LRUCache,
     between,
     charclass,
+    effective_rules,
     esc,
     eval_char,
     find_all_by_type,
@@ -37,6 +46,22 @@ from regexlint.util import (
     width,
 )
 
+ANCHORS = (Other.Anchor.Beginning, Other.Anchor.End)
+
+# Characters that have to be escaped to match themselves outside a class.
+SPECIAL_OUTSIDE_CLASS = ".^$*+?{}[]|()"
+
+
+def visited(reg, t):
+    """Returns the list of nodes of type `t` in `reg`, in document order.
+
+    For a RootNode this is answered from its type index, so checkers that
+    find nothing cost a dict lookup instead of a walk of the tree.
+    """
+    if isinstance(reg, RootNode):
+        return reg.find_by_type(t)
+    return list(find_all_by_type(reg, t))
+
 
 def check_no_nulls(reg, errs):
     num = "101"
@@ -75,7 +100,7 @@ def check_no_empty_alternations(reg, errs):
     num = "103"
     level = logging.ERROR
     msg = "Empty string allowed in alternation starting at position %d, use ?"
-    for n in find_all_by_type(reg, Other.Progression):
+    for n in visited(reg, Other.Progression):
         if not n.children and n.parent() and n.parent().type is Other.Alternation:
             errs.append((num, level, n.start or 0, msg % (n.start or 0)))
 
@@ -85,7 +110,7 @@ def check_charclass_homogeneous_ranges(reg, errs):
     level = logging.ERROR
     msg = "Range in character class is not homogeneous near position %d"
     msg2 = "Range in character class goes backwards near position %d"
-    for c in find_all_by_type(reg, Other.CharClass):
+    for c in visited(reg, Other.CharClass):
         for p in c.chars:
             if isinstance(p, CharRange):
                 if p.a.type is Other.Literal.Hex and p.b.type is Other.Literal.Hex:
@@ -120,7 +145,7 @@ def check_prefix_ordering(reg, errs):
     num = "105"
     level = logging.ERROR
     msg = "Potential out of order alternation between %r and %r"
-    for n in find_all_by_type(reg, Other.Alternation):
+    for n in visited(reg, Other.Alternation):
         run_checks = True
         for i in between(n, None):
             # TODO this heuristic is easy to game
@@ -156,7 +181,7 @@ def bygroups_check_no_python_named_capture_groups(reg, errs, desired_groups):
     level = logging.ERROR
     msg = "Python named capture group used with bygroups()"
 
-    for n in find_all_by_type(reg, Other.Open.NamedCapturing):
+    for n in visited(reg, Other.Open.NamedCapturing):
         errs.append((num, level, n.start, msg))
         break
 
@@ -165,7 +190,7 @@ def bygroups_check_toknum(reg, errs, desired_groups):
     num = "107"
     level = logging.ERROR
     msg = "Wrong number of groups(%d) for bygroups(%d)"
-    n = len(list(find_all_by_type(reg, Other.Open.Capturing)))
+    n = len(visited(reg, Other.Open.Capturing))
     desired_number = len(desired_groups)
     if n < desired_number:
         errs.append((num, level, 0, msg % (n, desired_number)))
@@ -182,7 +207,7 @@ def bygroups_check_overlap(reg, errs, desired_groups):
     level = logging.ERROR
     msg = "Nested capture group other than the final one using bygroups"
     msg2 = "Gap in capture groups using bygroups"
-    n = list(find_all_by_type(reg, Other.Open.Capturing))
+    n = visited(reg, Other.Open.Capturing)
     if not n:
         # bygroups_check_toknum should already complain about this case.
         return
@@ -235,7 +260,7 @@ def bygroups_check_no_capture_group_in_repetition(reg, errs, desired_groups):
     level = logging.ERROR
     msg = "Capture group should not be within a repetition when using bygroups"
     desired_number = len(desired_groups)
-    for idx, capture in enumerate(find_all_by_type(reg, Other.Open.Capturing)):
+    for idx, capture in enumerate(visited(reg, Other.Open.Capturing)):
         parent = capture.parent()
         while parent:
             # Question works in Pygments at the moment, but is subject to change.
@@ -256,7 +281,7 @@ def check_no_consecutive_dots(reg, errs):
     num = "111"
     level = logging.WARNING
     msg = "Consecutive dots, use .{2} if this is intentional"
-    for x in find_all_by_type(reg, Other.Dot):
+    for x in visited(reg, Other.Dot):
         n = x.next_no_children()
         if n and n.type is Other.Dot:
             errs.append((num, level, x.start, msg))
@@ -268,7 +293,7 @@ def check_bad_flags(reg, errs):
     level = logging.WARNING
     msg = "Manually set flag %r, but do not need it"
 
-    directives = list(find_all_by_type(reg, Other.Directive))
+    directives = visited(reg, Other.Directive)
     # TODO flag the correct directive
     flags = "".join(d.data for d in directives)
     if not flags:
@@ -287,7 +312,7 @@ def check_bad_flags(reg, errs):
     if "i" in flags:
         # See if there are a-zA-Z
         try:
-            for char in find_all_by_type(reg, Other.Literal):
+            for char in visited(reg, Other.Literal):
                 if "a" <= char.data <= "z" or "A" <= char.data <= "Z":
                     raise Break()
 
@@ -296,7 +321,7 @@ def check_bad_flags(reg, errs):
             import string
 
             alpha = set(map(ord, string.ascii_letters))
-            for cc in find_all_by_type(reg, Other.CharClass):
+            for cc in visited(reg, Other.CharClass):
                 for char in cc.chars:
                     if isinstance(char, CharRange):
                         this_range = set(range(char.codepoint_a, char.codepoint_b))
@@ -309,15 +334,13 @@ def check_bad_flags(reg, errs):
 
     if "s" in flags:
         # See if there are any dots.
-        dots = list(find_all_by_type(reg, Other.Dot))
+        dots = visited(reg, Other.Dot)
         if not dots:
             errs.append((num, level, directives[0].start, msg % "s"))
 
     if "m" in flags:
         # Only ^$ differ in this mode.
-        anchors = list(
-            find_all_by_type(reg, (Other.Anchor.Beginning, Other.Anchor.End))
-        )
+        anchors = visited(reg, ANCHORS)
         if not anchors:
             errs.append((num, level, directives[0].start, msg % "m"))
 
@@ -327,7 +350,7 @@ def check_suspicious_anchors(reg, errs):
     level = logging.WARNING
     msg = "Suspicious use of anchors in alternation"
 
-    for rep in find_all_by_type(reg, Other.Alternation):
+    for rep in visited(reg, Other.Alternation):
         first = rep
         while first.children:
             first = first.children[0]
@@ -345,7 +368,7 @@ def check_single_character_classes(reg, errs):
     level = logging.INFO  # harmless, for now
     msg = "Only a single character in character class"
 
-    for cc in find_all_by_type(reg, Other.CharClass):
+    for cc in visited(reg, Other.CharClass):
         if (
             len(cc.chars) == 1
             and not cc.negated
@@ -363,14 +386,10 @@ def check_charclass_overlap(reg, errs):
     level = logging.WARNING
     msg = "Overlap in character class: %r"
 
-    for cc in find_all_by_type(reg, Other.CharClass):
-        if len(set(cc.matching_character_codes)) != len(cc.matching_character_codes):
-            counts = {}
-            for i in cc.matching_character_codes:
-                counts.setdefault(i, 0)
-                counts[i] += 1
-            dupes = [chr(k) for k, v in counts.items() if v > 1]
-            errs.append((num, level, cc.start, msg % (dupes,)))
+    for cc in visited(reg, Other.CharClass):
+        dupes = cc.duplicate_codes()
+        if dupes:
+            errs.append((num, level, cc.start, msg % ([chr(k) for k in dupes],)))
 
 
 def check_charclass_case_insensitive_overlap(reg, errs):
@@ -388,7 +407,7 @@ def check_charclass_case_insensitive_overlap(reg, errs):
 
     # TODO: This only finds the most obvious ones, like
     # (?i)[0-9a-fA-F], and doesn't do anything about non-ranges.
-    for cc in find_all_by_type(reg, Other.CharClass):
+    for cc in visited(reg, Other.CharClass):
         ranges = set()
         for c in cc.chars:
             if isinstance(c, CharRange):
@@ -407,8 +426,8 @@ def check_charclass_len(reg, errs):
     level = logging.WARNING
     msg = "Superfluous character class when only one char"
 
-    for cc in find_all_by_type(reg, Other.CharClass):
-        if not cc.negated and len(cc.matching_character_codes) == 1:
+    for cc in visited(reg, Other.CharClass):
+        if not cc.negated and cc.code_count() == 1:
             # Some people use [*] instead of \* -- allow this for now as an INFO
             if (
                 cc.matching_character_codes[0] in COMMON_SINGLE_CHAR_CODES
@@ -426,7 +445,7 @@ def check_charclass_negation(reg, errs):
     level = logging.WARNING
     msg = "Instead of negating character class, flip case of builtin class"
 
-    for cc in find_all_by_type(reg, Other.CharClass):
+    for cc in visited(reg, Other.CharClass):
         if (
             cc.negated
             and len(cc.children) == 2
@@ -443,7 +462,7 @@ def check_multiline_anchors(reg, errs):
     if reg.effective_flags & re.M:
         return
 
-    for anchor in find_all_by_type(reg, (Other.Anchor.Beginning, Other.Anchor.End)):
+    for anchor in visited(reg, ANCHORS):
         errs.append((num, level, anchor.start, msg))
 
 
@@ -452,22 +471,32 @@ def check_charclass_simplify(reg, errs):
     level = logging.WARNING
     msg = "Regex can be written more simply: %s -> %s"
 
-    if any(ord(c) > 255 for c in reg.raw) or reg.effective_flags & re.UNICODE:
-        # Many of the operations performed here assume 8-bit ascii.
+    unicode = bool(reg.effective_flags & re.UNICODE)
+    if not unicode and any(ord(c) > 255 for c in reg.raw):
+        # Without re.UNICODE, the operations performed here assume 8-bit ascii.
         return
 
-    for c in find_all_by_type(reg, Other.CharClass):
+    ignorecase = reg.effective_flags & re.I
+    for c in visited(reg, Other.CharClass):
         existing_score = charclass_score(c)
         try:
-            new_codes, negated = simplify_charclass(
-                c.matching_character_codes, reg.effective_flags & re.I
-            )
+            if unicode:
+                new_codes, negated = simplify_charclass(
+                    c.unicode_code_set(ignorecase), ignorecase, unicode=True
+                )
+            else:
+                new_codes, negated = simplify_charclass(
+                    c.matching_character_codes, ignorecase
+                )
         except WontOptimize:
             continue
         new_score = charclass_score(new_codes, negated)
         if new_score < existing_score:
             if len(new_codes) == 1 and not negated and isinstance(new_codes[0], int):
-                new_class = esc(chr(new_codes[0]))
+                special = SPECIAL_OUTSIDE_CLASS
+                if reg.effective_flags & re.VERBOSE:
+                    special += "# "
+                new_class = esc(chr(new_codes[0]), special)
             elif len(new_codes) == 1 and not negated and isinstance(new_codes[0], str):
                 new_class = new_codes[0]
             else:
@@ -481,7 +510,7 @@ def check_unescaped_braces(reg, errs):
     level = logging.ERROR
     msg = "Curly braces should be escaped if not repeat spec (regex compat)"
 
-    for brace in find_all_by_type(reg, Other.UnescapedCurly):
+    for brace in visited(reg, Other.UnescapedCurly):
         errs.append((num, level, brace.start, msg))
 
 
@@ -490,7 +519,7 @@ def check_redundant_repetition(reg, errs):
     level = logging.WARNING
     msg = "Redundant repetition spec: %s"
 
-    for repeat in find_all_by_type(reg, Other.Repetition.Curly):
+    for repeat in visited(reg, Other.Repetition.Curly):
         if repeat.min == 1 and repeat.max == 1:
             errs.append(
                 (num, level, repeat.start, (msg % repeat.end_data) + " can be omitted")
@@ -507,6 +536,61 @@ def check_redundant_repetition(reg, errs):
             errs.append((num, level, repeat.start, "should be +"))
 
 
+def unbounded_repetitions(reg):
+    return [r for r in visited(reg, Other.Repetition) if r.max is None]
+
+
+def check_exponential_backtracking(reg, errs):
+    num = "126"
+    level = logging.WARNING
+    msg = (
+        "Exponential backtracking possible: iterations of %s can match the same "
+        "text in many ways"
+    )
+
+    repetitions = unbounded_repetitions(reg)
+    if not repetitions:
+        return
+    analysis = Analysis.of(reg)
+    reported = []
+    for rep in repetitions:
+        if any(rep.is_descentant_of(r) for r in reported):
+            continue
+        if analysis.ambiguous_iteration(rep) and analysis.can_fail_after(rep):
+            reported.append(rep)
+            errs.append((num, level, rep.start, msg % reg.raw[rep.start : rep.end]))
+
+
+def check_polynomial_backtracking(reg, errs):
+    num = "127"
+    level = logging.WARNING
+    msg = "Polynomial backtracking possible, O(n^%d): %s can split text many ways"
+
+    repetitions = unbounded_repetitions(reg)
+    if len(repetitions) < 2:
+        return
+    # A chain needs two unbounded repetitions in the same sequence.
+    parents = [id(r.parent()) for r in repetitions]
+    sequences = [s for s in visited(reg, SEQUENCES) if parents.count(id(s)) > 1]
+    if not sequences:
+        return
+    analysis = Analysis.of(reg)
+    exponential = None
+    for seq in sequences:
+        for chain in analysis.adjacent_chains(seq):
+            if not analysis.can_fail_after(chain[-1]):
+                continue
+            if exponential is None:
+                exponential = [
+                    r for r in repetitions if analysis.ambiguous_iteration(r)
+                ]
+            # Inside a repetition that check 126 finds, this would just repeat it.
+            if any(seq.is_descentant_of(r) for r in exponential):
+                break
+            span = reg.raw[chain[0].start : chain[-1].end]
+            errs.append((num, level, chain[0].start, msg % (len(chain), span)))
+
+
 def manual_check_for_empty_string_match(reg, errs, raw_pat):
     # Skip the check in the following conditions:
     # * Rules that use a callback, since they're used for indentation
@@ -525,37 +609,279 @@ def manual_check_for_empty_string_match(reg, errs, raw_pat):
     # remove_error(errs, '103')
 
 
-def run_all_checkers(regex, expected_groups=None):
+# Run by time_attack() in a subprocess.  Reads a JSON request on stdin, and
+# prints "length seconds" as each longer attack string is timed.
+_TIMING_SCRIPT = """
+import json, re, sys, time
+req = json.load(sys.stdin)
+regex = re.compile(req["pattern"], req["flags"])
+n = 1
+while n <= req["max_pumps"]:
+    text = req["prefix"] + req["pump"] * n + req["suffix"]
+    t = time.perf_counter()
+    regex.match(text)
+    t = time.perf_counter() - t
+    print(len(text), t, flush=True)
+    if t > req["limit"]:
+        break
+    n = n * 2 if t < 0.001 else n + max(1, n // 4)
+"""
+
+
+def time_attack(reg, prefix, pump, suffix, timeout, max_pumps=100000):
+    """Times re.match of `reg` on prefix + pump * n + suffix for growing n,
+    in a subprocess that's killed after `timeout` seconds.  Returns a list of
+    (length, seconds), whether it timed out, and why the subprocess failed
+    (like "MemoryError") or None."""
+    request = {
+        "pattern": reg.raw,
+        "flags": reg.effective_flags,
+        "prefix": prefix,
+        "pump": pump,
+        "suffix": suffix,
+        "max_pumps": max_pumps,
+        "limit": timeout / 4,
+    }
+    failure = None
+    try:
+        proc = subprocess.run(
+            [sys.executable, "-c", _TIMING_SCRIPT],
+            input=json.dumps(request).encode("utf-8"),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=timeout,
+        )
+        output = proc.stdout
+        timed_out = False
+        if proc.returncode:
+            # The last line of a traceback names the exception.
+            lines = proc.stderr.decode("utf-8", "replace").strip().splitlines()
+            failure = lines[-1] if lines else "exit status %d" % proc.returncode
+    except subprocess.TimeoutExpired as e:
+        output = e.stdout or b""
+        timed_out = True
+    curve = []
+    for line in output.decode("utf-8").splitlines():
+        length, seconds = line.split()
+        curve.append((int(length), float(seconds)))
+    return curve, timed_out, failure
+
+
+def growth_exponent(curve):
+    """Returns k where the last two measurements in `curve` long enough to
+    time grow like length ** k, or None."""
+    timed = [(n, t) for n, t in curve if t >= 0.0001]
+    if len(timed) < 2 or timed[-1][0] == timed[-2][0]:
+        return None
+    (n1, t1), (n2, t2) = timed[-2:]
+    return math.log(t2 / t1) / math.log(n2 / n1)
+
+
+def manual_check_for_backtracking(reg, errs, timeout=5.0):
+    """Confirms the findings of checks 126 and 127 in `errs` by timing
+    attack strings made up from the tree."""
+    num = "128"
+    suspects = [e for e in errs if e[0] in ("126", "127")]
+    if not suspects:
+        return
+    analysis = Analysis.of(reg)
+    for code, _, pos, _ in suspects:
+        if code == "126":
+            nodes = [r for r in unbounded_repetitions(reg) if r.start == pos][:1]
+        else:
+            nodes = next(
+                (
+                    chain
+                    for seq in visited(reg, SEQUENCES)
+                    for chain in analysis.adjacent_chains(seq)
+                    if chain[0].start == pos
+                ),
+                [],
+            )
+        attack = analysis.attack(nodes) if nodes else None
+        if attack is None:
+            errs.append((num, logging.INFO, pos, "Couldn't make up an attack string"))
+            continue
+
+        curve, timed_out, failure = time_attack(reg, *attack, timeout=timeout)
+        if failure is not None:
+            msg = "Couldn't time the attack string: %s" % failure
+            errs.append((num, logging.INFO, pos, msg))
+            continue
+        # The longest few are enough to see the growth.
+        times = ", ".join("%d chars %.2gs" % point for point in curve[-4:])
+        exponent = growth_exponent(curve)
+        if timed_out:
+            times += ", timed out after %gs" % timeout
+        elif exponent is not None:
+            times += " (grows like n^%.1f)" % exponent
+        if timed_out or (exponent is not None and exponent > 1.5):
+            errs.append(
+                (num, logging.WARNING, pos, "Slow match confirmed: " + times)
+            )
+        else:
+            errs.append((num, logging.INFO, pos, "Match stayed fast: " + times))
+
+
+class _RuleLanguage(object):
+    """What the shadowing check knows about the strings one rule matches.
+    The automata are only built when a rule gets past the cheaper tests."""
+
+    def __init__(self, pat, flags):
+        if isinstance(pat, Future):
+            pat = pat.get()
+        self.reg = Regex.get_parse_tree(pat, flags)
+        analysis = Analysis.of(self.reg)
+        self.first = analysis.first(self.reg)
+        self.nullable = analysis.nullable(self.reg)
+        self._exact = self._over = False
+        self._too_big = False
+
+    def exact(self):
+        """Returns an NFA with the same language, or None."""
+        if self._exact is False:
+            try:
+                self._exact = build(self.reg)
+            except Unsupported:
+                self._exact = None
+            except TooBig:
+                self._exact = None
+                self._too_big = True
+        return self._exact
+
+    def over(self):
+        """Returns an NFA whose language includes this one, or None."""
+        if self._over is False:
+            # An exact one is its own over-approximation, and approximating
+            # doesn't make one any smaller.
+            self._over = self.exact()
+            if self._over is None and not self._too_big:
+                try:
+                    self._over = build(self.reg, exact=False)
+                except TooBig:
+                    pass
+        return self._over
+
+
+# _RuleLanguage keyed by (pattern, flags), since included states have their
+# rules checked again in every state that includes them.  A words() is kept
+# as is in the key, so it's only turned into a pattern once.
+RULE_LANGUAGES = LRUCache(maxsize=4096)
+
+
+def _rule_language(tdef, flags):
+    # default() matches the empty string.
+    pat = "" if hasattr(tdef, "state") else tdef[0]
+    key = (pat, flags)
+    language = RULE_LANGUAGES.get(key)
+    if language is None:
+        language = _RuleLanguage(pat, flags)
+        RULE_LANGUAGES.put(key, language)
+    return language
+
+
+def _shadowing(earlier, language):
+    # Returns the (name, language) entries of `earlier` that together match
+    # first wherever `language` could, preferring just one, or [].
+    codes = language.first
+    if language.nullable:
+        return []
+    # Only earlier rules that can start the same way can cover it.
+    by = [e for e in earlier if e[1].first.overlaps(codes)]
+    union = CodeSet(r for e in by for r in e[1].first.ranges)
+    if not codes <= union:
+        return []
+    over = language.over()
+    by = [e for e in by if e[1].exact() is not None]
+    if over is None or not by:
+        return []
+    for e in by:
+        if codes <= e[1].first and covers([e[1].exact()], over):
+            return [e]
+    if len(by) > 1 and covers([e[1].exact() for e in by], over):
+        return by
+    return []
+
+
+def manual_check_for_shadowed_rules(tokendefs, state, flags):
+    """Returns (index, err) for the rules of `state` that can never match,
+    because an earlier rule in the state (or in a state it includes) matches
+    first wherever they could.
+
+    Earlier rules with anchors, lookarounds or backreferences aren't counted,
+    and the later rule's language is over-approximated, so what's reported is
+    certain."""
+    num = "129"
+    level = logging.WARNING
+
+    found = []
+    # (name, _RuleLanguage) of the earlier rules
+    earlier = []
+    # The first earlier rule that matches the empty string, so everywhere.
+    always = None
+    for rule_state, i, tdef in effective_rules(tokendefs, state):
+        name = "pat#%d" % (i + 1)
+        if rule_state != state:
+            name = "%s:%s" % (rule_state, name)
+        try:
+            language = _rule_language(tdef, flags)
+        except Exception:
+            # Unparseable patterns are reported elsewhere.
+            continue
+
+        if rule_state == state:
+            by = [always] if always else _shadowing(earlier, language)
+            if by:
+                names = ", ".join(e[0] for e in by)
+                msg = "Never matches: shadowed by %s" % names
+                found.append((i, (num, level, 0, msg)))
+
+        if always is None and language.nullable:
+            if language.exact() is not None:
+                always = (name, language)
+        earlier.append((name, language))
+    return found
+
+
+def run_checker(f, regex, errs, *args):
+    """Calls the checker `f`, reporting an exception it raises as a
+    finding."""
+    try:
+        f(regex, errs, *args)
+    except Exception as e:
+        errs.append(
+            (
+                "999",
+                logging.ERROR,
+                0,
+                "Checker %s encountered error parsing: %s" % (f, repr(e)),
+            )
+        )
+
+
+def run_all_checkers(regex, expected_groups=None, skip=()):
+    """Runs every checker (but the ones in `skip`) against `regex`.  They
+    look up the nodes they care about with visited(), which is answered from
+    the root's type index, so the tree isn't walked once per checker."""
     errs = []
-    for k, f in globals().items():
+    for k, f in CHECKERS:
+        if f in skip:
+            continue
         if k.startswith("check_"):
-            # print 'running', k, regex
-            try:
-                f(regex, errs)
-            except Exception as e:
-                errs.append(
-                    (
-                        "999",
-                        logging.ERROR,
-                        0,
-                        "Checker %s encountered error parsing: %s" % (f, repr(e)),
-                    )
-                )
-        elif k.startswith("bygroups_check_") and expected_groups:
-            try:
-                f(regex, errs, expected_groups)
-            except Exception as e:
-                errs.append(
-                    (
-                        "999",
-                        logging.ERROR,
-                        0,
-                        "Checker %s encountered error parsing: %s" % (f, repr(e)),
-                    )
-                )
+            run_checker(f, regex, errs)
+        elif expected_groups:
+            run_checker(f, regex, errs, expected_groups)
     return errs
 
 
+# (name, func) of the checkers, in the order they're defined.
+CHECKERS = [
+    (k, f)
+    for k, f in list(globals().items())
+    if k.startswith(("check_", "bygroups_check_"))
+]
+
+
 def main(args):
     if not args:
         regex = r"(foo|) [a-Mq-&]"
@@ -15,23 +15,51 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import itertools
+import json
 import logging
 import multiprocessing
+import os
 import sys
-from io import StringIO
+import threading
+import time
 from os import path
 
 from pygments.lexer import RegexLexer, bygroups, words
 from pygments.token import Token
 from pygments.util import Future
 
+import regexlint.batch
 import regexlint.checkers
 from regexlint import Regex, run_all_checkers
-from regexlint.checkers import manual_check_for_empty_string_match
-from regexlint.indicator import find_offending_line, mark, mark_str
+from regexlint.cache import DEFAULT_SIZE, ResultCache, result_key, shadow_key
+from regexlint.checkers import (
+    manual_check_for_backtracking,
+    manual_check_for_empty_string_match,
+    manual_check_for_shadowed_rules,
+)
+from regexlint.dispatch import (
+    DispatchBench,
+    write_dispatch_bench,
+    write_dispatch_table,
+)
+from regexlint.findings import WRITERS, Finding
+from regexlint.indicator import find_offending_line
+from regexlint.parser import PARSE_CACHE
+from regexlint.runtime import (
+    LexerBench,
+    LexerRun,
+    read_corpus,
+    write_bench,
+    write_coverage,
+    write_profile,
+)
+from regexlint.schedule import plan_jobs, timing_key
+from regexlint.util import all_tokendefs, effective_rules, lexer_tokens
 
 ONLY_FUNC = None
+RESULT_CACHE = None
+BATCH = False
+CONFIRM_TIMEOUT = None
 
 
 def import_mod(m):
@@ -39,9 +67,90 @@ def import_mod(m):
     return sys.modules[m]
 
 
+def configure(
+    only_func=None,
+    batch=False,
+    confirm_timeout=None,
+    parse_cache_size=PARSE_CACHE.maxsize,
+    cache_dir=None,
+    cache_size=DEFAULT_SIZE,
+):
+    """Sets the options the checking functions read, in this process.  It's
+    also run in each worker."""
+    global ONLY_FUNC, BATCH, CONFIRM_TIMEOUT, RESULT_CACHE
+    ONLY_FUNC = only_func
+    BATCH = batch
+    CONFIRM_TIMEOUT = confirm_timeout
+    PARSE_CACHE.resize(parse_cache_size)
+    RESULT_CACHE = ResultCache(cache_dir, cache_size) if cache_dir else None
+
+
+def adaptive_chunksize(num_items, processes):
+    """Picks a chunksize that gives each process several chunks to work on
+    (so a slow chunk doesn't leave the others idle at the end) without making
+    a round-trip per item when there are many."""
+    return max(1, min(16, num_items // (processes * 8)))
+
+
+def _call_indexed(task):
+    func, i, item = task
+    return i, func(item)
+
+
+def imap_ordered(
+    pool, func, items, processes, chunksize=None, window=None, costs=None
+):
+    """Like pool.imap(func, items), but results are collected with
+    imap_unordered as they complete and reordered here, so one slow item only
+    delays the output after it rather than the workers.
+
+    At most `window` items are in flight (submitted but not yet yielded), which
+    bounds the reorder buffer.  If `costs` are given, items are instead
+    submitted most expensive first and the buffer isn't bounded.
+    """
+    items = list(items)
+    if chunksize is None:
+        chunksize = adaptive_chunksize(len(items), processes)
+    if costs is None:
+        order = range(len(items))
+        # Must hold at least a whole chunk, or the chunk holding the next
+        # result could never be submitted.
+        window = max(window or chunksize * processes * 4, chunksize)
+    else:
+        order = sorted(range(len(items)), key=lambda i: -costs[i])
+        window = len(items)
+    slots = threading.Semaphore(window)
+    stop = threading.Event()
+
+    def feed():
+        # Runs in the pool's task handler thread.
+        for i in order:
+            slots.acquire()
+            if stop.is_set():
+                return
+            yield (func, i, items[i])
+
+    done = {}
+    next_index = 0
+    try:
+        for i, result in pool.imap_unordered(_call_indexed, feed(), chunksize):
+            done[i] = result
+            while next_index in done:
+                yield done.pop(next_index)
+                next_index += 1
+                slots.release()
+    finally:
+        # Unblock feed() if we're stopping early, so the pool can shut down.
+        stop.set()
+        for _ in range(window):
+            slots.release()
+
+
 def main(argv=None):
     if argv is None:
         argv = sys.argv[1:]
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
 
     import optparse
 
@@ -52,6 +161,13 @@ def main(argv=None):
         default="WARNING",
     )
     o.add_option("--output_file", help="Output filename for analysis", default=None)
+    o.add_option(
+        "--format",
+        help="Output format: %s (default: text)" % ", ".join(sorted(WRITERS)),
+        default="text",
+        type="choice",
+        choices=sorted(WRITERS),
+    )
     o.add_option(
         "--no_parallel",
         help="Run checks in a single thread",
@@ -59,13 +175,50 @@ def main(argv=None):
         dest="parallel",
         action="store_false",
     )
+    o.add_option(
+        "--processes",
+        help="Number of worker processes (default: one per CPU)",
+        default=None,
+        type="int",
+    )
     o.add_option("--only_func", help="Only run this checker func", default=None)
+    o.add_option(
+        "--batch",
+        help="Check the character classes of each job together (needs NumPy)",
+        default=False,
+        action="store_true",
+    )
+    o.add_option(
+        "--confirm_backtracking",
+        help="Time attack strings on patterns warned about by 126 and 127, "
+        "giving up on each after this many seconds",
+        default=None,
+        type="float",
+        metavar="SECONDS",
+    )
     o.add_option(
         "--regex",
         help="Check args as regexes instead of Pygments lexers",
         default=None,
         action="store_true",
     )
+    o.add_option(
+        "--parse_cache_size",
+        help="Number of parse trees to keep per process (0 disables)",
+        default=PARSE_CACHE.maxsize,
+        type="int",
+    )
+    o.add_option(
+        "--cache_dir",
+        help="Directory to cache results in, so unchanged patterns are skipped",
+        default=None,
+    )
+    o.add_option(
+        "--cache_size",
+        help="Max number of results to keep in --cache_dir",
+        default=DEFAULT_SIZE,
+        type="int",
+    )
     o.add_option(
         "--verbose",
         help="Output names of lexers without problems",
@@ -79,70 +232,356 @@ def main(argv=None):
 
     min_level = getattr(logging, opts.min_level)
     if opts.output_file:
-        output_stream = open(opts.output_file, "wb")
+        output_stream = open(opts.output_file, "w")
     else:
         output_stream = sys.stdout
-    if opts.only_func:
-        global ONLY_FUNC
-        ONLY_FUNC = opts.only_func
+    batch = opts.batch
+    if batch and not regexlint.batch.available():
+        batch = False
+        print(
+            "--batch needs NumPy, checking one pattern at a time",
+            file=sys.stderr,
+        )
+    settings = (
+        opts.only_func,
+        batch,
+        opts.confirm_backtracking,
+        opts.parse_cache_size,
+        opts.cache_dir,
+        opts.cache_size,
+    )
+    configure(*settings)
 
     if opts.parallel:
-        pool = multiprocessing.Pool()
+        processes = opts.processes or os.cpu_count() or 1
+        # Workers don't inherit the settings unless they're forked.
+        pool = multiprocessing.Pool(processes, initializer=configure, initargs=settings)
+
+        def run(func, items, costs=None):
+            return imap_ordered(pool, func, items, processes, costs=costs)
+
     else:
-        pool = itertools
+        processes = 1
+        pool = None
 
-    if opts.regex:
-        for result in pool.imap(
-            check_regex_map, [(i, min_level, StringIO()) for i in args]
-        ):
-            result.seek(0, 0)
-            output_stream.write(result.read())
+        def run(func, items, costs=None):
+            return map(func, items)
+
+    writer = WRITERS[opts.format](output_stream)
+    try:
+        has_any_errors = check_args(opts, args, min_level, writer, run, processes)
+        writer.close()
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if output_stream is not sys.stdout:
+            output_stream.close()
+        # Keeps what was checked before an error or ^C.
+        if RESULT_CACHE is not None:
+            RESULT_CACHE.close()
+
+    if has_any_errors:
+        sys.exit(1)
+
+
+def profile_main(argv):
+    """Lexes a corpus with each of the named lexers, and shows which rules
+    took the time."""
+    import optparse
+
+    o = optparse.OptionParser(
+        usage="%prog profile [options] lexermodule[:class] corpus ..."
+    )
+    o.add_option(
+        "--limit",
+        help="Number of rules to show for each lexer, 0 for all (default: 20)",
+        default=20,
+        type="int",
+    )
+    opts, args = o.parse_args(argv)
+    if len(args) < 2:
+        o.error("need a lexer and some corpus files or directories")
+    check_corpus(o, args[1:])
+
+    _, lexers = find_lexers(args[0])
+    for lexer_name, cls, mod_path in lexers:
+        run = LexerRun(cls)
+        for _, text in read_corpus(args[1:]):
+            run.run(text)
+        write_profile(run, lexer_name, mod_path, opts.limit, sys.stdout)
+
+
+def coverage_main(argv):
+    """Lexes a corpus with each of the named lexers, and shows the rules that
+    never matched and the states never entered."""
+    import optparse
+
+    o = optparse.OptionParser(usage="%prog coverage lexermodule[:class] corpus ...")
+    opts, args = o.parse_args(argv)
+    if len(args) < 2:
+        o.error("need a lexer and some corpus files or directories")
+    check_corpus(o, args[1:])
+
+    _, lexers = find_lexers(args[0])
+    for lexer_name, cls, mod_path in lexers:
+        run = LexerRun(cls)
+        for _, text in read_corpus(args[1:]):
+            run.run(text)
+        write_coverage(run, lexer_name, mod_path, sys.stdout)
+
+
+def bench_main(argv):
+    """Times the named lexers on a corpus, and shows how often they fell back
+    to making Error tokens."""
+    import optparse
+
+    o = optparse.OptionParser(
+        usage="%prog bench [options] lexermodule[:class] corpus ...\n"
+        "       %prog bench [options] --corpus path lexermodule[:class] ..."
+    )
+    o.add_option(
+        "--corpus",
+        help="File or directory to lex (can be given more than once)",
+        default=[],
+        action="append",
+    )
+    o.add_option(
+        "--all_files",
+        help="Lex every file with every lexer, not just the ones its filenames match",
+        default=False,
+        action="store_true",
+    )
+    o.add_option(
+        "--top",
+        help="Number of fallback states and characters to show per lexer",
+        default=5,
+        type="int",
+    )
+    o.add_option(
+        "--format",
+        help="Output format: json, text (default: text)",
+        default="text",
+        type="choice",
+        choices=["json", "text"],
+    )
+    opts, args = o.parse_args(argv)
+    # Without --corpus, it's one lexer and the corpus, as for profile.
+    if opts.corpus:
+        modules, corpus = args, opts.corpus
+    else:
+        modules, corpus = args[:1], args[1:]
+    if not modules or not corpus:
+        o.error("need a lexer and some corpus files or directories")
+    check_corpus(o, corpus)
+
+    benches = []
+    for module in modules:
+        _, lexers = find_lexers(module)
+        benches.extend((lexer_name, LexerBench(cls)) for lexer_name, cls, _ in lexers)
+    # Each file is read once, however many lexers it's for.
+    for filename, text in read_corpus(corpus):
+        for _, bench in benches:
+            if opts.all_files or bench.matches(filename):
+                bench.run(text)
+
+    for lexer_name, bench in benches:
+        if not bench.files and not opts.all_files:
+            sys.stderr.write("%s: no matching files (use --all_files)\n" % lexer_name)
+    benches = [(lexer_name, bench) for lexer_name, bench in benches if bench.files]
+    if opts.format == "json":
+        results = []
+        for lexer_name, bench in benches:
+            d = bench.summary()
+            d["lexer"] = lexer_name
+            d["fallbacks"] = [
+                {"state": state, "char": char, "count": count}
+                for (state, char), count in bench.fallbacks.most_common(opts.top)
+            ]
+            results.append(d)
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        for lexer_name, bench in benches:
+            write_bench(bench, lexer_name, opts.top, sys.stdout)
+
+
+def dispatch_main(argv):
+    """Shows which rules each of the named lexers would try for each
+    character, if it dispatched on it, and times doing that on a corpus
+    against the stock RegexLexer loop."""
+    import optparse
+
+    o = optparse.OptionParser(
+        usage="%prog dispatch [options] [--corpus path] lexermodule[:class] ..."
+    )
+    o.add_option(
+        "--corpus",
+        help="File or directory to lex (can be given more than once)",
+        default=[],
+        action="append",
+    )
+    o.add_option(
+        "--all_files",
+        help="Lex every file with every lexer, not just the ones its filenames match",
+        default=False,
+        action="store_true",
+    )
+    o.add_option(
+        "--table",
+        help="Show the rules to try for each group of characters, in each state",
+        default=False,
+        action="store_true",
+    )
+    o.add_option(
+        "--format",
+        help="Output format for the timings: json, text (default: text)",
+        default="text",
+        type="choice",
+        choices=["json", "text"],
+    )
+    opts, args = o.parse_args(argv)
+    if not args or not (opts.corpus or opts.table):
+        o.error("need some arguments with modules/classes, and --corpus or --table")
+    check_corpus(o, opts.corpus)
+
+    benches = []
+    for module in args:
+        _, lexers = find_lexers(module)
+        benches.extend(
+            (lexer_name, DispatchBench(cls)) for lexer_name, cls, _ in lexers
+        )
+    if opts.table:
+        for lexer_name, bench in benches:
+            write_dispatch_table(bench.table, bench.cls, lexer_name, sys.stdout)
+    if not opts.corpus:
         return
 
+    unsupported = [lexer_name for lexer_name, bench in benches if not bench.supported]
+    benches = [(lexer_name, bench) for lexer_name, bench in benches if bench.supported]
+    for filename, text in read_corpus(opts.corpus):
+        for _, bench in benches:
+            if opts.all_files or bench.matches(filename):
+                bench.run(text, filename)
+
+    benches = [(lexer_name, bench) for lexer_name, bench in benches if bench.files]
+    if opts.format == "json":
+        results = []
+        for lexer_name, bench in benches:
+            d = bench.summary()
+            d["lexer"] = lexer_name
+            if bench.mismatch:
+                d["mismatch"] = {"file": bench.mismatch[0], "pos": bench.mismatch[1]}
+            results.append(d)
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        for lexer_name, bench in benches:
+            write_dispatch_bench(bench, lexer_name, sys.stdout)
+    for lexer_name in unsupported:
+        sys.stderr.write(
+            "%s: skipped, it has its own get_tokens_unprocessed\n" % lexer_name
+        )
+
+
+def check_corpus(o, paths):
+    """Reports the corpus paths that don't exist as an error with OptionParser
+    `o`, before any lexing is done."""
+    missing = [p for p in paths if not path.exists(p)]
+    if missing:
+        o.error("no such file or directory: %s" % ", ".join(missing))
+
+
+def check_args(opts, args, min_level, writer, run, processes):
+    if opts.regex:
+        for results in run(check_regex, [(i, min_level) for i in args]):
+            for item in results:
+                writer.write(item)
+        return False
+
     # currently just a list of module names.
     lexers_to_check = []
     for module in args:
-        if ":" in module:
-            module, cls = module.split(":")
-        else:
-            cls = None
-
-        # Support passing a filename instead, since shell completes it.
-        if "/" in module and module.endswith(".py"):
-            module = module[:-3].replace("/", ".")
-
-        mod = import_mod(module)
+        module, lexers = find_lexers(module)
         if opts.verbose:
-            lexers_to_check.append(StringIO("Module %s\n" % module))
-        if cls:
-            lexers = [cls]
-        else:
-            if hasattr(mod, "__all__"):
-                lexers = mod.__all__
-            else:
-                lexers = mod.__dict__.keys()
-
-        for k in lexers:
-            v = getattr(mod, k)
-            if hasattr(v, "__bases__") and issubclass(v, RegexLexer) and v.tokens:
-                clsmod = v.__module__
-                clsmodfile = sys.modules[clsmod].__file__
-                if clsmodfile.endswith(".pyc"):
-                    # need to go out of __pycache__
-                    newdir = path.dirname(path.dirname(clsmodfile))
-                    clsmodfile = path.join(newdir, path.basename(clsmodfile)[:-1])
-                lexers_to_check.append(
-                    (k, v, clsmodfile, min_level, opts.verbose, StringIO())
-                )
-
+            lexers_to_check.append("Module %s\n" % module)
+        for k, v, clsmodfile in lexers:
+            lexers_to_check.append((k, v, clsmodfile, min_level, opts.verbose))
+
+    timings = RESULT_CACHE.get_timings() if RESULT_CACHE is not None else {}
+    jobs = plan_jobs(lexers_to_check, processes, timings)
+    results = run(check_lexer_map, [j[1] for j in jobs], [j[2] for j in jobs])
+
+    # Lexers that were split into several jobs have their findings merged
+    # here, since no single job knows whether the whole lexer is OK.  Rules
+    # that earlier ones shadow are found by the job with the start of their
+    # state, and held until the job with the rule comes along.
     has_any_errors = False
-    for (stream, has_errors) in pool.imap(check_lexer_map, lexers_to_check):
-        stream.seek(0, 0)
-        output_stream.write(stream.read())
+    lexer_has_errors = False
+    new_timings = {}
+    held = []
+    for i, (items, has_errors, seconds) in enumerate(results):
+        n, job, _ = jobs[i]
+        if not isinstance(job, str) and job[-1] is not None:
+            items = place_findings(items, job[-1], held)
+        for item in items:
+            writer.write(item)
         has_any_errors |= has_errors
+        if isinstance(job, str):
+            continue
+
+        lexer_name, cls, _, _, verbose, parts = job
+        key = timing_key(cls)
+        new_timings[key] = new_timings.get(key, 0.0) + seconds
+        if parts is None:
+            continue
+        for state, _, _ in parts:
+            key = timing_key(cls, state)
+            new_timings[key] = new_timings.get(key, 0.0) + seconds / len(parts)
+        lexer_has_errors |= has_errors
+        if i + 1 == len(jobs) or jobs[i + 1][0] != n:
+            if verbose and not lexer_has_errors:
+                writer.write("%s OK\n" % lexer_name)
+            lexer_has_errors = False
+
+    if RESULT_CACHE is not None:
+        RESULT_CACHE.put_timings(new_timings)
+    return has_any_errors
+
+
+def find_lexers(module):
+    """Returns the module name and a list of (name, cls, filename) for the
+    RegexLexers that `module` (a module name or filename, optionally followed by
+    :Class) names."""
+    if ":" in module:
+        module, cls = module.split(":")
+    else:
+        cls = None
 
-    if has_any_errors:
-        sys.exit(1)
+    # Support passing a filename instead, since shell completes it.
+    if "/" in module and module.endswith(".py"):
+        module = module[:-3].replace("/", ".")
+
+    mod = import_mod(module)
+    if cls:
+        lexers = [cls]
+    else:
+        if hasattr(mod, "__all__"):
+            lexers = mod.__all__
+        else:
+            lexers = mod.__dict__.keys()
+
+    found = []
+    for k in lexers:
+        v = getattr(mod, k)
+        if hasattr(v, "__bases__") and issubclass(v, RegexLexer) and v.tokens:
+            clsmod = v.__module__
+            clsmodfile = sys.modules[clsmod].__file__
+            if clsmodfile.endswith(".pyc"):
+                # need to go out of __pycache__
+                newdir = path.dirname(path.dirname(clsmodfile))
+                clsmodfile = path.join(newdir, path.basename(clsmodfile)[:-1])
+            found.append((k, v, clsmodfile))
+    return module, found
 
 
 def remove_error(errs, *nums):
@@ -151,12 +590,11 @@ def remove_error(errs, *nums):
             del errs[i]
 
 
-def check_regex_map(tup):
-    return check_regex(*tup)
-
-
-def check_regex(regex_text, min_level, output_stream=sys.stdout):
-    has_errors = False
+def check_regex(args):
+    """Checks a pattern given on the command line, returning a list of
+    Findings and status lines."""
+    regex_text, min_level = args
+    results = []
     reg = Regex.get_parse_tree(regex_text, 0)
     if ONLY_FUNC:
         errs = []
@@ -165,33 +603,46 @@ def check_regex(regex_text, min_level, output_stream=sys.stdout):
         errs = run_all_checkers(reg, None)
         # Special case for empty string, since it needs action.
         manual_check_for_empty_string_match(reg, errs, (regex_text, Token))
+    if CONFIRM_TIMEOUT:
+        manual_check_for_backtracking(reg, errs, CONFIRM_TIMEOUT)
 
     errs.sort(key=lambda k: (k[1], k[0]))
-    if errs:
-        for num, severity, pos1, text in errs:
-            if severity < min_level:
-                continue
-
-            # Only set this if we're going to output something --
-            # otherwise the [Lexer] OK won't print
-            has_errors = True
-
-            print(
-                "%s:%s:%s: %s%s: %s"
-                % ("argv", "root", 0, logging.getLevelName(severity)[0], num, text),
-                file=output_stream,
+    for num, severity, pos1, text in errs:
+        if severity < min_level:
+            continue
+        results.append(
+            Finding(
+                code=num,
+                level=severity,
+                path=None,
+                line=None,
+                column=None,
+                end_column=None,
+                source=None,
+                lexer=None,
+                state=None,
+                rule=None,
+                pos=pos1,
+                message=text,
+                pattern=regex_text,
             )
-            mark_str(pos1, pos1 + 1, regex_text, output_stream)
-    if not has_errors:
-        print(repr(regex_text), "OK", file=output_stream)
+        )
+    if not results:
+        results.append("%r OK\n" % (regex_text,))
 
-    return output_stream
+    return results
 
 
 def check_lexer_map(args):
-    if isinstance(args, StringIO):
-        return (args, False)
-    return check_lexer(*args)
+    if isinstance(args, str):
+        return ([args], False, 0.0)
+    t0 = time.perf_counter()
+    try:
+        results, has_errors = check_lexer(*args)
+        return (results, has_errors, time.perf_counter() - t0)
+    finally:
+        if RESULT_CACHE is not None:
+            RESULT_CACHE.flush()
 
 
 def func_code(func):
@@ -208,96 +659,238 @@ def func_closure(func):
         return func.__closure__[0].cell_contents
 
 
-def check_lexer(
-    lexer_name, cls, mod_path, min_level, verbose, output_stream=sys.stdout
-):
-    # print lexer_name
-    # print cls().tokens
-    has_errors = False
+def check_lexer(lexer_name, cls, mod_path, min_level, verbose, parts=None):
+    """Checks the rules of lexer `cls`, or only those in `parts`, a list of
+    (state, start, stop) slices.  Returns a list of Findings and status lines,
+    and whether there were any findings.  When only some parts are checked,
+    the caller is responsible for the "OK" line."""
+    tokens = lexer_tokens(cls)
+    if parts is None:
+        parts_to_check = [(state, 0, None) for state in tokens]
+    else:
+        parts_to_check = parts
 
     bygroups_callback = func_code(bygroups(1))
-    for state, pats in cls().tokens.items():
+    # (state, index, pat, reg, by_groups, ignore_w123, key, errs) for each rule;
+    # errs is None until the checkers have been run.
+    rules = []
+    for state, start, stop in parts_to_check:
+        pats = tokens[state]
         if not isinstance(pats, list):
             # This is for Inform7Lexer
+            results, _ = report_rules(
+                check_rules(rules), lexer_name, mod_path, min_level
+            )
             if verbose:
-                print(lexer_name, "WEIRD", file=output_stream)
-            return (output_stream, False)
+                results.append("%s WEIRD\n" % lexer_name)
+            return (results, False)
 
-        for i, pat in enumerate(pats):
+        for i, pat in enumerate(pats[start:stop], start):
             if hasattr(pat, "state"):
                 # new 'default'
                 continue
 
             ignore_w123 = False
+            key = errs = reg = by_groups = None
             try:
                 if isinstance(pat[0], Future):
                     if isinstance(pat[0], words):
                         ignore_w123 = True
                     pat = (pat[0].get(),) + pat[1:]
-                reg = Regex.get_parse_tree(pat[0], cls.flags)
+                # Special problem: display an error if count of args to
+                # bygroups(...) doesn't match the number of capture groups
+                if callable(pat[1]) and func_code(pat[1]) is bygroups_callback:
+                    by_groups = func_closure(pat[1])
+
+                # Timings aren't worth caching.
+                if RESULT_CACHE is not None and not ONLY_FUNC and not CONFIRM_TIMEOUT:
+                    key = result_key(
+                        pat[0],
+                        cls.flags,
+                        by_groups,
+                        isinstance(pat[1], Token.__class__),
+                        len(pat) > 2,
+                        ignore_w123,
+                    )
+                    errs = RESULT_CACHE.get(key)
+                if errs is None:
+                    reg = Regex.get_parse_tree(pat[0], cls.flags)
             except TypeError:
                 # Doesn't support _inherit yet.
                 continue
             except Exception:
                 try:
-                    print(pat[0], cls, file=output_stream)
+                    print(pat[0], cls, file=sys.stderr)
                 except Exception:
                     pass
                 raise
-            # Special problem: display an error if count of args to
-            # bygroups(...) doesn't match the number of capture groups
-            if callable(pat[1]) and func_code(pat[1]) is bygroups_callback:
-                by_groups = func_closure(pat[1])
-            else:
-                by_groups = None
-
-            if ONLY_FUNC:
-                errs = []
-                getattr(regexlint.checkers, ONLY_FUNC)(reg, errs)
-            else:
-                errs = run_all_checkers(reg, by_groups)
+
+            rules.append((state, i, pat, reg, by_groups, ignore_w123, key, errs))
+
+    checked = check_rules(rules)
+    if not ONLY_FUNC:
+        checked = add_shadowed_rules(checked, cls, parts_to_check)
+    results, has_errors = report_rules(checked, lexer_name, mod_path, min_level)
+    if verbose and not has_errors and parts is None:
+        results.append("%s OK\n" % lexer_name)
+
+    return (results, has_errors)
+
+
+def check_rules(rules):
+    """Runs the checkers on the rules (as collected by check_lexer) that
+    weren't found in the result cache.  Returns (state, index, pat, errs) for
+    each rule."""
+    todo = [r for r in rules if r[7] is None]
+    if ONLY_FUNC:
+        found = []
+        for r in todo:
+            errs = []
+            getattr(regexlint.checkers, ONLY_FUNC)(r[3], errs)
+            found.append(errs)
+    elif BATCH:
+        found = regexlint.batch.run_all_checkers([(r[3], r[4]) for r in todo])
+    else:
+        found = [run_all_checkers(r[3], r[4]) for r in todo]
+
+    checked = []
+    found = iter(found)
+    for state, i, pat, reg, by_groups, ignore_w123, key, errs in rules:
+        if errs is None:
+            errs = next(found)
+            if not ONLY_FUNC:
                 # Special case for empty string, since it needs action.
                 manual_check_for_empty_string_match(reg, errs, pat)
+            if CONFIRM_TIMEOUT:
+                manual_check_for_backtracking(reg, errs, CONFIRM_TIMEOUT)
 
             errs.sort(key=lambda k: (k[1], k[0]))
 
             if ignore_w123:
                 remove_error(errs, "123")
 
-            if errs:
-                for num, severity, pos1, text in errs:
-                    if severity < min_level:
-                        continue
-
-                    # Only set this if we're going to output something --
-                    # otherwise the [Lexer] OK won't print
-                    has_errors = True
-
-                    foo = find_offending_line(mod_path, lexer_name, state, i, pos1)
-                    line = "%s:" % foo[0] if foo else ""
-                    patn = "pat#" + str(i + 1)
-                    print(
-                        "%s:%s (%s:%s:%s) %s%s: %s"
-                        % (
-                            mod_path,
-                            line,
-                            lexer_name,
-                            state,
-                            patn,
-                            logging.getLevelName(severity)[0],
-                            num,
-                            text,
-                        ),
-                        file=output_stream,
-                    )
-                    if foo:
-                        mark(*(foo + (output_stream,)))
-                    else:
-                        mark_str(pos1, pos1 + 1, pat[0], output_stream)
-    if verbose and not has_errors:
-        print(lexer_name, "OK", file=output_stream)
-
-    return (output_stream, has_errors)
+            if key is not None:
+                RESULT_CACHE.put(key, errs)
+        checked.append((state, i, pat, errs))
+    return checked
+
+
+def add_shadowed_rules(checked, cls, parts):
+    """Returns `checked` (as check_rules returns it, for the states in
+    `parts`) with the rules that earlier ones shadow reported too.  These
+    depend on the rest of the state, so they're cached per state.
+
+    Each state is only looked at by the part that starts with its first
+    rule, which adds the rules of the state's other parts that it finds, for
+    the caller to move to where they belong."""
+    tokendefs = all_tokendefs(cls)
+    shadowed = {}
+    for state in set(p[0] for p in parts if p[1] == 0):
+        key = found = None
+        if RESULT_CACHE is not None:
+            rules = effective_rules(tokendefs, state)
+            key = shadow_key(state, rules, cls.flags)
+            cached = RESULT_CACHE.get(key)
+            if cached is not None:
+                found = [(f[0], f[1:]) for f in cached]
+        if found is None:
+            try:
+                found = manual_check_for_shadowed_rules(tokendefs, state, cls.flags)
+            except Exception as e:
+                msg = "Checker %s encountered error: %r" % ("shadowed rules", e)
+                found = [(0, ("999", logging.ERROR, 0, msg))]
+            if key is not None:
+                RESULT_CACHE.put(key, [(i,) + err for i, err in found])
+        for i, err in found:
+            shadowed[state, i] = err
+
+    result = []
+    for state, i, pat, errs in checked:
+        err = shadowed.pop((state, i), None)
+        if err is not None:
+            errs = sorted(errs + [err], key=lambda k: (k[1], k[0]))
+        result.append((state, i, pat, errs))
+
+    for (state, i), err in sorted(shadowed.items()):
+        pat = tokendefs[state][i]
+        # check_lexer skips default()s.
+        if in_parts(parts, state, i) or hasattr(pat, "state"):
+            continue
+        if isinstance(pat[0], Future):
+            pat = (pat[0].get(),) + pat[1:]
+        result.append((state, i, pat, [err]))
+    return result
+
+
+def in_parts(parts, state, i):
+    """Returns whether rule `i` of `state` is in one of the (state, start,
+    stop) slices in `parts`."""
+    return any(
+        p[0] == state and p[1] <= i and (p[2] is None or i < p[2]) for p in parts
+    )
+
+
+def place_findings(items, parts, held):
+    """Returns the output `items` of the job for `parts`, with the Findings in
+    `held` for its rules merged in, and moves the ones for other jobs' rules
+    from `items` to `held`."""
+    mine = [f for f in held if in_parts(parts, f.state, f.rule)]
+    held[:] = [f for f in held if not in_parts(parts, f.state, f.rule)]
+    kept = []
+    for item in items:
+        if isinstance(item, Finding) and not in_parts(parts, item.state, item.rule):
+            held.append(item)
+        else:
+            kept.append(item)
+    if mine:
+        # A job's findings are in rule order, and by (level, code) for a rule.
+        kept = sorted(kept + mine, key=lambda f: (f.rule, f.level, f.code))
+    return kept
+
+
+def report_rules(checked, lexer_name, mod_path, min_level):
+    """Turns the output of check_rules into Findings, returning them and
+    whether there were any."""
+    results = []
+    has_errors = False
+    for state, i, pat, errs in checked:
+        for num, severity, pos1, text in errs:
+            if severity < min_level:
+                continue
+
+            # Only set this if we're going to output something --
+            # otherwise the [Lexer] OK won't print
+            has_errors = True
+
+            foo = find_offending_line(mod_path, lexer_name, state, i, pos1)
+            line, d1, d2, source = foo or (None, None, None, None)
+            results.append(
+                Finding(
+                    code=num,
+                    level=severity,
+                    path=mod_path,
+                    line=line,
+                    column=d1,
+                    end_column=d2,
+                    source=source,
+                    lexer=lexer_name,
+                    state=state,
+                    rule=i,
+                    pos=pos1,
+                    message=text,
+                    pattern=pat[0],
+                )
+            )
+    return (results, has_errors)
+
+
+# Modes other than linting, chosen by the first argument.
+COMMANDS = {
+    "profile": profile_main,
+    "coverage": coverage_main,
+    "bench": bench_main,
+    "dispatch": dispatch_main,
+}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,314 @@
+# Copyright 2018 Tim Hatch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+from bisect import bisect_right
+
+__all__ = [
+    "CodeSet",
+    "MAX_CODE",
+    "unicode_category",
+    "case_variants",
+    "case_closure",
+    "special_cases",
+]
+
+MAX_CODE = 0x10FFFF
+
+
+class CodeSet(object):
+    """
+    An immutable set of character codes, stored as a sorted tuple of disjoint,
+    non-adjacent, inclusive (lo, hi) ranges.  Operations cost time in the
+    number of ranges, not the number of codes, so [\\x00-\\U0010ffff] is as
+    cheap as [a].
+    """
+
+    __slots__ = ("ranges",)
+
+    def __init__(self, ranges=()):
+        """`ranges` is an iterable of inclusive (lo, hi) pairs in any order;
+        overlapping and adjacent ones are merged, and empty ones dropped."""
+        merged = []
+        for lo, hi in sorted(ranges):
+            if lo > hi:
+                continue
+            if merged and lo <= merged[-1][1] + 1:
+                if hi > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], hi)
+            else:
+                merged.append((lo, hi))
+        self.ranges = tuple(merged)
+
+    @classmethod
+    def _from_normalized(cls, ranges):
+        obj = cls.__new__(cls)
+        obj.ranges = tuple(ranges)
+        return obj
+
+    @classmethod
+    def from_codes(cls, codes):
+        return cls((c, c) for c in codes)
+
+    @classmethod
+    def from_range(cls, lo, hi):
+        return cls(((lo, hi),))
+
+    def __len__(self):
+        return sum(hi - lo + 1 for lo, hi in self.ranges)
+
+    def __bool__(self):
+        return bool(self.ranges)
+
+    def __iter__(self):
+        for lo, hi in self.ranges:
+            for i in range(lo, hi + 1):
+                yield i
+
+    def __contains__(self, code):
+        i = bisect_right(self.ranges, (code, MAX_CODE + 1))
+        return i > 0 and code <= self.ranges[i - 1][1]
+
+    def __eq__(self, other):
+        if not isinstance(other, CodeSet):
+            return NotImplemented
+        return self.ranges == other.ranges
+
+    def __ne__(self, other):
+        if not isinstance(other, CodeSet):
+            return NotImplemented
+        return self.ranges != other.ranges
+
+    def __hash__(self):
+        return hash(self.ranges)
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, list(self.ranges))
+
+    def min(self):
+        return self.ranges[0][0]
+
+    def max(self):
+        return self.ranges[-1][1]
+
+    def union(self, other):
+        if not other.ranges:
+            return self
+        if not self.ranges:
+            return other
+        return CodeSet(self.ranges + other.ranges)
+
+    def intersection(self, other):
+        # For each range of the smaller set, find the span of ranges it meets
+        # in the bigger one by bisection; all but the ends are copied as is.
+        a = self.ranges
+        b = other.ranges
+        if len(a) > len(b):
+            a, b = b, a
+        result = []
+        for lo, hi in a:
+            i = bisect_right(b, (lo, MAX_CODE + 1)) - 1
+            if i < 0 or b[i][1] < lo:
+                i += 1
+            j = bisect_right(b, (hi, MAX_CODE + 1))
+            if i >= j:
+                continue
+            if i == j - 1:
+                result.append((max(lo, b[i][0]), min(hi, b[i][1])))
+            else:
+                result.append((max(lo, b[i][0]), b[i][1]))
+                result.extend(b[i + 1 : j - 1])
+                result.append((b[j - 1][0], min(hi, b[j - 1][1])))
+        return CodeSet._from_normalized(result)
+
+    def complement(self, lo=0, hi=MAX_CODE):
+        """Returns the codes in lo..hi (inclusive) that aren't in this set."""
+        r = self.ranges
+        if lo > 0 or hi < MAX_CODE:
+            r = self.intersection(CodeSet._from_normalized([(lo, hi)])).ranges
+        if not r:
+            return CodeSet._from_normalized([(lo, hi)] if lo <= hi else [])
+        result = [(a[1] + 1, b[0] - 1) for a, b in zip(r, r[1:])]
+        if r[0][0] > lo:
+            result.insert(0, (lo, r[0][0] - 1))
+        if r[-1][1] < hi:
+            result.append((r[-1][1] + 1, hi))
+        return CodeSet._from_normalized(result)
+
+    def difference(self, other):
+        if not self.ranges or not other.ranges:
+            return self
+        return self.intersection(other.complement(self.min(), self.max()))
+
+    def overlaps(self, other):
+        """Returns whether any code is in both sets."""
+        a = self.ranges
+        b = other.ranges
+        i = j = 0
+        while i < len(a) and j < len(b):
+            if a[i][1] < b[j][0]:
+                i += 1
+            elif b[j][1] < a[i][0]:
+                j += 1
+            else:
+                return True
+        return False
+
+    def isdisjoint(self, other):
+        return not self.overlaps(other)
+
+    def issubset(self, other):
+        if not self.ranges:
+            return True
+        if len(other.ranges) < len(self.ranges):
+            # Check that no gap in `other` meets this set instead.
+            a = self.ranges
+            for lo, hi in other.complement(self.min(), self.max()).ranges:
+                i = bisect_right(a, (hi, MAX_CODE + 1)) - 1
+                if i >= 0 and a[i][1] >= lo:
+                    return False
+            return True
+        b = other.ranges
+        for lo, hi in self.ranges:
+            j = bisect_right(b, (lo, MAX_CODE + 1)) - 1
+            if j < 0 or b[j][1] < hi:
+                return False
+        return True
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+    __le__ = issubset
+
+
+# Tables over all of Unicode, built on first use.
+_categories = None
+_case_variants = None
+_case_images = None
+_special_cases = None
+
+
+def _all_chars():
+    return "".join(map(chr, range(MAX_CODE + 1)))
+
+
+def unicode_category(name):
+    """Returns the CodeSet that the category escape `name` (like "\\w" or
+    "\\S") matches in a str pattern without re.ASCII.  The tables come from
+    the re module itself, so they agree with it on every Python version."""
+    global _categories
+    if _categories is None:
+        chars = _all_chars()
+        _categories = {}
+        for c in "sdw":
+            codes = CodeSet._from_normalized(
+                (m.start(), m.end() - 1) for m in re.finditer("\\%s+" % c, chars)
+            )
+            _categories["\\" + c] = codes
+            _categories["\\" + c.upper()] = codes.complement()
+    return _categories[name]
+
+
+def case_variants():
+    """Returns (variants, cased, noncanonical) for case-insensitive matching.
+
+    `variants` maps each code that has other case forms to a tuple of all of
+    them (itself included), `cased` is the CodeSet of those codes, and
+    `noncanonical` the CodeSet of the ones that aren't the preferred spelling
+    of their group (the lowest lowercase one).  Forms are related through
+    str.lower() and str.upper(), which is close to what re.IGNORECASE does.
+    """
+    global _case_variants
+    if _case_variants is None:
+        chars = _all_chars()
+        parent = {}
+
+        def find(c):
+            while parent.get(c, c) != c:
+                c = parent[c]
+            return c
+
+        for start in range(0, MAX_CODE + 1, 256):
+            block = chars[start : start + 256]
+            if block.lower() == block and block.upper() == block:
+                continue
+            for ch in block:
+                for other in (ch.lower(), ch.upper()):
+                    if len(other) == 1 and other != ch:
+                        a = find(parent.setdefault(ord(ch), ord(ch)))
+                        b = find(parent.setdefault(ord(other), ord(other)))
+                        parent[max(a, b)] = min(a, b)
+
+        groups = {}
+        for c in parent:
+            groups.setdefault(find(c), []).append(c)
+        variants = {}
+        noncanonical = []
+        for members in groups.values():
+            members = tuple(sorted(members))
+            lower = [c for c in members if chr(c).lower() == chr(c)]
+            canonical = (lower or members)[0]
+            for c in members:
+                variants[c] = members
+                if c != canonical:
+                    noncanonical.append(c)
+        _case_variants = (
+            variants,
+            CodeSet.from_codes(variants),
+            CodeSet.from_codes(noncanonical),
+        )
+    return _case_variants
+
+
+def case_closure(codes):
+    """Returns `codes` plus every other case form of the codes in it."""
+    global _case_images
+    variants, cased, _ = case_variants()
+    if _case_images is None:
+        # The forms of every code in each range of `cased`, as ranges.
+        _case_images = {}
+        for lo, hi in cased.ranges:
+            forms = CodeSet.from_codes(
+                f for c in range(lo, hi + 1) for f in variants[c]
+            )
+            _case_images[lo, hi] = forms.ranges
+
+    extra = []
+    for lo, hi in (codes & cased).ranges:
+        if (lo, hi) in _case_images:
+            extra.extend(_case_images[lo, hi])
+        else:
+            extra.extend((f, f) for c in range(lo, hi + 1) for f in variants[c])
+    if not extra:
+        return codes
+    return CodeSet(codes.ranges + tuple(extra))
+
+
+def special_cases():
+    """Returns a dict from each code whose lowercase or uppercase is more than
+    one character, to the CodeSet of the codes in those that re.IGNORECASE
+    matches it to.  case_variants() skips these forms, so it misses some
+    (like "i" for U+0130)."""
+    global _special_cases
+    if _special_cases is None:
+        _special_cases = {}
+        for c in _all_chars():
+            forms = c.lower() + c.upper()
+            if len(forms) == 2:
+                continue
+            pattern = re.compile(re.escape(c), re.IGNORECASE)
+            others = [ord(f) for f in set(forms) if f != c and pattern.fullmatch(f)]
+            if others:
+                _special_cases[ord(c)] = CodeSet.from_codes(others)
+    return _special_cases
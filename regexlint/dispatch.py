@@ -0,0 +1,333 @@
+# Copyright 2018 Tim Hatch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Choosing which rules to try by the next character.
+
+At each position a RegexLexer tries the rules of the current state in order
+until one matches, but most of them can't, since they can't start with the
+character that's there.  A DispatchTable knows, from the parse trees, which
+rules might start with each character, so only those have to be tried (still
+in order, so the first match is the same one).
+
+dispatch_tokens() is RegexLexer.get_tokens_unprocessed changed to do that, and
+DispatchBench times it against the real thing on sample text, checking that
+the tokens come out the same.  This is a prototype, to find out which lexers
+it would help.
+"""
+
+import re
+import time
+from bisect import bisect_right
+
+from pygments.lexer import RegexLexer
+from pygments.token import Error, Whitespace, _TokenType
+
+from regexlint.analysis import Analysis
+from regexlint.charclass import build_code_ranges, build_output
+from regexlint.codeset import MAX_CODE, CodeSet, special_cases
+from regexlint.parser import Regex
+from regexlint.runtime import lexer_matches, rule_origins
+
+__all__ = [
+    "DispatchBench",
+    "DispatchTable",
+    "dispatch_tokens",
+    "rule_first",
+    "write_dispatch_bench",
+    "write_dispatch_table",
+]
+
+ASCII = CodeSet.from_range(0, 127)
+
+
+def rule_first(rexmatch):
+    """Returns the CodeSet of characters a rule (by the match function in the
+    lexer's _tokens) can start a match with, maybe with more, or None if it
+    has to be tried everywhere, because it can match the empty string or
+    isn't understood."""
+    regex = getattr(rexmatch, "__self__", None)
+    if not isinstance(regex, re.Pattern):
+        return None
+    try:
+        reg = Regex.get_parse_tree(regex.pattern, regex.flags)
+    except Exception:
+        return None
+    analysis = Analysis.of(reg)
+    # Unknown nodes (like backreferences) might match the empty string.
+    if analysis.nullable(reg) or analysis.chars(reg) is None:
+        return None
+    codes = analysis.first(reg)
+    if not analysis.unicode:
+        # Analysis only looks at 8 bits then, but the text doesn't.
+        codes |= CodeSet.from_range(256, MAX_CODE)
+    if analysis.ignorecase:
+        extra = [c for c, others in special_cases().items() if codes.overlaps(others)]
+        codes |= CodeSet.from_codes(extra)
+    return codes
+
+
+class _StateDispatch(dict):
+    # The rules to try for each character in one state, looked up from the
+    # ranges the first time a character is seen.  "" is the end of the text.
+
+    def __init__(self, starts, candidates, at_end):
+        dict.__init__(self)
+        self.starts = starts
+        self.candidates = candidates
+        self[""] = at_end
+
+    def __missing__(self, char):
+        rules = self[char] = self.candidates[bisect_right(self.starts, ord(char)) - 1]
+        return rules
+
+
+class DispatchTable(object):
+    """The rules to try at each character, for each state of `tokens` (the
+    _tokens of a RegexLexer instance).  `firsts` maps the id of each rule
+    tuple to what rule_first() says about it."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.firsts = {}
+        for rules in tokens.values():
+            for rule in rules:
+                if id(rule) not in self.firsts:
+                    self.firsts[id(rule)] = rule_first(rule[0])
+        self._states = {}
+
+    def ranges(self, state):
+        """Returns (starts, candidates, at_end) for `state`: the rules to try
+        for codes from starts[i] up to starts[i + 1] are candidates[i], and
+        the ones to try at the end of the text are at_end."""
+        rules = self.tokens[state]
+        firsts = [self.firsts[id(rule)] for rule in rules]
+        points = {0}
+        for codes in firsts:
+            if codes is not None:
+                for lo, hi in codes.ranges:
+                    points.add(lo)
+                    points.add(hi + 1)
+        starts = []
+        candidates = []
+        for code in sorted(points):
+            if code > MAX_CODE:
+                break
+            rules_here = tuple(
+                rule
+                for rule, codes in zip(rules, firsts)
+                if codes is None or code in codes
+            )
+            if not candidates or rules_here != candidates[-1]:
+                starts.append(code)
+                candidates.append(rules_here)
+        at_end = tuple(rule for rule, codes in zip(rules, firsts) if codes is None)
+        return starts, candidates, at_end
+
+    def lookup(self, state):
+        """Returns a dict from each character (and "" for the end of the
+        text) to the tuple of rules to try there in `state`."""
+        dispatch = self._states.get(state)
+        if dispatch is None:
+            dispatch = self._states[state] = _StateDispatch(*self.ranges(state))
+        return dispatch
+
+    def groups(self, state):
+        """Returns (CodeSet, rules) for `state`, with each set of rules once,
+        in the order of their lowest characters."""
+        starts, candidates, _ = self.ranges(state)
+        ranges = {}
+        for i, rules in enumerate(candidates):
+            end = starts[i + 1] - 1 if i + 1 < len(starts) else MAX_CODE
+            ranges.setdefault(rules, []).append((starts[i], end))
+        return [(CodeSet(r), rules) for rules, r in ranges.items()]
+
+
+def dispatch_tokens(lexer, table, text, stack=("root",)):
+    """RegexLexer.get_tokens_unprocessed for `lexer`, except that it only
+    tries the rules `table` has for the character at each position."""
+    pos = 0
+    statestack = list(stack)
+    dispatch = table.lookup(statestack[-1])
+    while 1:
+        for rexmatch, action, new_state in dispatch[text[pos : pos + 1]]:
+            m = rexmatch(text, pos)
+            if m:
+                if action is not None:
+                    if type(action) is _TokenType:
+                        yield pos, action, m.group()
+                    else:
+                        yield from action(lexer, m)
+                pos = m.end()
+                if new_state is not None:
+                    # state transition
+                    if isinstance(new_state, tuple):
+                        for state in new_state:
+                            if state == "#pop":
+                                if len(statestack) > 1:
+                                    statestack.pop()
+                            elif state == "#push":
+                                statestack.append(statestack[-1])
+                            else:
+                                statestack.append(state)
+                    elif isinstance(new_state, int):
+                        # pop, but keep at least one state on the stack
+                        if abs(new_state) >= len(statestack):
+                            del statestack[1:]
+                        else:
+                            del statestack[new_state:]
+                    elif new_state == "#push":
+                        statestack.append(statestack[-1])
+                    else:
+                        assert False, "wrong state def: %r" % (new_state,)
+                    dispatch = table.lookup(statestack[-1])
+                break
+        else:
+            try:
+                if text[pos] == "\n":
+                    # at EOL, reset state to "root"
+                    statestack = ["root"]
+                    dispatch = table.lookup("root")
+                    yield pos, Whitespace, "\n"
+                    pos += 1
+                    continue
+                yield pos, Error, text[pos]
+                pos += 1
+            except IndexError:
+                break
+
+
+class DispatchBench(object):
+    """Lexes what's given to run() with an instance of the RegexLexer
+    subclass `cls` both ways, timing each and comparing the tokens.
+    `mismatch` is (name, position) where they first differed, if they did.
+
+    Lexers that have their own get_tokens_unprocessed aren't `supported`,
+    since dispatch_tokens() would skip what it does."""
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.lexer = cls()
+        self.supported = (
+            cls.get_tokens_unprocessed is RegexLexer.get_tokens_unprocessed
+        )
+        self.table = DispatchTable(self.lexer._tokens)
+        self.files = 0
+        self.chars = 0
+        self.tokens = 0
+        self.stock_seconds = 0.0
+        self.dispatch_seconds = 0.0
+        self.mismatch = None
+
+    def matches(self, filename):
+        """Returns whether `filename` is one the lexer says it's for."""
+        return lexer_matches(self.cls, filename)
+
+    def run(self, text, name=None):
+        """Lexes `text` (from `name`) both ways."""
+        start = time.perf_counter()
+        expected = list(self.lexer.get_tokens_unprocessed(text))
+        self.stock_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        actual = list(dispatch_tokens(self.lexer, self.table, text))
+        self.dispatch_seconds += time.perf_counter() - start
+
+        if actual != expected and self.mismatch is None:
+            i = 0
+            while i < len(actual) and i < len(expected) and actual[i] == expected[i]:
+                i += 1
+            longer = actual if i < len(actual) else expected
+            self.mismatch = (name, longer[i][0])
+        self.files += 1
+        self.chars += len(text)
+        self.tokens += len(expected)
+
+    def summary(self):
+        """Returns a dict of the totals, with how many times faster
+        dispatching was."""
+        return {
+            "files": self.files,
+            "chars": self.chars,
+            "tokens": self.tokens,
+            "stock_seconds": self.stock_seconds,
+            "dispatch_seconds": self.dispatch_seconds,
+            "speedup": (
+                self.stock_seconds / self.dispatch_seconds
+                if self.dispatch_seconds
+                else 0.0
+            ),
+            "identical": self.mismatch is None,
+        }
+
+
+def _codes_text(codes):
+    # The ASCII part as a character class, and how many other codes.
+    parts = []
+    low = codes & ASCII
+    if low:
+        parts.append("[%s]" % build_output(build_code_ranges(low)))
+    rest = len(codes) - len(low)
+    if rest:
+        parts.append("%d %s" % (rest, "more" if low else "non-ASCII"))
+    return " and ".join(parts)
+
+
+def _rule_name(origins, state, rule):
+    # pat#N, with the state it's from if that's not `state`.
+    origin = origins.get(id(rule))
+    if origin is None:
+        return "?"
+    if origin[0] == state:
+        return "pat#%d" % (origin[1] + 1)
+    return "%s:pat#%d" % (origin[0], origin[1] + 1)
+
+
+def write_dispatch_table(table, cls, lexer_name, stream):
+    """Writes the rules `table` would try for each group of characters that
+    has any, in each state, with how many an ASCII character gets on
+    average."""
+    origins = rule_origins(cls, table.tokens)
+    for state, rules in table.tokens.items():
+        groups = table.groups(state)
+        tried = sum(len(codes & ASCII) * len(r) for codes, r in groups) / 128.0
+        stream.write(
+            "%s:%s: %d rules, %.1f tried per ASCII character\n"
+            % (lexer_name, state, len(rules), tried)
+        )
+        # Characters that no rule can start with get an Error token.
+        groups = [(codes, r) for codes, r in groups if r]
+        groups.append((None, table.lookup(state)[""]))
+        for codes, r in groups:
+            names = ", ".join(_rule_name(origins, state, rule) for rule in r)
+            where = "end of text" if codes is None else _codes_text(codes)
+            stream.write("  %s: %s\n" % (where, names or "-"))
+
+
+def write_dispatch_bench(bench, lexer_name, stream):
+    """Writes the totals of `bench`, and where the tokens first differed."""
+    d = bench.summary()
+    stream.write(
+        "%s: %d files, %d chars, %.2fs stock, %.2fs dispatching (%.2fx)%s\n"
+        % (
+            lexer_name,
+            d["files"],
+            d["chars"],
+            d["stock_seconds"],
+            d["dispatch_seconds"],
+            d["speedup"],
+            "" if d["identical"] else ", tokens differ",
+        )
+    )
+    if bench.mismatch:
+        stream.write("  first difference: %s at %d\n" % bench.mismatch)
@@ -0,0 +1,179 @@
+# Copyright 2018 Tim Hatch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Problems found by cmdline, and the writers that format them.
+
+Workers return lists of Finding records mixed with plain strings (status
+lines like "FooLexer OK", which only the text format shows), and the parent
+hands each one to a writer.
+"""
+
+import json
+import logging
+import os
+import pathlib
+from collections import namedtuple
+
+from regexlint.indicator import mark, mark_str
+
+__all__ = ["Finding", "TextWriter", "JsonWriter", "SarifWriter", "WRITERS"]
+
+
+class Finding(
+    namedtuple(
+        "Finding",
+        "code level path line column end_column source "
+        "lexer state rule pos message pattern",
+    )
+):
+    """One problem with one pattern.
+
+    `code`, `level` (a logging constant), `pos` and `message` come from the
+    checker.  `lexer`, `state` and `rule` (the 0-based index in the state)
+    locate the pattern in a lexer, and are None for patterns given with
+    --regex.  `line`, `column`, `end_column` and `source` are the 1-based line
+    number, the 0-based span of the problem in that line, and the line itself,
+    when the pattern could be found in the source file `path`; otherwise they
+    are None and the problem is shown in `pattern`.
+    """
+
+    __slots__ = ()
+
+    def to_dict(self):
+        d = self._asdict()
+        d["level"] = logging.getLevelName(self.level)
+        return d
+
+
+class TextWriter(object):
+    """The traditional human-readable output."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, item):
+        if isinstance(item, str):
+            self.stream.write(item)
+            return
+
+        f = item
+        level = logging.getLevelName(f.level)[0]
+        if f.lexer is None:
+            print(
+                "%s:%s:%s: %s%s: %s"
+                % ("argv", "root", 0, level, f.code, f.message),
+                file=self.stream,
+            )
+        else:
+            line = "%s:" % f.line if f.line is not None else ""
+            patn = "pat#" + str(f.rule + 1)
+            print(
+                "%s:%s (%s:%s:%s) %s%s: %s"
+                % (f.path, line, f.lexer, f.state, patn, level, f.code, f.message),
+                file=self.stream,
+            )
+        if f.line is not None:
+            mark(f.line, f.column, f.end_column, f.source, self.stream)
+        else:
+            mark_str(f.pos, f.pos + 1, f.pattern, self.stream)
+
+    def close(self):
+        pass
+
+
+class JsonWriter(object):
+    """A JSON list of Finding.to_dict() objects, written as they arrive."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+
+    def write(self, item):
+        if isinstance(item, str):
+            return
+        self.stream.write("[\n" if not self.count else ",\n")
+        self.stream.write(json.dumps(item.to_dict(), sort_keys=True))
+        self.count += 1
+
+    def close(self):
+        self.stream.write("\n]\n" if self.count else "[]\n")
+
+
+SARIF_LEVELS = {logging.ERROR: "error", logging.WARNING: "warning"}
+
+
+class SarifWriter(object):
+    """A SARIF 2.1.0 log with one run, for code scanning tools."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+        header = {
+            "$schema": "https://json.schemastore.org/sarif-2.1.0.json",
+            "version": "2.1.0",
+            "runs": [
+                {
+                    "tool": {
+                        "driver": {
+                            "name": "regexlint",
+                            "informationUri": "https://github.com/thatch/regexlint/",
+                        }
+                    },
+                    "results": [],
+                }
+            ],
+        }
+        # Everything up to the results list, which is streamed.
+        text = json.dumps(header)
+        self.stream.write(text[: text.rindex("[]")] + "[")
+
+    def result(self, f):
+        result = {
+            "ruleId": f.code,
+            "level": SARIF_LEVELS.get(f.level, "note"),
+            "message": {"text": f.message},
+            "properties": {"pos": f.pos, "pattern": f.pattern},
+        }
+        if f.lexer is not None:
+            result["properties"].update(lexer=f.lexer, state=f.state, rule=f.rule)
+            location = {"artifactLocation": {"uri": artifact_uri(f.path)}}
+            if f.line is not None:
+                location["region"] = {
+                    "startLine": f.line,
+                    "startColumn": f.column + 1,
+                    "endColumn": f.end_column + 1,
+                }
+            result["locations"] = [{"physicalLocation": location}]
+        return result
+
+    def write(self, item):
+        if isinstance(item, str):
+            return
+        if self.count:
+            self.stream.write(",")
+        self.stream.write("\n" + json.dumps(self.result(item), sort_keys=True))
+        self.count += 1
+
+    def close(self):
+        self.stream.write("]}]}\n")
+
+
+def artifact_uri(path):
+    if os.path.isabs(path):
+        return pathlib.Path(path).as_uri()
+    return path.replace(os.sep, "/")
+
+
+WRITERS = {"text": TextWriter, "json": JsonWriter, "sarif": SarifWriter}
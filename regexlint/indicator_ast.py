@@ -22,83 +22,104 @@ import ast
 import re
 
 from regexlint.indicator_substr import find_substr_pos
-from regexlint.util import get_module_text
+from regexlint.util import LRUCache, get_module_text
 
-parse_cache = {}
+# ModuleIndex objects for recently used modules, keyed by path (or text).
+parse_cache = LRUCache(maxsize=64)
 
+STRING_RE = re.compile(
+    "[uU]?[rR]?(?:"
+    "'''(?:[^\\\\]|\\\\.)*?'''|"
+    '"""(?:[^\\\\]|\\\\.)*?"""|'
+    "'(?:[^\\\\]|\\\\.)*?'|"
+    '"(?:[^\\\\]|\\\\.)*?"'
+    ")",
+    re.DOTALL,
+)
 
-def find_offending_line(mod, clsname, state, idx, pos):
+
+class ModuleIndex(object):
     """
-    Returns a tuple of (lineno, charpos_start, charpos_end, line_content)
+    Where the token definitions of the classes in one module are.  The module
+    is parsed once, and each class is walked once, the first time it's asked
+    about.
     """
-    try:
-        mod_text, tree = parse_cache[mod]
-    except KeyError:
-        mod_text = get_module_text(mod)
-        tree = ast.parse(mod_text)
-        parse_cache[mod] = mod_text, tree
-
-    klass = None
-    for item in ast.walk(tree):
-        if isinstance(item, ast.ClassDef):
-            if clsname == item.name:
-                klass = item
-                break
-    if not klass:
-        return
-    for item in ast.walk(klass):
-        if not isinstance(item, ast.Dict):
-            continue
-        stateValue = None
-        for i, key in enumerate(item.keys):
-            if isinstance(key, ast.Str) and key.s == state:
-                stateValue = item.values[i]
-        if stateValue is None:
-            continue
-        if not isinstance(stateValue, ast.List):
-            continue
-        if not idx < len(stateValue.elts):
-            continue
-        idxTuple = stateValue.elts[idx]
-        if not isinstance(idxTuple, ast.Tuple):
-            continue
-        if len(idxTuple.elts) < 2 or not isinstance(idxTuple.elts[0], ast.Str):
-            continue
-        lines = []
-        startline = idxTuple.elts[0].lineno - 1
-        startchar = idxTuple.elts[0].col_offset
-        stopline = idxTuple.elts[1].lineno
-        stopchar = idxTuple.elts[1].col_offset
 
-        # print "Block"
-        # print idxTuple.col_offset, idxTuple.elts[0].col_offset, idxTuple.elts[1].col_offset
-        # print idxTuple.lineno, idxTuple.elts[0].lineno, idxTuple.elts[1].lineno
-        # print mod_text.splitlines()[idxTuple.lineno-1]
+    def __init__(self, mod_text):
+        self.mod_text = mod_text
+        self.lines = mod_text.splitlines()
+        self.tree = ast.parse(mod_text)
+        self._classes = None
+        self._states = {}
+        self._literals = {}
+
+    def state_lists(self, clsname, state):
+        """Returns the ast.List values of `state` in every dict inside class
+        `clsname`, in ast.walk order.  When a dict repeats a key, the last one
+        wins."""
+        if self._classes is None:
+            self._classes = {}
+            for item in ast.walk(self.tree):
+                if isinstance(item, ast.ClassDef):
+                    self._classes.setdefault(item.name, item)
+
+        try:
+            states = self._states[clsname]
+        except KeyError:
+            states = self._states[clsname] = {}
+            klass = self._classes.get(clsname)
+            if klass is not None:
+                for item in ast.walk(klass):
+                    if not isinstance(item, ast.Dict):
+                        continue
+                    values = {}
+                    for key, value in zip(item.keys, item.values):
+                        if isinstance(key, ast.Str):
+                            values[key.s] = value
+                    for name, value in values.items():
+                        if isinstance(value, ast.List):
+                            states.setdefault(name, []).append(value)
+        return states.get(state, ())
+
+    def literals(self, rule):
+        """Returns a list of (source, lineno, col_offset) for the string
+        literals making up the pattern of `rule` (an ast.Tuple), or None if
+        they can't be found."""
+        try:
+            return self._literals[rule]
+        except KeyError:
+            pass
+
+        startline = rule.elts[0].lineno - 1
+        startchar = rule.elts[0].col_offset
+        stopline = rule.elts[1].lineno
+        stopchar = rule.elts[1].col_offset
 
         # HACK HACK HACK
-        if idxTuple.elts[0].col_offset == -1:
+        if rule.elts[0].col_offset == -1:
             # When col_offset==-1 then the string is split across multiple
             # lines. This generally means it's a triplequoted string, which
             # can be located with a dumb heuristic.
-            _lines = mod_text.splitlines()
-            if '"""' in _lines[startline]:
+            if '"""' in self.lines[startline]:
                 target = '"""'
-            elif "'''" in _lines[startline]:
+            elif "'''" in self.lines[startline]:
                 target = "'''"
             else:
                 # print "Cannot locate beginning string"
+                self._literals[rule] = None
                 return None
 
             for i in range(startline - 1, -1, -1):
-                if target in _lines[i]:
+                if target in self.lines[i]:
                     # print "Adjusted start line from", startline, "to", i
                     startline = i
-                    startchar = _lines[i].rindex(target) - 2  # for 'ur'
+                    startchar = self.lines[i].rindex(target) - 2  # for 'ur'
                     break
 
         # END HACK
 
-        for i, line in enumerate(mod_text.splitlines()[startline:], startline):
+        lines = []
+        for i, line in enumerate(self.lines[startline:], startline):
             if i == stopline:
                 line = line[:stopchar]
             if i == startline:
@@ -108,31 +129,51 @@ def find_offending_line(mod, clsname, state, idx, pos):
                 break
         rawstr = "\n".join(lines)
 
-        strRe = re.compile(
-            "[uU]?[rR]?(?:"
-            "'''(?:[^\\\\]|\\\\.)*?'''|"
-            '"""(?:[^\\\\]|\\\\.)*?"""|'
-            "'(?:[^\\\\]|\\\\.)*?'|"
-            '"(?:[^\\\\]|\\\\.)*?"'
-            ")",
-            re.DOTALL,
-        )
-        # print "rawstr:", repr(rawstr)
-        for match in strRe.finditer(rawstr):
-            # print "match:", repr(match.group(0))
-            strInst = match.group(0)
-            try:
-                (dx, d1, d2) = find_substr_pos(strInst, pos)
-            except ValueError:
-                pos -= len(ast.literal_eval(strInst))
-                continue
+        literals = []
+        for match in STRING_RE.finditer(rawstr):
             before_match = rawstr[: match.start(0)]
             match_lineno_in_rawstr = before_match.count("\n")
             lineno = startline + 1 + match_lineno_in_rawstr
             col_offset = match.start(0) - (before_match.rfind("\n") + 1)
             if match_lineno_in_rawstr == 0:
                 col_offset += startchar
+            literals.append((match.group(0), lineno, col_offset))
+        self._literals[rule] = literals
+        return literals
+
+
+def get_index(mod):
+    index = parse_cache.get(mod)
+    if index is None:
+        index = ModuleIndex(get_module_text(mod))
+        parse_cache.put(mod, index)
+    return index
+
+
+def find_offending_line(mod, clsname, state, idx, pos):
+    """
+    Returns a tuple of (lineno, charpos_start, charpos_end, line_content)
+    """
+    index = get_index(mod)
+    for stateValue in index.state_lists(clsname, state):
+        if not idx < len(stateValue.elts):
+            continue
+        idxTuple = stateValue.elts[idx]
+        if not isinstance(idxTuple, ast.Tuple):
+            continue
+        if len(idxTuple.elts) < 2 or not isinstance(idxTuple.elts[0], ast.Str):
+            continue
+
+        literals = index.literals(idxTuple)
+        if literals is None:
+            return None
+        for strInst, lineno, col_offset in literals:
+            try:
+                (dx, d1, d2) = find_substr_pos(strInst, pos)
+            except ValueError:
+                pos -= len(ast.literal_eval(strInst))
+                continue
             if dx == 0:
                 d1 += col_offset
                 d2 += col_offset
-            return (lineno + dx, d1, d2, mod_text.splitlines()[lineno + dx - 1])
+            return (lineno + dx, d1, d2, index.lines[lineno + dx - 1])
@@ -15,17 +15,37 @@
 import re
 import sre_parse
 import sys
-import weakref
 
 from pygments.lexer import RegexLexer, default, include
-from pygments.token import Other
+from pygments.token import Error, Other
 
-from regexlint.util import eval_char, fmttree
+from regexlint.codeset import MAX_CODE, CodeSet, case_closure, unicode_category
+from regexlint.util import LRUCache, eval_char, fmttree, preorder
 
 WHITESPACE = " \t\n\r\f\v"
 DIGITS = "0123456789"
 WORD = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ" + DIGITS + "_"
 
+BYTE_CODES = CodeSet.from_range(0, 255)
+
+
+def _category(chars, negated=False):
+    codes = CodeSet.from_codes(map(ord, chars))
+    if negated:
+        return (codes.complement(0, 255), None)
+    return (codes, tuple(map(ord, chars)))
+
+
+# (codes, order) for the categories CharClass understands, as 8-bit sets.
+CATEGORY_ITEMS = {
+    r"\s": _category(WHITESPACE),
+    r"\w": _category(WORD),
+    r"\d": _category(DIGITS),
+    r"\S": _category(WHITESPACE, True),
+    r"\W": _category(WORD, True),
+    r"\D": _category(DIGITS, True),
+}
+
 # Special types, others are used in the parser below in normal Pygments
 # manner.
 
@@ -33,7 +53,312 @@ PROGRESSION = Other.Progression
 ALTERNATION = Other.Alternation
 
 
+# Parse trees keyed by (class, pattern, flags).  Pygments lexers share a lot of
+# patterns, and a tree isn't modified once it's built, so the same one can be
+# handed to every caller.  Use PARSE_CACHE.resize() to change its size.
+PARSE_CACHE = LRUCache(maxsize=4096)
+
+# ClassInfo objects keyed by the data of a character class's children, which is
+# all that CharClass.close looks at.  Lexers repeat the same classes (like
+# [^\\\n"]) many times over, and they mean the same thing in every pattern;
+# flags aren't part of the key since they're applied by the checkers.
+CHARCLASS_CACHE = LRUCache(maxsize=4096)
+
+OCT_DIGITS = "01234567"
+HEX_DIGITS = "0123456789abcdefABCDEF"
+SUSPICIOUS = "\x00\x01\x02\x03\x04\x05\x06\x07\x08\n\r"
+
+# Single-character escapes from the "simpleliteral" state of BaseRegex.
+SIMPLE_ESCAPES = {
+    "[": Other.Literal.Bracket,
+    "]": Other.Literal.Bracket,
+    "(": Other.Literal.Paren,
+    ")": Other.Literal.Paren,
+    "t": Other.Tab,
+    "n": Other.Newline,
+    ".": Other.Literal.Dot,
+    "\\": Other.Literal.Backslash,
+    "*": Other.Literal.Star,
+    "+": Other.Literal.Plus,
+    "|": Other.Literal.Alternation,
+    "^": Other.Literal.Caret,
+    "$": Other.Literal.Dollar,
+    "?": Other.Literal.Question,
+    "{": Other.Literal.Curly,
+    "}": Other.Literal.Curly,
+    "'": Other.Suspicious.Squo,
+    '"': Other.Suspicious.Dquo,
+    "s": Other.BuiltinCharclass,
+    "S": Other.BuiltinCharclass,
+    "w": Other.BuiltinCharclass,
+    "W": Other.BuiltinCharclass,
+    "d": Other.BuiltinCharclass,
+    "D": Other.BuiltinCharclass,
+}
+
+ROOT_ESCAPES = {
+    "b": Other.Anchor.WordBoundary,
+    "A": Other.Anchor.BeginningOfString,
+    "Z": Other.Anchor.EndOfString,
+}
+
+SIMPLE_OPENS = {
+    "(?:": Other.Open.NonCapturing,
+    "(?=": Other.Open.Lookahead,
+    "(?!": Other.Open.NegativeLookahead,
+}
+
+REPETITIONS = {
+    "*": (Other.Repetition.Star, Other.Repetition.NongreedyStar),
+    "+": (Other.Repetition.Plus, Other.Repetition.NongreedyPlus),
+    "?": (Other.Repetition.Question, Other.Repetition.NongreedyQuestion),
+}
+
+
+def _run(s, i, chars):
+    """Returns the index of the first char at or after i not in chars."""
+    n = len(s)
+    while i < n and s[i] in chars:
+        i += 1
+    return i
+
+
+def _run_decimal(s, i):
+    n = len(s)
+    while i < n and s[i].isdecimal():
+        i += 1
+    return i
+
+
+def _scan_escape(s, i):
+    """Scans the "simpleliteral" escape starting at the backslash s[i].
+
+    Returns (ttype, end) or None if no rule matches (the lexer would emit an
+    Error token for the backslash)."""
+    if i + 1 >= len(s):
+        return None
+    c = s[i + 1]
+    if c == "0":
+        return Other.Literal.Oct, min(_run(s, i + 2, OCT_DIGITS), i + 5)
+    elif c == "x" and _run(s, i + 2, HEX_DIGITS) >= i + 4:
+        return Other.Literal.Hex, i + 4
+    elif c == "u" and _run(s, i + 2, HEX_DIGITS) >= i + 6:
+        return Other.Literal.Unicode, i + 6
+    elif c == "U" and _run(s, i + 2, HEX_DIGITS) >= i + 10:
+        return Other.Literal.LongUnicode, i + 10
+    elif c in SIMPLE_ESCAPES:
+        return SIMPLE_ESCAPES[c], i + 2
+    elif c != "\n":
+        return Other.Suspicious, i + 2
+    return None
+
+
+def _scan_open(s, i):
+    """Scans a token starting with an open paren at s[i], returning
+    (ttype, end)."""
+    n = len(s)
+    if not s.startswith("(?", i):
+        return Other.Open.Capturing, i + 1
+    j = _run(s, i + 2, "iLmsux")
+    if j > i + 2 and j < n and s[j] == ")":
+        return Other.Directive, j + 1
+    t = SIMPLE_OPENS.get(s[i : i + 3])
+    if t is not None:
+        return t, i + 3
+    if s.startswith("(?P<", i):
+        j = s.find(">", i + 4)
+        if j != -1 and "\n" not in s[i + 4 : j]:
+            return Other.Open.NamedCapturing, j + 1
+    if s.startswith("(?<!", i):
+        return Other.Open.NegativeLookbehind, i + 4
+    if s.startswith("(?<", i):
+        return Other.Open.Lookbehind, i + 3
+    if s.startswith("(?P=", i):
+        j = i + 4
+        while j < n and (s[j].isalnum() or s[j] == "_"):
+            j += 1
+        if j > i + 4 and j < n and s[j] == ")":
+            return Other.Open.ExistsNamed, j
+    if s.startswith("(?(", i):
+        j = _run_decimal(s, i + 3)
+        if j > i + 3 and j < n and s[j] == ")":
+            return Other.Open.Exists, j + 1
+    if s.startswith("(?#", i):
+        j = s.find(")", i + 3)
+        if j != -1 and "\n" not in s[i + 3 : j]:
+            return Other.Comment, j + 1
+    return Other.Open.Capturing, i + 1
+
+
+def _scan_curly(s, i):
+    """Scans a repetition like {1,2}? starting at s[i], returning the end
+    position or None if it's just a brace."""
+    n = len(s)
+    j = _run_decimal(s, i + 1)
+    if j > i + 1 and j < n and s[j] == ",":
+        j = _run_decimal(s, j + 1)
+    else:
+        j = i + 1
+        if j < n and s[j] == ",":
+            j += 1
+        k = _run_decimal(s, j)
+        if k == j:
+            return None
+        j = k
+    if j < n and s[j] == "}":
+        if j + 1 < n and s[j + 1] == "?":
+            return j + 2
+        return j + 1
+    return None
+
+
+def scan_regex(s, verbose=False):
+    """Yields the same (pos, ttype, data) tuples as
+    Regex().get_tokens_unprocessed(s) (or VerboseRegex when `verbose`), but
+    with a single hand-written pass over the string instead of the
+    RegexLexer machinery."""
+    n = len(s)
+    i = 0
+    in_class = False
+    while i < n:
+        c = s[i]
+        if in_class:
+            # charclass_rest
+            if c == "]":
+                yield i, Other.CloseCharClass, c
+                in_class = False
+                i += 1
+            elif c == "\\":
+                if s.startswith("\\-", i):
+                    yield i, Other.EscapedDash, "\\-"
+                    i += 2
+                    continue
+                r = _scan_escape(s, i)
+                if r is None:
+                    yield i, Error, c
+                    i += 1
+                else:
+                    yield i, r[0], s[i : r[1]]
+                    i = r[1]
+            elif c == "-" or c == "^":
+                yield i, Other.Special, c
+                i += 1
+            else:
+                yield i, Other.Literal, c
+                i += 1
+            continue
+
+        if c == "(":
+            t, j = _scan_open(s, i)
+            yield i, t, s[i:j]
+            i = j
+        elif c == ")":
+            yield i, Other.CloseParen, c
+            i += 1
+        elif c == "|":
+            yield i, Other.Alternate, c
+            i += 1
+        elif c == "[":
+            yield i, Other.CharClass, c
+            i += 1
+            # charclass_start and charclass_squarebracket_special
+            if i < n and s[i] == "^":
+                yield i, Other.NegateCharclass, "^"
+                i += 1
+            if i < n and s[i] == "]":
+                yield i, Other.Literal.CloseCharClass, "]"
+                i += 1
+            in_class = True
+        elif c == "\\":
+            d = s[i + 1 : i + 2]
+            if d and d in "123456789":
+                j = i + 2
+                if j < n and s[j] in DIGITS:
+                    j += 1
+                yield i, Other.Backref, s[i:j]
+                i = j
+            elif d in ROOT_ESCAPES:
+                yield i, ROOT_ESCAPES[d], s[i : i + 2]
+                i += 2
+            else:
+                r = _scan_escape(s, i)
+                if r is None:
+                    yield i, Error, c
+                    i += 1
+                else:
+                    yield i, r[0], s[i : r[1]]
+                    i = r[1]
+        elif verbose and c.isspace():
+            j = i + 1
+            while j < n and s[j].isspace():
+                j += 1
+            yield i, Other.Verbose.Whitespace, s[i:j]
+            i = j
+        elif verbose and c == "#":
+            j = s.find("\n", i)
+            if j == -1:
+                j = n
+            yield i, Other.Verbose.Comment, s[i:j]
+            i = j
+        elif c in SUSPICIOUS:
+            yield i, Other.Suspicious, c
+            i += 1
+        elif c == ".":
+            yield i, Other.Dot, c
+            i += 1
+        elif c == "^":
+            yield i, Other.Anchor.Beginning, c
+            i += 1
+        elif c == "$":
+            yield i, Other.Anchor.End, c
+            i += 1
+        elif c in REPETITIONS:
+            if s.startswith("?", i + 1):
+                yield i, REPETITIONS[c][1], s[i : i + 2]
+                i += 2
+            else:
+                yield i, REPETITIONS[c][0], c
+                i += 1
+        elif c == "{":
+            j = _scan_curly(s, i)
+            if j is None:
+                yield i, Other.UnescapedCurly, c
+                i += 1
+            else:
+                yield i, Other.Repetition.Curly, s[i:j]
+                i = j
+        elif c == "}":
+            yield i, Other.UnescapedCurly, c
+            i += 1
+        elif c == "-":
+            # Only reachable through the catch-all Literals rule.
+            j = i + 1
+            while j < n and s[j] not in "\\()|[]":
+                j += 1
+            yield i, Other.Literals, s[i:j]
+            i = j
+        else:
+            yield i, Other.Literal, c
+            i += 1
+
+
 class Node(object):
+    # Trees are built in bulk (one per pattern in every lexer), so nodes are
+    # slotted and link to their parent and next sibling directly instead of
+    # through weakrefs.
+    __slots__ = (
+        "type",
+        "data",
+        "end_data",
+        "children",
+        "start",
+        "parsed_start",
+        "end",
+        "parsed_end",
+        "_parent",
+        "_next",
+    )
+
     def __init__(self, t, start=None, parsed_start=None, data=None):
         self.type = t
         self.data = data  # type-dependent
@@ -54,9 +379,9 @@ class Node(object):
         self._next = None
 
     def add_child(self, obj):
-        obj._parent = weakref.ref(self)
+        obj._parent = self
         if self.children:
-            self.children[-1]._next = weakref.ref(obj)
+            self.children[-1]._next = obj
         self.children.append(obj)
 
     def close(self, pos, parsed_pos, data):
@@ -71,30 +396,23 @@ class Node(object):
             return self.next_no_children()
 
     def next_no_children(self):
-        # pylint: disable-msg=E1102
-        if self._next:
-            return self._next()
+        if self._next is not None:
+            return self._next
         p = self._parent
-        while p:
-            if p()._next:
-                return p()._next()
-            p = p()._parent
-        # pylint: enable-msg=E1102
+        while p is not None:
+            if p._next is not None:
+                return p._next
+            p = p._parent
 
     def parent(self):
-        if self._parent:
-            return self._parent()  # pylint: disable-msg=E1102
+        return self._parent
 
     def is_descentant_of(self, other):
-        # pylint: disable-msg=E1102
-        if self is other:
-            return True
-        p = self._parent
-        while p:
-            if p() is other:
+        p = self
+        while p is not None:
+            if p is other:
                 return True
-            p = p()._parent
-        # pylint: enable-msg=E1102
+            p = p._parent
 
     def reconstruct(self):
         """Return the regex string for this branch of the tree."""
@@ -130,6 +448,8 @@ class Node(object):
 
 
 class RootNode(Node):
+    __slots__ = ("raw", "flags", "effective_flags", "_nodes", "_by_type", "_index")
+
     def __init__(
         self,
         t,
@@ -144,89 +464,282 @@ class RootNode(Node):
         self.raw = raw
         self.flags = flags
         self.effective_flags = effective_flags
+        # Built on first use by find_by_type; trees aren't modified after
+        # they've been parsed.
+        self._nodes = None
+        self._by_type = None
+        self._index = None
+
+    def find_by_type(self, t):
+        """Returns the list of nodes matching `t`, which is anything accepted
+        by find_all_by_type (a token type, which also matches its subtypes, or
+        a tuple of exact types), in document order.
+
+        The first call walks the tree once to record where each exact token
+        type occurs; later queries only look at the types actually present.
+        The returned list is shared, don't modify it.
+        """
+        if self._index is None:
+            self._nodes = list(preorder(self))
+            self._by_type = {}
+            for i, node in enumerate(self._nodes):
+                try:
+                    self._by_type[node.type].append(i)
+                except KeyError:
+                    self._by_type[node.type] = [i]
+            self._index = {}
+
+        try:
+            return self._index[t]
+        except KeyError:
+            pass
+
+        positions = []
+        matched = 0
+        for ttype, indices in self._by_type.items():
+            if ttype in t:
+                positions.extend(indices)
+                matched += 1
+        if matched > 1:
+            positions.sort()
+        nodes = self._index[t] = [self._nodes[i] for i in positions]
+        return nodes
 
 
 class CharRange(object):
+    __slots__ = ("a", "b", "codepoint_a", "codepoint_b")
+
     def __init__(self, a, b):
         self.a = a
         self.b = b
         self.codepoint_a = eval_char(a.data)
         self.codepoint_b = eval_char(b.data)
 
+    @classmethod
+    def _from_codepoints(cls, a, b, codepoint_a, codepoint_b):
+        obj = cls.__new__(cls)
+        obj.a = a
+        obj.b = b
+        obj.codepoint_a = codepoint_a
+        obj.codepoint_b = codepoint_b
+        return obj
+
     def __repr__(self):
         return "<%s %r-%r>" % (self.__class__.__name__, self.a, self.b)
 
 
-class CharClass(Node):
-    def __init__(self, t, start=None, parsed_start=None):
-        super(CharClass, self).__init__(t, start, parsed_start)
-        self.negated = False
-        self.chars = None
-        self.matching_character_codes = None
+class ClassInfo(object):
+    """
+    What the text of a character class means, shared by every CharClass
+    written the same way.
+
+    `layout` says how to make `chars` out of the children: an int is the index
+    of a child that's an item by itself, and (i, j, codepoint_i, codepoint_j)
+    a range from child i to child j.  `items` has one (codes, order) per item,
+    in order, since one of the checkers cares about order; `order` is None
+    when the codes are listed in ascending order.  The code sets and code list
+    are filled in by CharClass on first use; `unicode_code_sets` is indexed by
+    ignorecase.
+    """
 
-    def close(self, pos, parsed_pos, data):
-        super(CharClass, self).close(pos, parsed_pos, data)
+    __slots__ = ("negated", "layout", "items", "code_set", "codes", "unicode_code_sets")
+
+    def __init__(self, children):
+        self.negated = False
+        self.layout = []
+        self.code_set = None
+        self.codes = None
+        self.unicode_code_sets = [None, None]
 
         n = []
-        it = iter(self.children)
-        for child in it:
-            c = child.data
+        it = iter(range(len(children)))
+        for i in it:
+            c = children[i].data
             if not n and c == "^":
                 # caret is special only when the first char
                 self.negated = True
             elif c == "-":
                 # dash is special only when it's the first char or directly
                 # follows another range (say, [0-9-x]).
-                next_child = None
+                j = None
                 if n and not isinstance(n[-1], CharRange):
-                    try:
-                        next_child = next(it)
-                    except StopIteration:
-                        next_child = None
-                if next_child:
-                    n.append(CharRange(n.pop(), next_child))
+                    j = next(it, None)
+                if j is not None:
+                    n.append(CharRange(n.pop(), children[j]))
+                    self.layout[-1] = (self.layout[-1], j)
                 else:
-                    n.append(child)
+                    n.append(children[i])
+                    self.layout.append(i)
             else:
-                n.append(child)
-
-        # One of the checkers may care about order, so don't set-ify yet
-        self.matching_character_codes = []
-        for i in n:
-            if isinstance(i, CharRange):
-                self.matching_character_codes.extend(
-                    range(eval_char(i.a.data), eval_char(i.b.data) + 1)
-                )
-            elif i.data == r"\s":
-                self.matching_character_codes.extend(map(ord, WHITESPACE))
-            elif i.data == r"\w":
-                self.matching_character_codes.extend(map(ord, WORD))
-            elif i.data == r"\d":
-                self.matching_character_codes.extend(map(ord, DIGITS))
-            elif i.data == r"\S":
-                whitespace = set(map(ord, WHITESPACE))
-                self.matching_character_codes.extend(
-                    i for i in range(256) if i not in whitespace
-                )
-            elif i.data == r"\W":
-                word = set(map(ord, WORD))
-                self.matching_character_codes.extend(
-                    i for i in range(256) if i not in word
-                )
-            elif i.data == r"\D":
-                digits = set(map(ord, DIGITS))
-                self.matching_character_codes.extend(
-                    i for i in range(256) if i not in digits
+                n.append(children[i])
+                self.layout.append(i)
+
+        self.items = []
+        for k, item in enumerate(n):
+            if isinstance(item, CharRange):
+                a = item.codepoint_a
+                b = item.codepoint_b
+                if not isinstance(a, int) or not isinstance(b, int):
+                    # eval_char can return a str for an escaped non-ascii char
+                    raise TypeError("Can't make a range of %r-%r" % (a, b))
+                self.layout[k] += (a, b)
+                self.items.append((CodeSet.from_range(a, b), None))
+            elif item.data in CATEGORY_ITEMS:
+                self.items.append(CATEGORY_ITEMS[item.data])
+            else:
+                code = eval_char(item.data)
+                if isinstance(code, int):
+                    self.items.append((CodeSet.from_range(code, code), None))
+                else:
+                    self.items.append((None, (code,)))
+
+
+class CharClass(Node):
+    __slots__ = ("negated", "chars", "_items", "_info")
+
+    def __init__(self, t, start=None, parsed_start=None):
+        super(CharClass, self).__init__(t, start, parsed_start)
+        self.negated = False
+        self.chars = None
+        self._items = None
+        self._info = None
+
+    def close(self, pos, parsed_pos, data):
+        super(CharClass, self).close(pos, parsed_pos, data)
+
+        children = self.children
+        key = tuple(child.data for child in children)
+        info = CHARCLASS_CACHE.get(key)
+        if info is None:
+            info = ClassInfo(children)
+            CHARCLASS_CACHE.put(key, info)
+
+        # The items are this class's own nodes, so that positions are right.
+        chars = []
+        for i in info.layout:
+            if isinstance(i, tuple):
+                chars.append(
+                    CharRange._from_codepoints(children[i[0]], children[i[1]], *i[2:])
                 )
             else:
-                self.matching_character_codes.append(eval_char(i.data))
+                chars.append(children[i])
+        self.negated = info.negated
+        self.chars = chars
+        self._items = info.items
+        self._info = info
+
+    def item_code_sets(self):
+        """Returns a CodeSet for each item of `chars` (with categories as 8-bit
+        sets), or None for an item that eval_char gives a str for."""
+        return [codes for codes, _ in self._items]
+
+    def _legacy(self):
+        # Whether some item is an odd str from eval_char, which only compares
+        # equal to itself.
+        return any(codes is None for codes, _ in self._items)
+
+    def _union(self):
+        return CodeSet(
+            r for codes, _ in self._items if codes is not None for r in codes.ranges
+        )
+
+    @property
+    def code_set(self):
+        """The CodeSet of characters matched (ignoring flags).  Like the
+        traditional interpretation, negation is only within 0-255."""
+        if self._info.code_set is None:
+            union = self._union()
+            for codes, order in self._items:
+                if codes is None:
+                    union |= CodeSet.from_codes(map(ord, order))
+            if self.negated:
+                union = union.complement(0, 255)
+            self._info.code_set = union
+        return self._info.code_set
+
+    def unicode_code_set(self, ignorecase=False):
+        """Like code_set, but with categories and negation covering all of
+        Unicode, as they do in str patterns without re.ASCII.  With
+        `ignorecase`, every case form of the listed characters is included
+        before negating."""
+        ignorecase = bool(ignorecase)
+        codes = self._info.unicode_code_sets[ignorecase]
+        if codes is not None:
+            return codes
+        ranges = []
+        for char, (codes, order) in zip(self.chars, self._items):
+            if not isinstance(char, CharRange) and char.data in CATEGORY_ITEMS:
+                codes = unicode_category(char.data)
+            elif codes is None:
+                codes = CodeSet.from_codes(map(ord, order))
+            ranges.extend(codes.ranges)
+        codes = CodeSet(ranges)
+        if ignorecase:
+            codes = case_closure(codes)
+        if self.negated:
+            codes = codes.complement(0, MAX_CODE)
+        self._info.unicode_code_sets[ignorecase] = codes
+        return codes
+
+    @property
+    def matching_character_codes(self):
+        """A list of the codes matched, with repeats, in the order they're
+        written (or ascending, if negated).  This is built on first use and
+        is as long as the class is wide; prefer code_set.  It's shared by every
+        class with the same text, don't modify it."""
+        info = self._info
+        if info.codes is None:
+            if self.negated:
+                info.codes = list(self._union().complement(0, 255))
+            else:
+                info.codes = []
+                for codes, order in self._items:
+                    info.codes.extend(codes if order is None else order)
+        return info.codes
 
+    def code_count(self):
+        """Returns len(self.matching_character_codes), cheaply."""
         if self.negated:
-            # destroys order :(
-            self.matching_character_codes = list(
-                set(range(256)) - set(self.matching_character_codes)
-            )
-        self.chars = n
+            return 256 - len(self._union() & BYTE_CODES)
+        return sum(
+            len(codes) if order is None else len(order)
+            for codes, order in self._items
+        )
+
+    def duplicate_codes(self):
+        """Returns the codes that more than one item matches, in the order of
+        their first occurrence in matching_character_codes."""
+        if self.negated:
+            return []
+        if self._legacy():
+            counts = {}
+            for i in self.matching_character_codes:
+                counts.setdefault(i, 0)
+                counts[i] += 1
+            return [k for k, v in counts.items() if v > 1]
+
+        # Sweep over every item's ranges in order of where they start; any
+        # part of one that's below the furthest end seen so far is a repeat.
+        dupes = []
+        reach = -1
+        for lo, hi in sorted(r for codes, _ in self._items for r in codes.ranges):
+            if lo <= reach:
+                dupes.append((lo, min(hi, reach)))
+            reach = max(reach, hi)
+        if not dupes:
+            return []
+
+        dupes = CodeSet(dupes)
+        result = []
+        reported = set()
+        for codes, order in self._items:
+            if order is None:
+                order = codes & dupes
+            for c in order:
+                if c in dupes and c not in reported:
+                    reported.add(c)
+                    result.append(c)
+        return result
 
     def reconstruct(self):
         return "[%s%s]" % (
@@ -239,6 +752,8 @@ class CharClass(Node):
 
 
 class Repetition(Node):
+    __slots__ = ("min", "max", "greedy")
+
     def __init__(self, t, start=None, parsed_start=None, data=None):
         super(Repetition, self).__init__(t, start, parsed_start, data)
         self.min = None
@@ -277,6 +792,9 @@ class VerboseRegexTryAgain(Exception):
 
 
 class BaseRegex(object):
+    # When true (and `tokens` is unmodified), trees are built from scan_regex
+    # rather than the slower RegexLexer token stream.
+    use_scanner = True
 
     tokens = {
         "root": [
@@ -366,6 +884,20 @@ class BaseRegex(object):
 
     @classmethod
     def get_parse_tree(cls, s, flags=0):
+        """Returns the parse tree for pattern `s` compiled with `flags`.
+
+        Trees are cached in PARSE_CACHE and shared between callers, so they
+        must be treated as read-only.
+        """
+        key = (cls, s, flags)
+        tree = PARSE_CACHE.get(key)
+        if tree is None:
+            tree = cls._parse(s, flags)
+            PARSE_CACHE.put(key, tree)
+        return tree
+
+    @classmethod
+    def _parse(cls, s, flags):
         pat = sre_parse.parse(s, flags)
         try:
             effective_flags = pat.pattern.flags
@@ -376,6 +908,15 @@ class BaseRegex(object):
             return VerboseRegex._get_parse_tree(s, flags, effective_flags)
         return cls._get_parse_tree(s, flags, effective_flags)
 
+    @classmethod
+    def _tokenize(cls, s):
+        if cls.use_scanner and cls.tokens is BaseRegex.tokens:
+            return scan_regex(s)
+        elif cls.use_scanner and cls.tokens is VerboseRegex.tokens:
+            return scan_regex(s, verbose=True)
+        # Fallback for subclasses that change the token definitions.
+        return cls().get_tokens_unprocessed(s)  # pylint: disable-msg=E1101
+
     @classmethod
     def _get_parse_tree(cls, s, flags, effective_flags):
         n = RootNode(
@@ -400,9 +941,7 @@ class BaseRegex(object):
         data = ""
 
         # i, j are the raw position and parsed position, respectively.
-        for i, ttype, data in cls().get_tokens_unprocessed(
-            s
-        ):  # pylint: disable-msg=E1101
+        for i, ttype, data in cls._tokenize(s):
             # print i, ttype, data
             if not data:
                 continue  # HACK for '' match for [][]
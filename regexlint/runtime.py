@@ -0,0 +1,377 @@
+# Copyright 2018 Tim Hatch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Running lexers on sample text, to see what their rules do there.
+
+A RegexLexer tries the (match, action, new_state) tuples in self._tokens, which
+it builds from the class's tokens by compiling each rule and splicing the rules
+of included states in.  LexerRun gives one instance its own copy of that dict
+with each match function wrapped, so the work can be credited to the rule in
+the source it came from.  Other instances (like the ones using(this) makes)
+aren't counted.
+"""
+
+import fnmatch
+import os
+import time
+from collections import Counter
+
+from pygments.lexer import combined, include
+from pygments.token import Error
+
+from regexlint.indicator import find_offending_line
+from regexlint.util import all_tokendefs
+
+__all__ = [
+    "LexerBench",
+    "LexerRun",
+    "RuleStats",
+    "included_states",
+    "lexer_matches",
+    "read_corpus",
+    "rule_location",
+    "rule_origins",
+    "write_bench",
+    "write_coverage",
+    "write_profile",
+]
+
+
+class RuleStats(object):
+    """What one rule did: how many times it was tried, how many of those it
+    matched, and the seconds spent trying."""
+
+    __slots__ = ("attempts", "hits", "seconds")
+
+    def __init__(self):
+        self.attempts = 0
+        self.hits = 0
+        self.seconds = 0.0
+
+
+def included_states(tokendefs):
+    """Returns the names of the states whose rules are only used as part of
+    another state, with include() or combined()."""
+    names = set()
+    for tdefs in tokendefs.values():
+        if not isinstance(tdefs, list):
+            continue
+        for tdef in tdefs:
+            if isinstance(tdef, include):
+                names.add(str(tdef))
+            elif isinstance(tdef, tuple) and len(tdef) > 2:
+                if isinstance(tdef[2], combined):
+                    names.update(tdef[2])
+    return names
+
+
+def rule_origins(cls, processed):
+    """Returns a dict from the id of each rule tuple in `processed` (the
+    _tokens of an instance of `cls`) to the (state, index) of the rule it was
+    made from, as lexer_tokens() numbers them.
+
+    Included rules are the same tuples as in the state they're from, so this
+    only has to find each state's own rules, skipping over the included ones
+    the way RegexLexerMeta._process_state spliced them in.  States that `cls`
+    inherits without defining are found in the superclass."""
+    tokendefs = all_tokendefs(cls)
+    origins = {}
+    for state, tdefs in tokendefs.items():
+        rules = processed.get(state)
+        if not isinstance(tdefs, list) or rules is None:
+            continue
+        k = 0
+        for i, tdef in enumerate(tdefs):
+            if isinstance(tdef, include):
+                k += len(processed.get(str(tdef), ()))
+            elif isinstance(tdef, tuple) or hasattr(tdef, "state"):
+                if k < len(rules):
+                    origins[id(rules[k])] = (state, i)
+                k += 1
+            # Anything else is an inherit that wasn't spliced.
+    return origins
+
+
+class LexerRun(object):
+    """An instance of the RegexLexer subclass `cls`, whose rules are counted in
+    `stats`, a dict from (state, index) in the source to RuleStats, as it lexes
+    what's given to run().  `entered` counts the positions lexed in each
+    state."""
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.lexer = cls()
+        self.tokendefs = all_tokendefs(cls)
+        self.stats = {}
+        self.entered = Counter()
+        self.files = 0
+        self.chars = 0
+        self.seconds = 0.0
+
+        processed = self.lexer._tokens
+        origins = rule_origins(cls, processed)
+        tokens = {}
+        for state, rules in processed.items():
+            wrapped = []
+            for rule in rules:
+                origin = origins.get(id(rule))
+                if origin is None:
+                    wrapped.append(rule)
+                    continue
+                stats = self.stats.get(origin)
+                if stats is None:
+                    stats = self.stats[origin] = RuleStats()
+                wrapped.append((_counting(rule[0], stats),) + rule[1:])
+            if wrapped:
+                first = wrapped[0]
+                wrapped[0] = (_entering(first[0], self.entered, state),) + first[1:]
+            tokens[state] = wrapped
+        self.lexer._tokens = tokens
+
+    def run(self, text):
+        """Lexes `text`, counting as it goes."""
+        start = time.perf_counter()
+        for _ in self.lexer.get_tokens_unprocessed(text):
+            pass
+        self.seconds += time.perf_counter() - start
+        self.files += 1
+        self.chars += len(text)
+
+    def never_entered(self):
+        """Returns the states, in the order they're defined, that lexing never
+        got into, leaving out the ones only used through other states."""
+        included = included_states(self.tokendefs)
+        return [
+            state
+            for state in self.tokendefs
+            if state not in included and not self.entered[state]
+        ]
+
+    def never_matched(self):
+        """Returns (state, index, stats) for the rules, in the order they're
+        defined, that never matched, leaving out the states never_entered()
+        reports."""
+        skipped = set(self.never_entered())
+        return [
+            (state, i, self.stats[state, i])
+            for state in self.tokendefs
+            if state not in skipped
+            for i in range(len(self.tokendefs[state]))
+            if (state, i) in self.stats and not self.stats[state, i].hits
+        ]
+
+
+class LexerBench(object):
+    """An instance of the RegexLexer subclass `cls` that times what's given
+    to run(), and counts the Error tokens it makes.  `fallbacks` counts
+    (state, char) for the ones RegexLexer made because no rule matched.
+
+    Only the last rule of each state is wrapped, to remember where it last
+    failed, so the timing is close to the real thing.  An Error token at that
+    position has to be the fallback."""
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.lexer = cls()
+        self.files = 0
+        self.chars = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.errors = 0
+        self.fallbacks = Counter()
+        # The state and position where a last rule last failed.
+        self.failed = [None, None]
+
+        tokens = {}
+        for state, rules in self.lexer._tokens.items():
+            rules = list(rules)
+            if rules:
+                last = rules[-1]
+                rules[-1] = (_failing(last[0], self.failed, state),) + last[1:]
+            tokens[state] = rules
+        self.lexer._tokens = tokens
+
+    def matches(self, filename):
+        """Returns whether `filename` is one the lexer says it's for."""
+        return lexer_matches(self.cls, filename)
+
+    def run(self, text):
+        """Lexes `text`, counting the errors."""
+        errors = 0
+        failed = self.failed
+        start = time.perf_counter()
+        for pos, token, value in self.lexer.get_tokens_unprocessed(text):
+            if token in Error:
+                errors += 1
+                if failed[1] == pos and len(value) == 1:
+                    self.fallbacks[failed[0], value] += 1
+        self.seconds += time.perf_counter() - start
+        self.errors += errors
+        self.files += 1
+        self.chars += len(text)
+        self.bytes += len(text.encode("utf-8", "surrogatepass"))
+
+    def summary(self):
+        """Returns a dict of the totals, with errors per KB and chars per
+        second."""
+        return {
+            "files": self.files,
+            "chars": self.chars,
+            "seconds": self.seconds,
+            "errors": self.errors,
+            "errors_per_kb": 1024.0 * self.errors / self.bytes if self.bytes else 0.0,
+            "chars_per_second": self.chars / self.seconds if self.seconds else 0.0,
+        }
+
+
+def lexer_matches(cls, filename):
+    """Returns whether `filename` is one the lexer class `cls` says it's
+    for."""
+    name = os.path.basename(filename)
+    return any(fnmatch.fnmatch(name, glob) for glob in cls.filenames)
+
+
+def _failing(rexmatch, failed, state):
+    def match(text, pos):
+        m = rexmatch(text, pos)
+        if m is None:
+            failed[0] = state
+            failed[1] = pos
+        return m
+
+    return match
+
+
+def _entering(rexmatch, entered, state):
+    # Every position in a state starts by trying its first rule.
+    def match(text, pos):
+        entered[state] += 1
+        return rexmatch(text, pos)
+
+    return match
+
+
+def _counting(rexmatch, stats):
+    clock = time.perf_counter
+
+    def match(text, pos):
+        start = clock()
+        m = rexmatch(text, pos)
+        stats.seconds += clock() - start
+        stats.attempts += 1
+        if m:
+            stats.hits += 1
+        return m
+
+    return match
+
+
+def read_corpus(paths):
+    """Yields (path, text) for each of the files in `paths`, looking in
+    directories recursively (in sorted order).  Files are decoded as UTF-8,
+    replacing what doesn't decode."""
+    for p in paths:
+        if os.path.isdir(p):
+            for dirpath, dirnames, filenames in os.walk(p):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    filename = os.path.join(dirpath, name)
+                    yield filename, _read(filename)
+        else:
+            yield p, _read(p)
+
+
+def _read(filename):
+    with open(filename, "rb") as f:
+        return f.read().decode("utf-8", "replace")
+
+
+def rule_location(mod_path, lexer_name, state, i):
+    """Returns where rule `i` of `state` is, in the same "file:line (Lexer:
+    state:pat#N)" form as findings."""
+    found = find_offending_line(mod_path, lexer_name, state, i, 0)
+    line = "%s:" % found[0] if found else ""
+    return "%s:%s (%s:%s:pat#%d)" % (mod_path, line, lexer_name, state, i + 1)
+
+
+def write_profile(run, lexer_name, mod_path, limit, stream):
+    """Writes a table of the rules of `run` that took the most time (all of
+    them if `limit` is 0), with the source line of each."""
+    total = sum(s.seconds for s in run.stats.values())
+    stream.write(
+        "%s: %d files, %d chars in %.2fs (%.2fs matching)\n"
+        % (lexer_name, run.files, run.chars, run.seconds, total)
+    )
+    ranked = sorted(run.stats.items(), key=lambda item: -item[1].seconds)
+    if limit:
+        ranked = ranked[:limit]
+    stream.write(
+        "%9s %6s %10s %10s  %s\n" % ("seconds", "share", "attempts", "hits", "rule")
+    )
+    for (state, i), s in ranked:
+        stream.write(
+            "%9.4f %5.1f%% %10d %10d  %s\n"
+            % (
+                s.seconds,
+                100.0 * s.seconds / total if total else 0.0,
+                s.attempts,
+                s.hits,
+                rule_location(mod_path, lexer_name, state, i),
+            )
+        )
+
+
+def write_coverage(run, lexer_name, mod_path, stream):
+    """Writes the states of `run` that were never entered, and the rules that
+    never matched."""
+    states = run.never_entered()
+    rules = run.never_matched()
+    stream.write(
+        "%s: %d of %d rules never matched, %d of %d states never entered\n"
+        % (lexer_name, len(rules), len(run.stats), len(states), len(run.tokendefs))
+    )
+    for state in states:
+        # Located by its first rule.
+        found = find_offending_line(mod_path, lexer_name, state, 0, 0)
+        line = "%s:" % found[0] if found else ""
+        stream.write(
+            "%s:%s (%s:%s) never entered\n" % (mod_path, line, lexer_name, state)
+        )
+    for state, i, stats in rules:
+        if stats.attempts:
+            why = "never matched in %d tries" % stats.attempts
+        else:
+            why = "never tried"
+        stream.write("%s %s\n" % (rule_location(mod_path, lexer_name, state, i), why))
+
+
+def write_bench(bench, lexer_name, top, stream):
+    """Writes the totals of `bench`, and the `top` states and characters
+    where the fallback fired most."""
+    d = bench.summary()
+    stream.write(
+        "%s: %d files, %d chars in %.2fs, %.0f chars/s, %d errors (%.2f per KB)\n"
+        % (
+            lexer_name,
+            d["files"],
+            d["chars"],
+            d["seconds"],
+            d["chars_per_second"],
+            d["errors"],
+            d["errors_per_kb"],
+        )
+    )
+    for (state, char), count in bench.fallbacks.most_common(top):
+        stream.write("  %8d  no rule in %s matched %r\n" % (count, state, char))
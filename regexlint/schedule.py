@@ -0,0 +1,135 @@
+# Copyright 2018 Tim Hatch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Splits the lexers given to cmdline into jobs of roughly even cost.
+
+A job is the argument tuple for cmdline.check_lexer_map, whose last entry
+(`parts`) is either None for a whole lexer, or a list of (state, start, stop)
+slices of the lexer's rules.  Costs are in seconds, taken from the timings of
+a previous run when the result cache has them, and otherwise estimated from
+the number and length of the patterns.
+"""
+
+from pygments.lexer import words
+
+from regexlint.util import lexer_tokens
+
+# Rough seconds per rule and per pattern character, fitted to the Pygments
+# lexer set.
+RULE_COST = 0.001
+CHAR_COST = 0.000015
+
+# How many jobs each process should get from an evenly split workload; more
+# means a better balanced tail, at the price of more round trips.
+JOBS_PER_PROCESS = 4
+
+
+def timing_key(cls, state=None):
+    key = "%s.%s" % (cls.__module__, cls.__name__)
+    if state is not None:
+        key += ":" + state
+    return key
+
+
+def rule_cost(pat):
+    cost = RULE_COST
+    if isinstance(pat, tuple):
+        regex = pat[0]
+        if isinstance(regex, words):
+            cost += CHAR_COST * sum(len(w) for w in regex.words)
+        elif isinstance(regex, str):
+            cost += CHAR_COST * len(regex)
+    return cost
+
+
+def estimate_costs(tokens):
+    """Returns {state: [cost of each rule]}, or None if some state isn't a
+    list of rules (check_lexer won't look past those)."""
+    costs = {}
+    for state, pats in tokens.items():
+        if not isinstance(pats, list):
+            return None
+        costs[state] = [rule_cost(pat) for pat in pats]
+    return costs
+
+
+def split_rules(state, costs, target):
+    """Yields (state, start, stop) slices of consecutive rules costing about
+    `target` each."""
+    start = 0
+    total = 0.0
+    for i, cost in enumerate(costs):
+        if total and total + cost > target:
+            yield (state, start, i)
+            start = i
+            total = 0.0
+        total += cost
+    yield (state, start, len(costs))
+
+
+def plan_lexer(args, timings, target):
+    """Returns a list of (args, cost) jobs for one lexer."""
+    cls = args[1]
+    tokens = lexer_tokens(cls)
+    costs = estimate_costs(tokens)
+    if costs is None:
+        return [(args + (None,), timings.get(timing_key(cls), RULE_COST))]
+
+    estimate = sum(sum(c) for c in costs.values())
+    lexer_cost = timings.get(timing_key(cls), estimate)
+    if lexer_cost <= target:
+        return [(args + (None,), lexer_cost)]
+
+    jobs = []
+    for state, rule_costs in costs.items():
+        state_estimate = sum(rule_costs)
+        state_cost = timings.get(timing_key(cls, state))
+        if state_cost is None:
+            state_cost = state_estimate * lexer_cost / (estimate or 1)
+        if state_cost <= target or len(rule_costs) < 2:
+            jobs.append((args + ([(state, 0, None)],), state_cost))
+            continue
+        # Scale the per-rule estimates so they add up to the state's cost.
+        scale = state_cost / (state_estimate or 1)
+        for part in split_rules(state, [c * scale for c in rule_costs], target):
+            part_cost = sum(rule_costs[part[1] : part[2]]) * scale
+            jobs.append((args + ([part],), part_cost))
+    return jobs
+
+
+def plan_jobs(items, processes, timings=None):
+    """Turns check_lexer_map arguments (lexer tuples, or strings that are
+    passed through) into a list of (lexer_number, job, cost), in output order.
+
+    Lexers costing more than an even share of the work are split into
+    per-state jobs, and states that are still too big into runs of rules.
+    With a single process nothing is split.
+    """
+    timings = timings or {}
+    planned = []
+    for item in items:
+        if isinstance(item, str):
+            planned.append([(item, 0.0)])
+        else:
+            planned.append(plan_lexer(item, timings, float("inf")))
+
+    if processes > 1:
+        total = sum(cost for jobs in planned for _, cost in jobs)
+        target = total / (processes * JOBS_PER_PROCESS)
+        for i, item in enumerate(items):
+            if not isinstance(item, str) and planned[i][0][1] > target:
+                planned[i] = plan_lexer(item, timings, target)
+
+    return [(n, job, cost) for n, jobs in enumerate(planned) for job, cost in jobs]
@@ -13,9 +13,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import OrderedDict
 from os import path
 from ast import literal_eval
 
+from pygments.lexer import include, inherit
 from pygments.token import Other
 
 
@@ -28,10 +30,23 @@ def find_all(first, second=None):
         regex = regex.next()
 
 
+def preorder(root):
+    """Yields the same nodes as find_all(root), but walks the children lists
+    directly instead of following next() links."""
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        if node.children:
+            stack.extend(reversed(node.children))
+
+
 def find_all_by_type(regex_root, t):
-    for regex in find_all(regex_root):
-        if regex.type in t:
-            yield regex
+    """Finds all nodes (inorder) under regex_root whose type is in `t`.  For a
+    parse tree root, this is answered from its type index."""
+    if hasattr(regex_root, "find_by_type"):
+        return iter(regex_root.find_by_type(t))
+    return (regex for regex in find_all(regex_root) if regex.type in t)
 
 
 def between(first, second):
@@ -115,9 +130,77 @@ def width(tok):
         return True
 
 
+# The escapes that stand for one character in a str literal, by what follows
+# the backslash.
+SIMPLE_ESCAPES = {
+    "a": 7,
+    "b": 8,
+    "t": 9,
+    "n": 10,
+    "v": 11,
+    "f": 12,
+    "r": 13,
+    "\\": 92,
+    "'": 39,
+}
+# How many hex digits each numeric escape takes.
+HEX_ESCAPE_DIGITS = {"x": 2, "u": 4, "U": 8}
+HEX_CHARS = frozenset("0123456789abcdefABCDEF")
+OCT_CHARS = frozenset("01234567")
+
+
+def _escape_codes():
+    """Returns what eval_char gives for a backslash and each printable ASCII
+    char."""
+    codes = {}
+    for i in range(32, 128):
+        c = chr(i)
+        if c in SIMPLE_ESCAPES:
+            codes["\\" + c] = SIMPLE_ESCAPES[c]
+        elif c in OCT_CHARS:
+            codes["\\" + c] = int(c, 8)
+        elif c not in HEX_ESCAPE_DIGITS:
+            # unnecessary backslash
+            codes["\\" + c] = i
+    # Hack for truncated unicode due to matching as Suspicious
+    codes["\\u"] = ord("u")
+    return codes
+
+
+ESCAPE_CODES = _escape_codes()
+
+
 def eval_char(c):
     """Returns the character code of the string s, which may contain
-    escapes."""
+    escapes.
+
+    Escapes are decoded like str literals do, from ESCAPE_CODES or their
+    digits; an unnecessary backslash before a non-ascii char gives the char
+    back as a str.  Anything else is left to _literal_eval_char, so malformed
+    escapes raise the same errors as always.
+    """
+    if len(c) == 1:
+        return ord(c)
+    code = ESCAPE_CODES.get(c)
+    if code is not None:
+        return code
+    if c[0] == "\\":
+        if len(c) == 2 and c[1] >= "\x80":
+            return c[1]
+        digits = c[2:]
+        if len(digits) == HEX_ESCAPE_DIGITS.get(c[1]):
+            if HEX_CHARS.issuperset(digits):
+                code = int(digits, 16)
+                if code <= 0x10FFFF:
+                    return code
+        elif len(c) <= 4 and OCT_CHARS.issuperset(c[1:]):
+            return int(c[1:], 8)
+    return _literal_eval_char(c)
+
+
+def _literal_eval_char(c):
+    # eval_char as it was before ESCAPE_CODES, which lets Python decode the
+    # escape.
     if len(c) == 1:
         return ord(c)
     elif c[-1] == "'":
@@ -222,6 +305,92 @@ def get_module_text(mod):
     return mod_text
 
 
+def lexer_tokens(cls):
+    """Returns the same dict as cls().tokens, without instantiating cls.
+
+    Instantiating a RegexLexer compiles every rule, and resolves `inherit` by
+    splicing the superclass rules into the class's own lists.  This does the
+    same splicing the way RegexLexerMeta.get_tokendefs does, but on copies, so
+    the class is left alone.  Lists that have already been spliced (by
+    instantiating cls, or a subclass that shares them) are returned as they
+    are.
+    """
+    mro = cls.__mro__
+    for i, c in enumerate(mro):
+        if "tokens" in c.__dict__:
+            tokens = c.__dict__["tokens"]
+            supers = mro[i + 1 :]
+            break
+    else:
+        return cls.tokens
+
+    if getattr(cls, "token_variants", False):
+        # These are processed per-variant at instantiation time.
+        return tokens
+
+    if "_tokens" in cls.__dict__:
+        return dict(tokens)
+
+    resolved = {}
+    for state, items in tokens.items():
+        resolved[state] = items
+        if not isinstance(items, list) or inherit not in items:
+            continue
+        if _spliced(items, state, supers):
+            continue
+        items = list(items)
+        inherit_ndx = items.index(inherit)
+        for c in supers:
+            super_items = c.__dict__.get("tokens", {}).get(state)
+            if super_items is None:
+                continue
+            items[inherit_ndx : inherit_ndx + 1] = super_items
+            try:
+                inherit_ndx += super_items.index(inherit)
+            except ValueError:
+                break
+        resolved[state] = items
+    return resolved
+
+
+def _spliced(items, state, supers):
+    # Whether the rules of the nearest superclass that defines `state` are
+    # already in `items`.  An inherit is left behind when the last one spliced
+    # had one too.
+    for c in supers:
+        super_items = c.__dict__.get("tokens", {}).get(state)
+        if super_items is not None:
+            ids = set(id(item) for item in items if item is not inherit)
+            return any(id(item) in ids for item in super_items)
+    return False
+
+
+def all_tokendefs(cls):
+    """Returns lexer_tokens() for every state of `cls`, including the ones it
+    inherits without defining."""
+    tokendefs = {}
+    for c in reversed(cls.__mro__):
+        if "tokens" in c.__dict__:
+            tokendefs.update(lexer_tokens(c))
+    return tokendefs
+
+
+def effective_rules(tokendefs, state, _outer=()):
+    """Returns (state, index, rule) for the rules a RegexLexer tries in
+    `state`, in order, with the rules of include()d states spliced in."""
+    rules = []
+    tdefs = tokendefs.get(state)
+    if not isinstance(tdefs, list) or state in _outer:
+        return rules
+    for i, tdef in enumerate(tdefs):
+        if isinstance(tdef, include):
+            rules.extend(effective_rules(tokendefs, str(tdef), _outer + (state,)))
+        elif isinstance(tdef, tuple) or hasattr(tdef, "state"):
+            # Anything else is an inherit with nothing to inherit.
+            rules.append((state, i, tdef))
+    return rules
+
+
 def rindex(a, x):
     for i in range(len(a) - 1, -1, -1):
         if a[i] == x:
@@ -278,3 +447,52 @@ def lowercase_code(i):
     if 65 <= i <= 90:
         return i + 32
     return i
+
+
+class LRUCache(object):
+    """A dict-like cache that holds at most `maxsize` entries, evicting the
+    least recently used one when full.  A maxsize of None means unbounded,
+    and 0 disables caching.  `hits` and `misses` count lookups with get()."""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.maxsize == 0:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        self._evict()
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        self._evict()
+
+    def clear(self):
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def _evict(self):
+        if self.maxsize is not None:
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
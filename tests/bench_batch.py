@@ -0,0 +1,92 @@
+# Copyright 2018 Tim Hatch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Times the checkers on the rules of every Pygments RegexLexer, one lexer at a
+time as check_lexer does, with and without --batch.  "cold" starts with fresh
+parse trees and an empty simplification cache, "warm" runs again straight
+after; each is the best of a few tries.
+
+    python tests/bench_batch.py [plain|batch]
+"""
+
+import sys
+import time
+
+from pygments.lexer import Future, RegexLexer
+from pygments.lexers import find_lexer_class_by_name, get_all_lexers
+
+from regexlint import Regex, batch
+from regexlint.charclass import SIMPLIFY_CACHE
+from regexlint.checkers import run_all_checkers
+from regexlint.parser import CHARCLASS_CACHE, PARSE_CACHE
+from regexlint.util import lexer_tokens
+
+
+def collect():
+    jobs = []
+    for name, aliases, _, _ in get_all_lexers():
+        cls = find_lexer_class_by_name(aliases[0]) if aliases else None
+        if cls is None or not issubclass(cls, RegexLexer):
+            continue
+        items = []
+        for pats in lexer_tokens(cls).values():
+            if not isinstance(pats, list):
+                continue
+            for pat in pats:
+                if hasattr(pat, "state") or not isinstance(pat, tuple):
+                    continue
+                p = pat[0].get() if isinstance(pat[0], Future) else pat[0]
+                try:
+                    items.append((Regex.get_parse_tree(p, cls.flags), None))
+                except Exception:
+                    pass
+        jobs.append(items)
+    return jobs
+
+
+def plain(jobs):
+    return [[run_all_checkers(*item) for item in items] for items in jobs]
+
+
+def batched(jobs):
+    return [batch.run_all_checkers(items) for items in jobs]
+
+
+def main(argv, repeat=3):
+    modes = [("plain", plain), ("batch", batched)]
+    if argv:
+        modes = [m for m in modes if m[0] in argv]
+    for label, func in modes:
+        cold = warm = float("inf")
+        for _ in range(repeat):
+            PARSE_CACHE.clear()
+            CHARCLASS_CACHE.clear()
+            SIMPLIFY_CACHE.clear()
+            jobs = collect()
+            t0 = time.perf_counter()
+            func(jobs)
+            t1 = time.perf_counter()
+            func(jobs)
+            t2 = time.perf_counter()
+            cold = min(cold, t1 - t0)
+            warm = min(warm, t2 - t1)
+        print(
+            "%s: %d rules, cold %.2fs, warm %.2fs"
+            % (label, sum(map(len, jobs)), cold, warm)
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,45 @@
+# Copyright 2018 Tim Hatch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Times the table-driven unpack_bitvector and population against the
+bit-at-a-time loops they replaced, on a typical 8-bit character class.
+
+    python tests/bench_bitvector.py
+"""
+
+import timeit
+
+from test_bitvector import loop_population, loop_unpack_bitvector
+
+from regexlint.bitvector import bitvector, population, unpack_bitvector
+
+
+def main(number=200, repeat=3):
+    # Printable ascii minus a few.
+    bv = bitvector(range(32, 127)) & ~bitvector(map(ord, "\"'\\"))
+    for old, new in (
+        (loop_unpack_bitvector, unpack_bitvector),
+        (loop_population, population),
+    ):
+        old_time = min(timeit.repeat(lambda: old(bv), number=number, repeat=repeat))
+        new_time = min(timeit.repeat(lambda: new(bv), number=number, repeat=repeat))
+        print(
+            "%s: %.1fus -> %.1fus"
+            % (new.__name__, old_time * 1e6 / number, new_time * 1e6 / number)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# Copyright 2018 Tim Hatch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+
+import pytest
+
+from regexlint.automaton import TooBig, Unsupported, build, covers
+from regexlint.parser import Regex
+
+
+def nfa(pat, flags=0, exact=True):
+    return build(Regex.get_parse_tree(pat, flags), exact)
+
+
+def accepts(automaton, text):
+    states = automaton.closure([automaton.start])
+    for c in text:
+        states = automaton.closure(
+            [t for s in states for label, t in automaton.edges[s] if ord(c) in label]
+        )
+    return automaton.accept in states
+
+
+@pytest.mark.parametrize(
+    "pat,flags",
+    [
+        (r"ab|c", 0),
+        (r"a(b|cd)*e?", 0),
+        (r"[a-c]{2,3}x", 0),
+        (r"\d+\.\d*", 0),
+        (r"(?:if|else)\s", re.IGNORECASE),
+        (r".\n?", 0),
+    ],
+)
+def test_build(pat, flags):
+    automaton = nfa(pat, flags)
+    texts = ["", "a", "ab", "abe", "acdbe", "c", "aax", "abcax", "ABX", "1."]
+    texts += ["12.5", "If ", "ELSE\t", "x\n", "\n"]
+    for text in texts:
+        assert accepts(automaton, text) == bool(re.fullmatch(pat, text, flags))
+
+
+@pytest.mark.parametrize("pat", [r"^a", r"a\b", r"(?=a)a", r"(a)\1", r"a*+", r"\Ba"])
+def test_build_unsupported(pat):
+    with pytest.raises(Unsupported):
+        nfa(pat)
+    # What it matches is approximated instead.
+    assert accepts(nfa(pat, exact=False), "a")
+
+
+def test_build_dash_literals():
+    # The parser leaves "-?" as the text of one Literals node.
+    with pytest.raises(Unsupported):
+        nfa(r"-?b")
+    assert accepts(nfa(r"-?b", exact=False), "b")
+
+
+def test_build_too_big():
+    with pytest.raises(TooBig):
+        nfa(r"a{3000}")
+
+
+def test_examples():
+    automaton = nfa(r"x?(ab|c+)")
+    examples = list(automaton.examples())
+    assert sorted(examples) == ["ab", "c", "xab"]
+    assert list(nfa(r"a*").examples()) == ["", "a"]
+
+
+@pytest.mark.parametrize(
+    "covering,pat,expected",
+    [
+        ([r"\w+"], r"if\b", True),
+        ([r"if"], r"\w+", False),
+        ([r"a", r"b"], r"[ab]c", True),
+        ([r"ab"], r"a", False),
+        ([r"[^\n]*"], r"#.*\n", True),
+        ([r"a+b"], r"a*b", False),
+        ([r"a"], r"", False),
+    ],
+)
+def test_covers(covering, pat, expected):
+    assert covers([nfa(p) for p in covering], nfa(pat, exact=False)) is expected
+
+
+def test_covers_budget():
+    # Every prefix of the a's makes a different state.
+    assert covers([nfa(r"a{40}")], nfa(r"a{50}")) is True
+    assert covers([nfa(r"a{40}")], nfa(r"a{50}"), max_states=10) is None
@@ -0,0 +1,112 @@
+# Copyright 2018 Tim Hatch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+
+import pytest
+
+from pygments.token import Other
+
+from regexlint import Regex, batch, run_all_checkers
+from regexlint.charclass import SIMPLIFY_CACHE, simplify_unicode_charclass
+from regexlint.checkers import visited
+
+PATTERNS = [
+    r"[aa]",
+    r"[a-fa]",
+    r"[^aa]",
+    r"(?i)[a-fA-F0-9]",
+    r"(?i)[a-zA-Z_][a-z]",
+    r"[a-zA-Z_]",
+    r"[\s\xa0,]",
+    r"[\w\d]",
+    r"[\x00-\xff]",
+    r"[^\n]",
+    r"[ሴaa]",
+    r"[\é]",
+    r"[]a]",
+    r"(foo|)[ab]",
+    # Unicode classes simplified in batch too.
+    r'[^"\\]',
+    r"[^\x00-\x1f]",
+    r"[\w\W]",
+    r"(?i)[a-z_][^a-z0-9]",
+]
+
+ASCII_PATTERNS = [
+    r"[a-z0-9_]",
+    r"[^\w ]",
+    r"(?i)[^A-Za-z]",
+    r"(?i)[_a-zA-Z0-9]",
+    r"(?i)[a-zA-Z_][a-z]",
+    "[ሴa]",
+]
+
+
+def parse_all():
+    trees = [Regex.get_parse_tree(p) for p in PATTERNS]
+    trees += [Regex.get_parse_tree(p, re.ASCII) for p in ASCII_PATTERNS]
+    return [(reg, None) for reg in trees]
+
+
+def sort_errs(errs):
+    return sorted(errs, key=lambda k: (k[1], k[0]))
+
+
+def test_same_as_checkers():
+    pytest.importorskip("numpy")
+    items = parse_all()
+    SIMPLIFY_CACHE.clear()
+    expected = [sort_errs(run_all_checkers(reg)) for reg, _ in items]
+    SIMPLIFY_CACHE.clear()
+    actual = [sort_errs(errs) for errs in batch.run_all_checkers(items)]
+    assert expected == actual
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [
+        r"[^\n]",
+        r'[^"\\]',
+        r"[^\]\\]",
+        r"[^\x00-\x1f]",
+        r"[a-zA-Z0-9_]",
+        r"[\w\W]",
+        r"[\x00-\U0010ffff]",
+        r"[\x00-\xff\u0100-\U0010ffff]",
+        r"[^\x00-\x40]",
+        r"(?i)[a-z_]",
+        r"(?i)[^a-z0-9]",
+        r"(?i)[a-z\-]",
+    ],
+)
+def test_primes_unicode(pattern):
+    pytest.importorskip("numpy")
+    reg = Regex.get_parse_tree(pattern)
+    ignorecase = bool(reg.effective_flags & re.I)
+    SIMPLIFY_CACHE.clear()
+    batch.prime_simplify_cache([reg])
+    for cc in visited(reg, Other.CharClass):
+        codes = cc.unicode_code_set(ignorecase)
+        primed = SIMPLIFY_CACHE.get((True, codes, ignorecase))
+        assert primed is not None
+        assert primed == simplify_unicode_charclass(codes, ignorecase)
+
+
+def test_without_numpy(monkeypatch):
+    monkeypatch.setattr(batch, "numpy", None)
+    assert not batch.available()
+    items = parse_all()
+    expected = [run_all_checkers(reg) for reg, _ in items]
+    assert expected == batch.run_all_checkers(items)
@@ -12,9 +12,32 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import random
 from unittest import TestCase
 
-from regexlint.bitvector import bitvector, population, unpack_bitvector
+from regexlint.bitvector import bitvector, iter_bits, population, unpack_bitvector
+
+
+def loop_unpack_bitvector(bv):
+    # The original bit-at-a-time version, for comparison.
+    ret = []
+    code = 0
+    mask = 1
+    while mask <= bv:
+        if bv & mask:
+            ret.append(code)
+        code += 1
+        mask <<= 1
+    return ret
+
+
+def loop_population(i):
+    n = 0
+    while i:
+        if i & 1:
+            n += 1
+        i >>= 1
+    return n
 
 
 class BitvectorTests(TestCase):
@@ -41,3 +64,15 @@ class BitvectorTests(TestCase):
             x = bitvector(intermediate)
             print(i, intermediate)
             self.assertEqual(i, x)
+
+    def test_iter_bits(self):
+        self.assertEqual([], list(iter_bits(0)))
+        self.assertEqual([0, 9, 300], list(iter_bits(1 | 1 << 9 | 1 << 300)))
+
+    def test_against_loops(self):
+        rnd = random.Random(0)
+        for i in range(200):
+            bv = rnd.getrandbits(rnd.randint(0, 300))
+            self.assertEqual(loop_unpack_bitvector(bv), unpack_bitvector(bv))
+            self.assertEqual(loop_unpack_bitvector(bv), list(iter_bits(bv)))
+            self.assertEqual(loop_population(bv), population(bv))
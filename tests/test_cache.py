@@ -0,0 +1,87 @@
+# Copyright 2018 Tim Hatch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+from types import SimpleNamespace
+
+import pytest
+from pygments.lexer import default, words
+from pygments.token import Text
+
+from regexlint import cache
+from regexlint.cache import ResultCache, result_key, shadow_key
+
+
+def test_result_key():
+    base = result_key("a+", 0, None, True, False, False)
+    assert base == result_key("a+", 0, None, True, False, False)
+    assert base != result_key("a*", 0, None, True, False, False)
+    assert base != result_key("a+", 8, None, True, False, False)
+    assert base != result_key("a+", 0, (Text,), True, False, False)
+    assert base != result_key("a+", 0, None, False, False, False)
+    assert base != result_key("a+", 0, None, True, True, False)
+    assert base != result_key("a+", 0, None, True, False, True)
+    # Only whether each bygroups() entry is None matters.
+    assert result_key("(a)", 0, (Text, None), False, False, False) == result_key(
+        "(a)", 0, (Text.Other, None), False, False, False
+    )
+
+
+def test_shadow_key():
+    rules = [("root", 0, (r"\w+", Text)), ("space", 0, (r"\s+", Text))]
+    base = shadow_key("root", rules, 0)
+    no_tokens = [r[:2] + ((r[2][0], None),) for r in rules]
+    assert base == shadow_key("root", no_tokens, 0)
+    assert base != shadow_key("root", rules, 8)
+    assert base != shadow_key("root", rules[::-1], 0)
+    assert base != shadow_key("root", rules[:1], 0)
+    assert base != shadow_key("root", [("root", 1, rules[0][2])] + rules[1:], 0)
+    # A state that only include()s another has the same rules.
+    assert base != shadow_key("other", rules, 0)
+    assert shadow_key("root", [("root", 0, (words(["a", "b"]), Text))], 0) == (
+        shadow_key("root", [("root", 0, ("([ab])", Text))], 0)
+    )
+    assert shadow_key("root", [("root", 0, default("#pop"))], 0) != (
+        shadow_key("root", [("root", 0, ("", Text))], 0)
+    )
+
+
+def test_round_trip(tmp_path):
+    findings = [("101", logging.ERROR, 3, "Null")]
+    c = ResultCache(str(tmp_path / "cache"))
+    assert c.get("k") is None
+    c.put("k", findings)
+    c.flush()
+    c.close()
+
+    c = ResultCache(str(tmp_path / "cache"))
+    assert c.get("k") == findings
+    assert c.get("other") is None
+    assert (c.hits, c.misses) == (1, 1)
+
+
+@pytest.mark.parametrize("times", [[1.0, 2.0, 3.0], [5.0, 5.0, 5.0]])
+def test_prune(tmp_path, monkeypatch, times):
+    # Written at these times, rather than whatever the clock says.
+    clock = iter(times)
+    monkeypatch.setattr(cache, "time", SimpleNamespace(time=lambda: next(clock)))
+    c = ResultCache(str(tmp_path), max_entries=2)
+    for key in "abc":
+        c.put(key, [])
+        c.flush()
+    monkeypatch.undo()
+    c.prune()
+    assert c.get("a") is None
+    assert c.get("b") == []
+    assert c.get("c") == []
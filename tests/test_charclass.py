@@ -17,6 +17,7 @@ import re
 import pytest
 
 from regexlint.charclass import (
+    SIMPLIFY_CACHE,
     WontOptimize,
     build_output,
     charclass_score,
@@ -99,3 +100,84 @@ def test_caret_escaping2():
     assert not negated
     op = build_output(new_codes)
     assert op == "\\]\\^"
+
+
+UNICODE_EXAMPLES = [
+    (r"[a-z]", r"[a-z]"),
+    # \w means more than this in Unicode mode
+    (r"[a-zA-Z0-9_]", r"[a-zA-Z0-9_]"),
+    (r"[\w\d_]", r"[\w]"),
+    (r"[0-9a-f]", None),
+    (r"[\s\xa0]", r"[\s]"),
+    (r"[^\s\xa0]", r"[\S]"),
+    # Double negative, and a lot of whitespace
+    (
+        r"[^\S\n]",
+        r"[\t\x0b\x0c\r\x1c\x1d\x1e\x1f \u0085\u00a0\u1680\u2000-\u200a"
+        r"\u2028\u2029\u202f\u205f\u3000]",
+    ),
+    (r"[\x00-\U0010ffff]", r"[\w\W]"),
+    (r"[\u0100-\uffff\u0101]", r"[\u0100-\uffff]"),
+    (r"(?i)[a-zA-Z]", r"[a-z]"),
+    (r"(?i)[^a-z]", r"[^a-z]"),
+    (r'(?i)[^a-z"/]', r'[^a-z"/]'),
+    (r"[^\"]", r'[^"]'),
+]
+
+
+@pytest.mark.parametrize("the_input, the_output", UNICODE_EXAMPLES)
+def test_unicode_examples(the_input, the_output):
+    cc = first_charclass(the_input)
+    ignorecase = bool(effective_flags(the_input) & re.IGNORECASE)
+    codes = cc.unicode_code_set(ignorecase)
+
+    try:
+        new_codes, negated = simplify_charclass(codes, ignorecase, unicode=True)
+    except WontOptimize:
+        assert the_output is None
+        return
+
+    print("new_codes", new_codes, "built", repr(build_output(new_codes)))
+    assert the_output is not None
+    assert charclass_score(new_codes, negated) == charclass_score(
+        first_charclass(the_output)
+    )
+
+    # The suggestion matches the same characters.
+    flags = re.I if ignorecase else 0
+    suggestion = re.compile(
+        "[%s%s]" % ("^" if negated else "", build_output(new_codes)), flags
+    )
+    original = re.compile(the_input)
+    for i in list(range(0x3000)) + [0xFFEF, 0xFFFF, 0x10000, 0x10FFFF]:
+        assert bool(original.match(chr(i))) == bool(suggestion.match(chr(i))), i
+
+
+def test_unicode_code_set():
+    cc = first_charclass(r"[^\w\s]")
+    codes = cc.unicode_code_set()
+    assert 0x4E00 not in codes
+    assert 0x2000 not in codes
+    assert ord("-") in codes
+    assert 0xA0 in cc.code_set
+    assert 0xA0 not in codes
+
+
+def test_simplify_cache():
+    SIMPLIFY_CACHE.clear()
+    codes = list(map(ord, "abcdef"))
+    first, negated = simplify_charclass(codes)
+    assert ([(97, 102)], False) == (first, negated)
+    first.append("junk")
+    assert (first[:-1], negated) == simplify_charclass(codes)
+    assert 1 == SIMPLIFY_CACHE.hits
+
+    hex_codes = list(map(ord, "0123456789abcdef"))
+    for i in range(2):
+        with pytest.raises(WontOptimize):
+            simplify_charclass(hex_codes)
+    assert 2 == SIMPLIFY_CACHE.hits
+
+    # Unicode results are kept apart from 8-bit ones.
+    assert ([(97, 102)], False) == simplify_charclass(codes, unicode=True)
+    assert 2 == SIMPLIFY_CACHE.hits
@@ -17,8 +17,12 @@ import logging
 import re
 from unittest import TestCase
 
-from pygments.token import Name, Punctuation, Text, Token
+import pytest
+from pygments.lexer import default, include
+from pygments.token import Name, Other, Punctuation, Text, Token
 
+from regexlint import checkers
+from regexlint.analysis import Analysis
 from regexlint.checkers import (
     bygroups_check_no_capture_group_in_repetition,
     bygroups_check_no_python_named_capture_groups,
@@ -31,18 +35,23 @@ from regexlint.checkers import (
     check_charclass_negation,
     check_charclass_overlap,
     check_charclass_simplify,
+    check_exponential_backtracking,
     check_multiline_anchors,
     check_no_bels,
     check_no_consecutive_dots,
     check_no_empty_alternations,
     check_no_newlines,
     check_no_nulls,
+    check_polynomial_backtracking,
     check_prefix_ordering,
     check_redundant_repetition,
     check_single_character_classes,
     check_suspicious_anchors,
     check_unescaped_braces,
+    growth_exponent,
+    manual_check_for_backtracking,
     manual_check_for_empty_string_match,
+    manual_check_for_shadowed_rules,
     run_all_checkers,
 )
 from regexlint.parser import Regex, fmttree
@@ -256,6 +265,40 @@ class CheckersTests(TestCase):
         print(errs)
         self.assertEqual(len(errs), 1)
 
+    def test_run_all_checkers_matches_individual_checkers(self):
+        # run_all_checkers must find the same problems, in the same order, as
+        # calling each checker on its own.
+        import regexlint.checkers
+
+        for pat in (r"(?mi)(a|)[A-z0-9a]..^$", r"(x)(?P<y>z)+\s+[aa](a|ab){1}"):
+            r = Regex.get_parse_tree(pat)
+            expected = []
+            for k, f in vars(regexlint.checkers).items():
+                if k.startswith("check_"):
+                    f(r, expected)
+                elif k.startswith("bygroups_check_"):
+                    f(r, expected, (Text, None))
+            self.assertEqual(expected, run_all_checkers(r, (Text, None)))
+
+    def test_run_all_checkers_walks_once(self):
+        # The checkers share one traversal of the tree, the root's type index.
+        import regexlint.parser
+
+        walks = []
+        preorder = regexlint.parser.preorder
+
+        def counting_preorder(root):
+            walks.append(root)
+            return preorder(root)
+
+        r = Regex._parse(r"(?mi)(a|)[A-z0-9a]..^$(x)(?P<y>z)+\s+", 0)
+        regexlint.parser.preorder = counting_preorder
+        try:
+            run_all_checkers(r, (Text, None))
+        finally:
+            regexlint.parser.preorder = preorder
+        self.assertEqual([r], walks)
+
     def test_bygroups_check_overlap_success(self):
         r = Regex.get_parse_tree(r"(a)?(b)")
         print("\n".join(fmttree(r)))
@@ -723,6 +766,39 @@ class CheckersTests(TestCase):
         self.assertEqual(len(errs), 1)
         self.assertTrue("-> e" in errs[0][3], errs[0][3])
 
+    def test_charclass_simplify_metacharacter(self):
+        # The suggestion has to mean the same thing outside the class.
+        for pat, suggested, flags in [
+            (r"[\(]", r"\(", 0),
+            (r"[\.]", r"\.", 0),
+            (r"[\*]", r"\*", 0),
+            (r"[\*]", r"\*", re.A),
+            (r"[\#]", r"\#", re.X),
+        ]:
+            r = Regex.get_parse_tree(pat, flags)
+            errs = []
+            check_charclass_simplify(r, errs)
+            self.assertEqual(len(errs), 1, pat)
+            self.assertTrue(errs[0][3].endswith("-> " + suggested), errs[0][3])
+            self.assertEqual(re.compile(suggested, flags).pattern, suggested)
+            self.assertTrue(re.fullmatch(suggested, pat[-2], flags))
+
+    def test_charclass_simplify_unicode(self):
+        r = Regex.get_parse_tree(r"[\s\xa0,]", 0)
+        errs = []
+        check_charclass_simplify(r, errs)
+        print(errs)
+        self.assertEqual(len(errs), 1)
+        self.assertTrue("-> [\\s,]" in errs[0][3], errs[0][3])
+
+    def test_charclass_simplify_unicode_word(self):
+        # Not \w, which matches far more than ASCII in Unicode mode.
+        r = Regex.get_parse_tree(r"[a-zA-Z0-9_]", 0)
+        errs = []
+        check_charclass_simplify(r, errs)
+        print(errs)
+        self.assertEqual(len(errs), 0)
+
     def test_charclass_simplify_noop(self):
         r = Regex.get_parse_tree(r"[\d_]", 0)
         errs = []
@@ -787,3 +863,190 @@ class CheckersTests(TestCase):
         manual_check_for_empty_string_match(r, errs, (r"$\b", Token, "#pop"))
         print(errs)
         self.assertEqual(len(errs), 0)
+
+
+@pytest.mark.parametrize(
+    "pat,span",
+    [
+        (r"(a+)+x", "(a+)+"),
+        (r"(?:\w|\d)*$", r"(?:\w|\d)*"),
+        (r"x(.*?,)*y", "(.*?,)*"),
+        (r"(a+b?)+c", "(a+b?)+"),
+        (r"(?<=a)(a+)+x", "(a+)+"),
+        (r"(a|aa)*c", "(a|aa)*"),
+        (r"(?:a|b|ab)*$", "(?:a|b|ab)*"),
+        (r"(x|xy|y)*z", "(x|xy|y)*"),
+    ],
+)
+def test_exponential_backtracking(pat, span):
+    r = Regex.get_parse_tree(pat)
+    errs = []
+    check_exponential_backtracking(r, errs)
+    assert len(errs) == 1
+    assert " %s " % span in errs[0][3]
+
+
+@pytest.mark.parametrize(
+    "pat",
+    [
+        # Nothing after it can fail.
+        r"(a+)+",
+        r"/\*(?:[^*]|\*(?!/))*\*/",
+        r"\d+\.\d+x",
+        r"(ab+)+c",
+        r'"(?:\\.|[^"\\])*"',
+        r"(?:ab|cd)*e",
+    ],
+)
+def test_exponential_backtracking_ok(pat):
+    r = Regex.get_parse_tree(pat)
+    errs = []
+    check_exponential_backtracking(r, errs)
+    assert errs == []
+
+
+@pytest.mark.parametrize(
+    "pat,degree",
+    [
+        (r"\w+\s*\w+\(", 2),
+        (r".*,.*,.*;", 3),
+        # The lookahead doesn't stop .+? at \r.
+        (r"\s+.+?(?=[ \t])", 2),
+        (r"\s+.+?(?=\s)x", 2),
+    ],
+)
+def test_polynomial_backtracking(pat, degree):
+    r = Regex.get_parse_tree(pat)
+    errs = []
+    check_polynomial_backtracking(r, errs)
+    assert len(errs) == 1
+    assert "O(n^%d)" % degree in errs[0][3]
+
+
+@pytest.mark.parametrize(
+    "pat",
+    [
+        r"\w+\s+\w+\(",
+        r"\d+\.\d+x",
+        r"\w+\s*\w+",
+        # From CobolLexer; the lookahead stops .+? where \s+ could go on.
+        r"\s+.+?(?=(\s|\.\s))",
+        r"(PIC\s+.+?(?=(\s|\.\s))|BINARY)\s*($|(?=[^\w\-]))",
+        # Reported as exponential instead.
+        r"(a+a+)+b",
+    ],
+)
+def test_polynomial_backtracking_ok(pat):
+    r = Regex.get_parse_tree(pat)
+    errs = []
+    check_polynomial_backtracking(r, errs)
+    assert errs == []
+
+
+@pytest.mark.parametrize(
+    "pat,check,attack",
+    [
+        (r"(a+)+x", check_exponential_backtracking, ("", "a", "")),
+        (r"x(.*?,)*y", check_exponential_backtracking, ("x", ",", "")),
+        (r"(?:\w|\d)*$", check_exponential_backtracking, ("", "0", "!")),
+        (r"(x|xy|y)*z", check_exponential_backtracking, ("", "xy", "")),
+        (r"q\w+\s*\w+\(", check_polynomial_backtracking, ("q", "0", "")),
+        (r".*,.*,.*;", check_polynomial_backtracking, ("", ",\x00,\x00", "")),
+    ],
+)
+def test_attack(pat, check, attack):
+    r = Regex.get_parse_tree(pat)
+    errs = []
+    check(r, errs)
+    analysis = Analysis(r)
+    if check is check_exponential_backtracking:
+        nodes = [n for n in r.find_by_type(Other.Repetition) if n.start == errs[0][2]]
+    else:
+        (nodes,) = analysis.adjacent_chains(r)
+    assert analysis.attack(nodes) == attack
+
+
+def test_growth_exponent():
+    assert growth_exponent([(10, 0.001), (20, 0.004)]) == pytest.approx(2)
+    assert growth_exponent([(10, 0.00001), (20, 0.004)]) is None
+
+
+def test_manual_check_for_backtracking():
+    r = Regex.get_parse_tree(r"(a+)+x")
+    errs = []
+    check_exponential_backtracking(r, errs)
+    manual_check_for_backtracking(r, errs, timeout=2.0)
+    assert [e[:3] for e in errs] == [
+        ("126", logging.WARNING, 0),
+        ("128", logging.WARNING, 0),
+    ]
+    assert errs[1][3].startswith("Slow match confirmed: ")
+
+
+def test_manual_check_for_backtracking_child_fails(monkeypatch):
+    monkeypatch.setattr(checkers, "_TIMING_SCRIPT", "raise MemoryError")
+    r = Regex.get_parse_tree(r"(a+)+x")
+    errs = []
+    check_exponential_backtracking(r, errs)
+    manual_check_for_backtracking(r, errs, timeout=2.0)
+    assert errs[1] == (
+        "128", logging.INFO, 0, "Couldn't time the attack string: MemoryError"
+    )
+
+
+@pytest.mark.parametrize(
+    "pat,flags,first",
+    [
+        (r"abc", 0, "a"),
+        (r"a?b*c", 0, "abc"),
+        (r"(?:x|y)z|[0-9]", 0, "xy0123456789"),
+        (r"\bq", re.IGNORECASE, "qQ"),
+        (r"(?=a)b", 0, "b"),
+        (r"(a|\B)=", 0, "a="),
+    ],
+)
+def test_analysis_first(pat, flags, first):
+    r = Regex.get_parse_tree(pat, flags)
+    codes = Analysis(r).first(r)
+    assert "".join(map(chr, codes)) == "".join(sorted(first))
+
+
+def test_analysis_first_unknown():
+    r = Regex.get_parse_tree(r"(a)\1")
+    analysis = Analysis(r)
+    assert analysis.first(r) == analysis.chars(r.children[0])
+    r = Regex.get_parse_tree(r"(a)?\1")
+    analysis = Analysis(r)
+    assert analysis.first(r) == analysis.everything
+    r = Regex.get_parse_tree(r"-?b")
+    analysis = Analysis(r)
+    assert analysis.chars(r) is None
+    assert analysis.first(r) == analysis.everything
+
+
+def test_manual_check_for_shadowed_rules():
+    tokendefs = {
+        "root": [
+            include("space"),
+            (r"\w+", Name),
+            (r"(if|else)\b", Name.Builtin),
+            (r"\d+", Name),
+            (r"[ \t]", Text),
+            (r"\w+\(", Name.Function),
+            (r"@", Text),
+            (r"[,:]", Punctuation),
+            (r"[@,:]", Punctuation),
+        ],
+        "space": [(r"\s+", Text)],
+        "default": [(r"x\b", Name), default("#pop"), (r"y", Name)],
+    }
+    found = manual_check_for_shadowed_rules(tokendefs, "root", 0)
+    assert [(i, e[0], e[3]) for i, e in found] == [
+        (2, "129", "Never matches: shadowed by pat#2"),
+        (3, "129", "Never matches: shadowed by pat#2"),
+        (4, "129", "Never matches: shadowed by space:pat#1"),
+        (5, "129", "Never matches: shadowed by pat#2"),
+        (8, "129", "Never matches: shadowed by pat#7, pat#8"),
+    ]
+    found = manual_check_for_shadowed_rules(tokendefs, "default", 0)
+    assert [(i, e[3]) for i, e in found] == [(2, "Never matches: shadowed by pat#2")]
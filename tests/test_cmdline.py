@@ -0,0 +1,163 @@
+# Copyright 2018 Tim Hatch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import multiprocessing
+import time
+
+import pytest
+from pygments.lexer import RegexLexer, include
+from pygments.token import Name, Text
+
+from regexlint import cmdline
+from regexlint.cache import ResultCache
+from regexlint.cmdline import (
+    adaptive_chunksize,
+    check_lexer,
+    configure,
+    imap_ordered,
+    place_findings,
+)
+
+
+class ShadowingLexer(RegexLexer):
+    tokens = {
+        "root": [
+            include("space"),
+            (r"\w+", Name),
+            (r"\d+", Name),
+            (r"[ \t]", Text),
+        ],
+        "space": [(r"\s+", Text)],
+    }
+
+
+class IncludeOnlyLexer(RegexLexer):
+    tokens = {
+        "root": [include("body")],
+        "body": [(r"\w+", Name), (r"\d+", Name)],
+    }
+
+
+def slow_square(x):
+    # Early items finish last.
+    time.sleep(0.001 * (20 - x))
+    return x * x
+
+
+@pytest.mark.parametrize("chunksize,window", [(None, None), (1, 1), (3, 2), (2, 5)])
+def test_imap_ordered(chunksize, window):
+    with multiprocessing.Pool(2) as pool:
+        results = imap_ordered(pool, slow_square, range(20), 2, chunksize, window)
+        assert [x * x for x in range(20)] == list(results)
+
+
+def test_imap_ordered_stops_early():
+    with multiprocessing.Pool(2) as pool:
+        results = imap_ordered(pool, slow_square, range(20), 2, 1, 2)
+        assert 0 == next(results)
+        results.close()
+
+
+def worker_settings(_):
+    return (
+        cmdline.ONLY_FUNC,
+        cmdline.BATCH,
+        cmdline.CONFIRM_TIMEOUT,
+        cmdline.PARSE_CACHE.maxsize,
+        cmdline.RESULT_CACHE.path,
+        cmdline.RESULT_CACHE.max_entries,
+    )
+
+
+def test_configure_spawned_workers(tmp_path):
+    # Spawned workers start from a fresh import of cmdline, so they only have
+    # the settings if the pool's initializer passes them on.
+    settings = ("check_no_nulls", True, 0.5, 7, str(tmp_path), 10)
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1, initializer=configure, initargs=settings) as pool:
+        (result,) = pool.map(worker_settings, [0])
+    path = str(tmp_path / "results.sqlite")
+    assert result == ("check_no_nulls", True, 0.5, 7, path, 10)
+
+
+def test_shadowed_rules_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(cmdline, "RESULT_CACHE", ResultCache(str(tmp_path)))
+    args = ("ShadowingLexer", ShadowingLexer, __file__, 0, False)
+    results, has_errors = check_lexer(*args)
+    assert has_errors
+    assert sorted(f.code for f in results) == ["129", "129"]
+    cmdline.RESULT_CACHE.flush()
+
+    # With every state cached, the shadowing check isn't run at all.
+    def fail(*args):
+        raise AssertionError("not cached")
+
+    monkeypatch.setattr(cmdline, "manual_check_for_shadowed_rules", fail)
+    monkeypatch.setattr(cmdline, "RESULT_CACHE", ResultCache(str(tmp_path)))
+    assert check_lexer(*args) == (results, has_errors)
+    assert cmdline.RESULT_CACHE.misses == 0
+
+
+def test_include_only_state_cached(tmp_path, monkeypatch):
+    # "root" has the same effective rules as "body", but not its numbering.
+    args = ("IncludeOnlyLexer", IncludeOnlyLexer, __file__, 0, False)
+    expected = check_lexer(*args)
+    assert [(f.state, f.rule, f.code) for f in expected[0]] == [("body", 1, "129")]
+    monkeypatch.setattr(cmdline, "RESULT_CACHE", ResultCache(str(tmp_path)))
+    assert check_lexer(*args) == expected
+
+
+def test_split_state_shadowed_once(monkeypatch):
+    checked_states = []
+    check = cmdline.manual_check_for_shadowed_rules
+
+    def counting_check(tokendefs, state, flags):
+        checked_states.append(state)
+        return check(tokendefs, state, flags)
+
+    monkeypatch.setattr(cmdline, "manual_check_for_shadowed_rules", counting_check)
+    args = ("ShadowingLexer", ShadowingLexer, __file__, 0, False)
+    whole, _ = check_lexer(*args)
+    assert sorted(checked_states) == ["root", "space"]
+
+    # Both shadowed rules of root are in the second part, but only the first
+    # part looks at root.
+    del checked_states[:]
+    held = []
+    split = []
+    for parts in ([("root", 0, 2)], [("root", 2, None)], [("space", 0, None)]):
+        results, _ = check_lexer(*args, parts)
+        split.extend(place_findings(results, parts, held))
+    assert sorted(checked_states) == ["root", "space"]
+    assert held == []
+    assert split == whole
+
+
+def test_result_cache_closed_on_interrupt(tmp_path, monkeypatch):
+    def interrupted_check_args(*args):
+        cmdline.RESULT_CACHE.put("k", [])
+        raise KeyboardInterrupt
+
+    # configure() replaces it, this puts it back afterwards.
+    monkeypatch.setattr(cmdline, "RESULT_CACHE", None)
+    monkeypatch.setattr(cmdline, "check_args", interrupted_check_args)
+    with pytest.raises(KeyboardInterrupt):
+        cmdline.main(["--no_parallel", "--cache_dir", str(tmp_path), "x"])
+    assert ResultCache(str(tmp_path)).get("k") == []
+
+
+def test_adaptive_chunksize():
+    assert 1 == adaptive_chunksize(5, 4)
+    assert 4 == adaptive_chunksize(128, 4)
+    assert 16 == adaptive_chunksize(100000, 4)
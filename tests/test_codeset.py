@@ -0,0 +1,101 @@
+# Copyright 2018 Tim Hatch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import re
+from unittest import TestCase
+
+from regexlint.codeset import (
+    MAX_CODE,
+    CodeSet,
+    case_closure,
+    case_variants,
+    unicode_category,
+)
+
+
+class CodeSetTests(TestCase):
+    def test_normalizes(self):
+        s = CodeSet([(5, 9), (1, 2), (3, 3), (8, 12), (20, 19)])
+        self.assertEqual(((1, 3), (5, 12)), s.ranges)
+        self.assertEqual(11, len(s))
+        self.assertEqual([1, 2, 3, 5, 6, 7, 8, 9, 10, 11, 12], list(s))
+
+    def test_from_codes(self):
+        s = CodeSet.from_codes([ord(c) for c in "cabz"])
+        self.assertEqual(((97, 99), (122, 122)), s.ranges)
+        self.assertEqual(CodeSet.from_range(97, 99) | CodeSet.from_range(122, 122), s)
+
+    def test_contains(self):
+        s = CodeSet([(10, 20), (30, 30)])
+        self.assertEqual(
+            [10, 15, 20, 30], [i for i in range(40) if i in s and i % 5 == 0]
+        )
+        self.assertNotIn(9, s)
+        self.assertNotIn(21, s)
+        self.assertNotIn(31, s)
+        self.assertNotIn(0, CodeSet())
+
+    def test_complement(self):
+        s = CodeSet([(10, 20), (30, 30)])
+        self.assertEqual(((0, 9), (21, 29), (31, 255)), s.complement(0, 255).ranges)
+        self.assertEqual(((21, 25),), s.complement(15, 25).ranges)
+        self.assertEqual(((0, MAX_CODE),), CodeSet().complement().ranges)
+        self.assertFalse(CodeSet.from_range(0, MAX_CODE).complement())
+
+    def test_wide(self):
+        s = CodeSet.from_range(0, MAX_CODE) - CodeSet.from_range(0x100, 0xFFFF)
+        self.assertEqual(((0, 0xFF), (0x10000, MAX_CODE)), s.ranges)
+        self.assertEqual(MAX_CODE + 1 - 0xFF00, len(s))
+        self.assertTrue(s.overlaps(CodeSet.from_range(0xFFFF, 0x10000)))
+        self.assertTrue(s.isdisjoint(CodeSet.from_range(0x100, 0xFFFF)))
+
+    def test_against_sets(self):
+        rnd = random.Random(0)
+
+        def rand():
+            ranges = []
+            for _ in range(rnd.randint(0, 6)):
+                lo = rnd.randint(0, 60)
+                ranges.append((lo, lo + rnd.randint(-1, 8)))
+            return CodeSet(ranges)
+
+        for _ in range(500):
+            a = rand()
+            b = rand()
+            self.assertEqual(set(a) | set(b), set(a | b))
+            self.assertEqual(set(a) & set(b), set(a & b))
+            self.assertEqual(set(a) - set(b), set(a - b))
+            self.assertEqual(bool(set(a) & set(b)), a.overlaps(b))
+            self.assertEqual(set(a) <= set(b), a <= b)
+            self.assertEqual(set(range(64)) - set(a), set(a.complement(0, 63)))
+            for result in (a | b, a & b, a - b):
+                self.assertEqual(CodeSet(result.ranges), result)
+
+
+class UnicodeTablesTests(TestCase):
+    def test_categories(self):
+        for name in ("\\s", "\\d", "\\w", "\\S", "\\D", "\\W"):
+            codes = unicode_category(name)
+            regex = re.compile(name)
+            for i in list(range(0x400)) + [0x1680, 0x3000, 0x4E00, 0x1D7CE]:
+                self.assertEqual(bool(regex.match(chr(i))), i in codes, (name, i))
+
+    def test_case_closure(self):
+        codes = case_closure(CodeSet.from_codes(map(ord, "k1")))
+        self.assertEqual(CodeSet.from_codes(map(ord, "k1K\N{KELVIN SIGN}")), codes)
+        _, cased, noncanonical = case_variants()
+        self.assertIn(ord("K"), noncanonical)
+        self.assertNotIn(ord("k"), noncanonical)
+        self.assertNotIn(ord("1"), cased)
@@ -0,0 +1,158 @@
+# Copyright 2018 Tim Hatch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import json
+import re
+
+import pytest
+from pygments.lexer import RegexLexer, bygroups, default, include
+from pygments.token import Keyword, Name, Number, Punctuation, Text
+
+from regexlint.cmdline import main
+from regexlint.codeset import CodeSet
+from regexlint.dispatch import (
+    DispatchBench,
+    DispatchTable,
+    dispatch_tokens,
+    rule_first,
+    write_dispatch_table,
+)
+
+
+class DispatchLexer(RegexLexer):
+    flags = re.IGNORECASE
+    tokens = {
+        "root": [
+            include("whitespace"),
+            (r"if\b", Keyword),
+            (r"[0-9]+", Number),
+            (r"(\w+)(\()", bygroups(Name.Function, Punctuation), "args"),
+            (r"\w+", Name),
+        ],
+        "whitespace": [
+            (r"\s+", Text),
+        ],
+        "args": [
+            include("whitespace"),
+            (r"\)", Punctuation, "#pop"),
+            (r"[^()\s]+", Name),
+            default("#pop"),
+        ],
+    }
+
+
+@pytest.mark.parametrize(
+    "pat,flags,first",
+    [
+        (r"ab", 0, "a"),
+        (r"(?:x|y)?z", 0, "xyz"),
+        (r"\bq", 0, "q"),
+        (r"(?<=a)b", 0, "b"),
+    ],
+)
+def test_rule_first(pat, flags, first):
+    codes = rule_first(re.compile(pat, flags).match)
+    assert codes == CodeSet.from_codes(map(ord, first))
+
+
+@pytest.mark.parametrize("pat", [r"", r"a?", r"$", r"(?=a)", r"(a?)\1"])
+def test_rule_first_everywhere(pat):
+    assert rule_first(re.compile(pat).match) is None
+
+
+def test_rule_first_ignorecase():
+    codes = rule_first(re.compile(r"i", re.IGNORECASE).match)
+    # U+0130 isn't a case form of "i" to str.lower(), but re matches it.
+    for c in "iIİı":
+        assert ord(c) in codes
+    assert ord("j") not in codes
+
+
+def test_lookup():
+    lexer = DispatchLexer()
+    table = DispatchTable(lexer._tokens)
+    rules = lexer._tokens["root"]
+    root = table.lookup("root")
+    assert root["I"] == (rules[1], rules[3], rules[4])
+    assert root["5"] == (rules[2], rules[3], rules[4])
+    assert root[" "] == (rules[0],)
+    assert root["("] == ()
+    assert root[""] == ()
+    args = lexer._tokens["args"]
+    assert table.lookup("args")[""] == (args[3],)
+    assert table.lookup("args")[")"] == (args[1], args[3])
+
+
+def test_dispatch_tokens():
+    lexer = DispatchLexer()
+    table = DispatchTable(lexer._tokens)
+    text = "if f(x y) 12 (\nIF\n"
+    expected = list(lexer.get_tokens_unprocessed(text))
+    assert list(dispatch_tokens(lexer, table, text)) == expected
+
+
+def test_bench():
+    bench = DispatchBench(DispatchLexer)
+    assert bench.supported
+    bench.run("f(x) 1\n" * 10, "a")
+    d = bench.summary()
+    assert d["files"] == 1
+    assert d["tokens"] == 70
+    assert d["identical"]
+    assert bench.mismatch is None
+
+
+def test_bench_mismatch():
+    bench = DispatchBench(DispatchLexer)
+    # As if the table had the wrong idea about "1".
+    bench.table.lookup("root")["1"] = ()
+    bench.run("x 1", "a")
+    assert not bench.summary()["identical"]
+    assert bench.mismatch == ("a", 2)
+
+
+def test_write_dispatch_table():
+    stream = io.StringIO()
+    bench = DispatchBench(DispatchLexer)
+    write_dispatch_table(bench.table, DispatchLexer, "DispatchLexer", stream)
+    lines = stream.getvalue().splitlines()
+    assert lines[0].startswith("DispatchLexer:root: 5 rules, ")
+    assert "  [0-9]: pat#3, pat#4, pat#5" in lines
+    assert "  [Ii] and 2 more: pat#2, pat#4, pat#5" in lines
+    assert "  [)]: pat#2, pat#4" in lines
+    assert "  end of text: -" in lines
+    assert "  end of text: pat#4" in lines
+
+
+def test_dispatch_cmdline(tmp_path, capsys):
+    (tmp_path / "a.c").write_text("int x = 1;\n")
+    (tmp_path / "b.ini").write_text("[s]\nk = v\n")
+    main(
+        [
+            "dispatch",
+            "--format",
+            "json",
+            "--corpus",
+            str(tmp_path),
+            "pygments.lexers.configs:IniLexer",
+            "pygments.lexers.c_cpp:CLexer",
+        ]
+    )
+    captured = capsys.readouterr()
+    (result,) = json.loads(captured.out)
+    assert result["lexer"] == "IniLexer"
+    assert result["files"] == 1
+    assert result["identical"]
+    assert "CLexer: skipped" in captured.err
@@ -0,0 +1,110 @@
+# Copyright 2018 Tim Hatch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+import pickle
+from io import StringIO
+
+import pytest
+
+from regexlint.findings import WRITERS, Finding
+
+LEXER_FINDING = Finding(
+    code="105",
+    level=logging.ERROR,
+    path="demo.py",
+    line=7,
+    column=16,
+    end_column=17,
+    source='            ("(else|elseif)", Text),',
+    lexer="T",
+    state="root",
+    rule=0,
+    pos=1,
+    message="Potential out of order alternation between 'else' and 'elseif'",
+    pattern="(else|elseif)",
+)
+
+REGEX_FINDING = LEXER_FINDING._replace(
+    path=None,
+    line=None,
+    column=None,
+    end_column=None,
+    source=None,
+    lexer=None,
+    state=None,
+    rule=None,
+    code="999",
+    pos=0,
+    message="Matches empty string",
+    pattern="(x|)",
+)
+
+
+def write_all(fmt, items):
+    stream = StringIO()
+    writer = WRITERS[fmt](stream)
+    for item in items:
+        writer.write(item)
+    writer.close()
+    return stream.getvalue()
+
+
+def test_text():
+    output = write_all("text", ["Module demo\n", LEXER_FINDING, REGEX_FINDING])
+    assert (
+        """\
+Module demo
+demo.py:7: (T:root:pat#1) E105: Potential out of order alternation between 'else' and 'elseif'
+              ("(else|elseif)", Text),
+                  ^ here
+argv:root:0: E999: Matches empty string
+  '(x|)'
+   ^ here
+"""
+        == output
+    )
+
+
+def test_text_without_source_line():
+    f = LEXER_FINDING._replace(line=None, column=None, end_column=None, source=None)
+    assert write_all("text", [f]).startswith("demo.py: (T:root:pat#1) E105: ")
+
+
+@pytest.mark.parametrize("items", [[], ["T OK\n"], [LEXER_FINDING, REGEX_FINDING]])
+def test_json(items):
+    data = json.loads(write_all("json", items))
+    assert [f.to_dict() for f in items if isinstance(f, Finding)] == data
+    if data:
+        assert "ERROR" == data[0]["level"]
+
+
+@pytest.mark.parametrize("items", [[], [LEXER_FINDING, "T OK\n", REGEX_FINDING]])
+def test_sarif(items):
+    data = json.loads(write_all("sarif", items))
+    assert "2.1.0" == data["version"]
+    results = data["runs"][0]["results"]
+    assert len([f for f in items if isinstance(f, Finding)]) == len(results)
+    if results:
+        assert "105" == results[0]["ruleId"]
+        assert "error" == results[0]["level"]
+        region = results[0]["locations"][0]["physicalLocation"]["region"]
+        assert {"startLine": 7, "startColumn": 17, "endColumn": 18} == region
+        assert "locations" not in results[1]
+
+
+def test_pickle():
+    assert LEXER_FINDING == pickle.loads(pickle.dumps(LEXER_FINDING))
+    assert not hasattr(LEXER_FINDING, "__dict__")
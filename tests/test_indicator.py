@@ -18,6 +18,7 @@ import unittest
 from io import StringIO
 
 from regexlint.indicator import find_offending_line, find_substr_pos, mark_str
+from regexlint.indicator_ast import ModuleIndex, parse_cache
 
 fakemod = r'''# line 1
 class foo(object):
@@ -82,6 +83,21 @@ class IndicatorTests(unittest.TestCase):
         ret = find_offending_line(fakemod, "foo", "baz", 0, 0)
         self.assertEqual((22, 18, 19, "        'baz': [('b', String)],"), ret)
 
+    def test_find_offending_line_nested_dict(self):
+        # 'baz' is also a key of the dict passed to func() in 'evil', but the
+        # tokens dict comes first in ast.walk order.
+        ret = find_offending_line(fakemod, "foo", "baz", 0, 0)
+        self.assertEqual(22, ret[0])
+        self.assertEqual(None, find_offending_line(fakemod, "foo", "baz", 1, 0))
+        self.assertEqual(None, find_offending_line(fakemod, "bar", "root", 0, 0))
+
+    def test_module_index_is_cached(self):
+        find_offending_line(fakemod, "foo", "root", 0, 0)
+        index = parse_cache.get(fakemod)
+        self.assertIsInstance(index, ModuleIndex)
+        find_offending_line(fakemod, "foo", "other", 1, 3)
+        self.assertIs(index, parse_cache.get(fakemod))
+
 
 class SubstrPosTests(unittest.TestCase):
     def test_find_pos1(self):
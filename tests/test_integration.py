@@ -79,3 +79,40 @@ demo_integration.py:7: (T:root:pat#1) E108: Gap in capture groups using bygroups
 """,
                 output,
             )
+
+    def test_no_parallel_output_file(self):
+        with tempfile.TemporaryDirectory() as d:
+            dp = Path(d)
+            (dp / "demo_integration.py").write_text(
+                """\
+from pygments.lexer import RegexLexer
+from pygments.token import Text
+
+class T(RegexLexer):
+    tokens = {
+        "root": [
+            ("(else|elseif)", Text),
+        ],
+    }
+"""
+            )
+
+            env = dict(os.environ, PYTHONPATH=d)
+            proc = subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "regexlint.cmdline",
+                    "--no_parallel",
+                    "--output_file",
+                    str(dp / "out.txt"),
+                    "demo_integration",
+                ],
+                env=env,
+                encoding="utf-8",
+                stdout=subprocess.PIPE,
+            )
+            self.assertEqual(1, proc.returncode)
+            self.assertEqual("", proc.stdout)
+            output = STRIP_PATH_RE.sub("", (dp / "out.txt").read_text())
+            self.assertIn("(T:root:pat#1) E105:", output)
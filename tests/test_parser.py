@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import re
 import sre_constants
 import sre_parse
 from unittest import TestCase
@@ -20,7 +21,18 @@ from unittest import TestCase
 import pytest
 from pygments.token import Other
 
-from regexlint.parser import DIGITS, WHITESPACE, WORD, Node, Regex, fmttree
+from regexlint.parser import (
+    CHARCLASS_CACHE,
+    DIGITS,
+    WHITESPACE,
+    PARSE_CACHE,
+    WORD,
+    Node,
+    Regex,
+    VerboseRegex,
+    fmttree,
+    scan_regex,
+)
 from regexlint.util import find_all, find_all_by_type, width
 
 SAMPLE_PATTERNS = [
@@ -90,6 +102,29 @@ class BasicTests(TestCase):
         self.assertEqual("(?m)", directives[0].data)
         self.assertEqual("(?i)", directives[1].data)
 
+    def test_find_by_type_matches_walk(self):
+        r = Regex.get_parse_tree(r"(?i)(a|b(?:c))+[d-e](?#x)\1$")
+        for t in (
+            Other,
+            Other.Group,
+            Other.CharClass,
+            Other.Literal,
+            (Other.Literal, Other.Comment),
+            (Other.Group,),
+            Other.Anchor,
+        ):
+            walked = [n for n in find_all(r) if n.type in t]
+            self.assertEqual(walked, list(find_all_by_type(r, t)))
+            self.assertIs(r.find_by_type(t), r.find_by_type(t))
+
+    def test_parse_tree_cache(self):
+        before = PARSE_CACHE.hits
+        r = Regex.get_parse_tree(r"cached(?:tree)+", 0)
+        self.assertIs(r, Regex.get_parse_tree(r"cached(?:tree)+", 0))
+        self.assertEqual(before + 1, PARSE_CACHE.hits)
+        self.assertIsNot(r, Regex.get_parse_tree(r"cached(?:tree)+", re.I))
+        self.assertIsNot(r, VerboseRegex.get_parse_tree(r"cached(?:tree)+", 0))
+
     def test_char_range(self):
         r = Regex.get_parse_tree(r"[a-z]")
         self.assertEqual(1, len(next(find_all_by_type(r, Other.CharClass)).chars))
@@ -106,6 +141,17 @@ class BasicTests(TestCase):
         self.assertEqual(10, bar.end)
         self.assertEqual(13, r.end)
 
+    def test_parent_and_next_links(self):
+        r = Regex.get_parse_tree(r"(a|b)c")
+        capture = r.children[0]
+        alternation = capture.children[0]
+        self.assertIs(r, capture.parent())
+        self.assertIs(capture, alternation.parent())
+        self.assertIs(r.children[1], alternation.next_no_children())
+        self.assertTrue(alternation.children[1].is_descentant_of(capture))
+        self.assertFalse(r.children[1].is_descentant_of(capture))
+        self.assertFalse(hasattr(capture, "__dict__"))
+
     def test_comment(self):
         r = Regex.get_parse_tree(r"(?#foo)")
         l = list(find_all_by_type(r, Other.Comment))
@@ -190,6 +236,30 @@ def test_reconstruct(pat):
     assert pat == rec
 
 
+SCANNER_PATTERNS = [
+    r"(?i)(?:x)(?=a)(?!b)(?<=c)(?<!d)(?#comment)(?(1)e)",
+    r"(?P<name>a)(?P=name)\1\12",
+    r"^\b\A\Z$.*?+???",
+    r"a-b-c\[[-a^]",
+    r"\x4g\x41\u123\u1234\U0001f600\0\012\08",
+    r"{}{,}{1}{,2}{3,}{4,5}?",
+    "a\\\nb\x00\r\\",
+    "[\\\n]",
+    "(?x) a  b # comment\n [ ]",
+    "\u0663{\u0663}",
+]
+
+
+@pytest.mark.parametrize(
+    "pat", SAMPLE_PATTERNS + CHARCLASS_PATTERNS + SCANNER_PATTERNS
+)
+def test_scanner_matches_lexer(pat):
+    assert list(Regex().get_tokens_unprocessed(pat)) == list(scan_regex(pat))
+    assert list(VerboseRegex().get_tokens_unprocessed(pat)) == list(
+        scan_regex(pat, verbose=True)
+    )
+
+
 SRE_CATS = {
     sre_constants.CATEGORY_SPACE: list(map(ord, WHITESPACE)),
     sre_constants.CATEGORY_DIGIT: list(map(ord, DIGITS)),
@@ -251,3 +321,37 @@ def test_charclass(pat):
         print("missing:", sorted(set(golden) - set(regexlint_version)))
 
         assert sorted(golden) == sorted(regexlint_version)
+
+
+@pytest.mark.parametrize(
+    "pat", CHARCLASS_PATTERNS + [r"[a-fc-z]", r"[\w\d_]", r"[\s \S]", r"[^\x00-\xff]"]
+)
+def test_charclass_code_set(pat):
+    cc = Regex().get_parse_tree(pat).children[0]
+    codes = cc.matching_character_codes
+    assert set(codes) == set(cc.code_set)
+    assert len(codes) == cc.code_count()
+    counts = {}
+    for i in codes:
+        counts[i] = counts.get(i, 0) + 1
+    assert [k for k, v in counts.items() if v > 1] == cc.duplicate_codes()
+
+
+def test_charclass_wide():
+    cc = Regex().get_parse_tree("[\\x00-\\U0010ffff\\u1234a-c]").children[0]
+    assert ((0, 0x10FFFF),) == cc.code_set.ranges
+    assert 0x110004 == cc.code_count()
+    assert [97, 98, 99, 0x1234] == cc.duplicate_codes()
+
+
+def test_charclass_cache():
+    first = Regex.get_parse_tree(r"[^a-z\n]").children[0]
+    second = Regex.get_parse_tree(r"x+[^a-z\n]", re.I).children[1]
+    assert first._info is second._info
+    assert first._info is CHARCLASS_CACHE.get(("^", "a", "-", "z", "\\n"))
+    assert second.negated
+    # Each class still has its own nodes, for the checkers' positions.
+    assert 2 == first.chars[0].a.start
+    assert 4 == second.chars[0].a.start
+    assert (97, 122) == (second.chars[0].codepoint_a, second.chars[0].codepoint_b)
+    assert first.matching_character_codes is second.matching_character_codes
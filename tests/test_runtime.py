@@ -0,0 +1,236 @@
+# Copyright 2018 Tim Hatch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+import pytest
+from pygments.lexer import RegexLexer, default, include, inherit
+from pygments.token import Error, Name, Number, Punctuation, Text
+
+from regexlint.cmdline import main
+from regexlint.runtime import LexerBench, LexerRun, read_corpus, rule_origins
+
+
+class SampleLexer(RegexLexer):
+    tokens = {
+        "root": [
+            include("whitespace"),
+            (r"\d+", Number),
+            (r"\(", Punctuation, "args"),
+            (r"\w+", Name),
+        ],
+        "whitespace": [
+            (r"\s+", Text),
+        ],
+        "args": [
+            include("whitespace"),
+            (r"\)", Punctuation, "#pop"),
+            (r"[^()\s]+", Name),
+            default("#pop"),
+        ],
+    }
+
+
+class ErrorLexer(SampleLexer):
+    filenames = ["*.err", "x.*"]
+    tokens = {
+        "root": [
+            (r"!", Error),
+            inherit,
+        ],
+    }
+
+
+class SampleSubLexer(SampleLexer):
+    tokens = {
+        "root": [
+            (r"@\w+", Name.Decorator),
+            inherit,
+        ],
+    }
+
+
+def test_rule_origins():
+    lexer = SampleLexer()
+    origins = rule_origins(SampleLexer, lexer._tokens)
+    assert [origins[id(r)] for r in lexer._tokens["root"]] == [
+        ("whitespace", 0),
+        ("root", 1),
+        ("root", 2),
+        ("root", 3),
+    ]
+    assert [origins[id(r)] for r in lexer._tokens["args"]] == [
+        ("whitespace", 0),
+        ("args", 1),
+        ("args", 2),
+        ("args", 3),
+    ]
+
+
+def test_rule_origins_inherit():
+    lexer = SampleSubLexer()
+    origins = rule_origins(SampleSubLexer, lexer._tokens)
+    assert [origins[id(r)] for r in lexer._tokens["root"]] == [
+        ("root", 0),
+        ("whitespace", 0),
+        ("root", 2),
+        ("root", 3),
+        ("root", 4),
+    ]
+    assert origins[id(lexer._tokens["args"][1])] == ("args", 1)
+
+
+def test_lexer_run():
+    run = LexerRun(SampleLexer)
+    run.run("f(x 1) 2")
+    assert run.files == 1
+    assert run.chars == 8
+    hits = {k: v.hits for k, v in run.stats.items()}
+    assert hits == {
+        ("whitespace", 0): 2,
+        ("root", 1): 1,
+        ("root", 2): 1,
+        ("root", 3): 1,
+        ("args", 1): 1,
+        ("args", 2): 2,
+        ("args", 3): 0,
+    }
+    # Once for "f", and once more at the end of the text.
+    assert run.stats["root", 3].attempts == 2
+    assert run.stats["whitespace", 0].attempts == 9
+    # The class itself is left alone.
+    assert SampleLexer()._tokens["root"][0][0] is not run.lexer._tokens["root"][0][0]
+
+
+def test_read_corpus(tmp_path):
+    (tmp_path / "b").mkdir()
+    (tmp_path / "b" / "c.txt").write_bytes(b"\xff!")
+    (tmp_path / "a.txt").write_text("a")
+    assert list(read_corpus([str(tmp_path)])) == [
+        (str(tmp_path / "a.txt"), "a"),
+        (str(tmp_path / "b" / "c.txt"), "�!"),
+    ]
+
+
+def test_profile(tmp_path, capsys):
+    (tmp_path / "x.ini").write_text("[section]\nkey = value\n")
+    main(["profile", "--limit", "2", "pygments.lexers.configs:IniLexer", str(tmp_path)])
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].startswith("IniLexer: 1 files, 22 chars in ")
+    assert lines[1].split() == ["seconds", "share", "attempts", "hits", "rule"]
+    assert len(lines) == 4
+    assert "configs.py:" in lines[2]
+    assert "(IniLexer:root:pat#" in lines[2]
+
+
+def test_bench_cmdline_positional(tmp_path, capsys):
+    (tmp_path / "a.c").write_text("int x`;\n")
+    main(["bench", "pygments.lexers.c_cpp:CLexer", str(tmp_path / "a.c")])
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].startswith("CLexer: 1 files, ")
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        ["bench", "pygments.lexers.c_cpp:CLexer"],
+        ["bench", "--corpus", "."],
+    ],
+)
+def test_bench_cmdline_usage(argv):
+    with pytest.raises(SystemExit):
+        main(argv)
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        ["profile", "pygments.lexers.configs:IniLexer", "{}"],
+        ["coverage", "pygments.lexers.configs:IniLexer", "{}"],
+        ["bench", "--corpus", "{}", "pygments.lexers.configs:IniLexer"],
+        ["dispatch", "--corpus", "{}", "pygments.lexers.configs:IniLexer"],
+    ],
+)
+def test_missing_corpus(tmp_path, capsys, argv):
+    missing = str(tmp_path / "missing")
+    with pytest.raises(SystemExit) as e:
+        main([missing if arg == "{}" else arg for arg in argv])
+    assert e.value.code == 2
+    assert "error: no such file or directory: %s" % missing in capsys.readouterr().err
+
+
+def test_coverage():
+    run = LexerRun(SampleLexer)
+    run.run("f 1")
+    assert run.entered == {"root": 4}
+    # whitespace is only included.
+    assert run.never_entered() == ["args"]
+    assert [(state, i, s.attempts) for state, i, s in run.never_matched()] == [
+        ("root", 2, 2)
+    ]
+
+
+def test_coverage_cmdline(tmp_path, capsys):
+    (tmp_path / "x.ini").write_text("key = value\n")
+    main(["coverage", "pygments.lexers.configs:IniLexer", str(tmp_path)])
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == (
+        "IniLexer: 5 of 13 rules never matched, 2 of 3 states never entered"
+    )
+    assert lines[1].endswith(" (IniLexer:quoted_value) never entered")
+    assert lines[2].endswith(" (IniLexer:value) never entered")
+    assert lines[3].endswith(" (IniLexer:root:pat#2) never matched in 2 tries")
+
+
+def test_bench():
+    bench = LexerBench(ErrorLexer)
+    bench.run("f) !")
+    # The "!" comes from a rule.
+    assert bench.errors == 2
+    assert bench.fallbacks == {("root", ")"): 1}
+    d = bench.summary()
+    assert d["files"] == 1
+    assert d["chars"] == 4
+    assert d["errors_per_kb"] == pytest.approx(2 * 1024 / 4)
+
+
+def test_bench_matches():
+    bench = LexerBench(ErrorLexer)
+    assert bench.matches("a/b.err")
+    assert bench.matches("x.y")
+    assert not bench.matches("a.y")
+
+
+def test_bench_cmdline(tmp_path, capsys):
+    (tmp_path / "a.c").write_text("int x`;\n")
+    (tmp_path / "b.py").write_text("x = 1\n")
+    main(
+        [
+            "bench",
+            "--format",
+            "json",
+            "--corpus",
+            str(tmp_path),
+            "pygments.lexers.c_cpp:CLexer",
+            "pygments.lexers.configs:IniLexer",
+        ]
+    )
+    # Nothing matches IniLexer's filenames.
+    captured = capsys.readouterr()
+    (result,) = json.loads(captured.out)
+    assert captured.err == "IniLexer: no matching files (use --all_files)\n"
+    assert result["lexer"] == "CLexer"
+    assert result["files"] == 1
+    assert result["errors"] == 1
+    assert result["fallbacks"] == [{"state": "statement", "char": "`", "count": 1}]
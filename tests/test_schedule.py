@@ -0,0 +1,73 @@
+# Copyright 2018 Tim Hatch
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pygments.lexer import RegexLexer
+from pygments.token import Text
+
+from regexlint.schedule import plan_jobs, split_rules, timing_key
+
+
+class Small(RegexLexer):
+    tokens = {"root": [("a", Text)]}
+
+
+class Big(RegexLexer):
+    tokens = {
+        "root": [("x" * 1000, Text)] * 10,
+        "other": [("b", Text)],
+    }
+
+
+ITEMS = [
+    "Module m\n",
+    ("Small", Small, "m.py", 0, False),
+    ("Big", Big, "m.py", 0, False),
+]
+
+
+def test_split_rules():
+    assert [("s", 0, 2), ("s", 2, 3), ("s", 3, 4)] == list(
+        split_rules("s", [1, 1, 2, 5], 2)
+    )
+    assert [("s", 0, 1)] == list(split_rules("s", [5], 2))
+
+
+def test_single_process_is_not_split():
+    jobs = plan_jobs(ITEMS, 1)
+    assert [0, 1, 2] == [n for n, _, _ in jobs]
+    assert "Module m\n" == jobs[0][1]
+    assert None is jobs[2][1][5]
+
+
+def test_big_lexer_is_split():
+    jobs = plan_jobs(ITEMS, 4)
+    assert ITEMS[1] + (None,) == jobs[1][1]
+    parts = [job[5] for n, job, _ in jobs if n == 2]
+    assert len(parts) > 2
+    # Every rule is covered once, in order.
+    rules = []
+    for part in parts:
+        for state, start, stop in part:
+            stop = len(Big.tokens[state]) if stop is None else stop
+            rules.extend((state, i) for i in range(start, stop))
+    expected = [("root", i) for i in range(10)] + [("other", 0)]
+    assert expected == rules
+
+
+def test_timings_override_estimates():
+    timings = {timing_key(Small): 100.0}
+    jobs = plan_jobs(ITEMS, 4, timings)
+    # Now Small is the expensive one, but it only has one rule.
+    assert [(1, 100.0)] == [(n, cost) for n, _, cost in jobs if n == 1]
+    assert [2] == [n for n, job, _ in jobs if n == 2]
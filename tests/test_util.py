@@ -13,10 +13,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import warnings
 from unittest import TestCase
 from ast import literal_eval
 
-from regexlint.util import build_ranges, consistent_repr, eval_char
+from pygments.lexer import RegexLexer, default, include, inherit
+from pygments.token import Text
+
+from regexlint.util import (
+    LRUCache,
+    build_ranges,
+    consistent_repr,
+    effective_rules,
+    _literal_eval_char,
+    eval_char,
+    lexer_tokens,
+)
 
 
 class UtilTests(TestCase):
@@ -42,6 +54,45 @@ class UtilTests(TestCase):
             actual = eval_char(c)
             self.assertEqual(actual, 0x40)
 
+    def test_eval_char_same_as_literal_eval(self):
+        cases = ["\\" + chr(i) for i in range(0x300)]
+        cases += [chr(i) for i in range(0x300)]
+        cases += ["\\x%02x" % i for i in range(256)]
+        cases += ["\\x%02X" % i for i in range(256)]
+        cases += ["\\u%04x" % i for i in range(0, 0x10000, 97)]
+        cases += ["\\U%08x" % i for i in range(0, 0x110000, 4099)]
+        cases += ["\\%o" % i for i in range(512)] + ["\\%03o" % i for i in range(64)]
+        cases += [
+            # malformed, or not quite what the parser produces
+            "\\x4",
+            "\\xg1",
+            "\\x+1",
+            "\\x 1",
+            "\\u12",
+            "\\u1_23",
+            "\\U00110000",
+            "\\U0010FFFF",
+            "\\0123",
+            "\\N{DIGIT ONE}",
+            "\\\n",
+            "\\\t",
+            "ab",
+            "ab'",
+            "\\x'",
+            b"\\x40",
+        ]
+        for c in cases:
+            try:
+                with warnings.catch_warnings():
+                    # literal_eval complains about escapes like "\8"
+                    warnings.simplefilter("ignore")
+                    expected = _literal_eval_char(c)
+            except Exception as e:
+                with self.assertRaises(type(e), msg=repr(c)):
+                    eval_char(c)
+            else:
+                self.assertEqual(expected, eval_char(c), repr(c))
+
     def test_consistent_repr_empty(self):
         golden = r"''"
         self.assertEqual(golden, consistent_repr(literal_eval(golden)))
@@ -73,3 +124,98 @@ class RangesTest(TestCase):
 
     def test_joint(self):
         self.assertEqual([(65, 66), 69], build_ranges([65, 66, 69]))
+
+
+class LRUCacheTest(TestCase):
+    def test_evicts_least_recently_used(self):
+        c = LRUCache(maxsize=2)
+        c.put("a", 1)
+        c.put("b", 2)
+        self.assertEqual(1, c.get("a"))
+        c.put("c", 3)
+        self.assertNotIn("b", c)
+        self.assertEqual(None, c.get("b"))
+        self.assertEqual((1, 1), (c.hits, c.misses))
+        self.assertEqual(2, len(c))
+
+    def test_resize_and_disable(self):
+        c = LRUCache(maxsize=None)
+        for i in range(10):
+            c.put(i, i)
+        self.assertEqual(10, len(c))
+        c.resize(3)
+        self.assertEqual([7, 8, 9], [i for i in range(10) if i in c])
+        c.resize(0)
+        c.put("x", 1)
+        self.assertEqual(0, len(c))
+
+
+class LexerTokensTest(TestCase):
+    def test_matches_instantiated_tokens(self):
+        class Base(RegexLexer):
+            tokens = {"root": [("a", Text), inherit], "other": [("b", Text)]}
+
+        class Middle(Base):
+            tokens = {"root": [("c", Text), inherit, ("d", Text)]}
+
+        class Leaf(Middle):
+            tokens = {"root": [inherit, ("e", Text)], "other": [("f", Text)]}
+
+        class NoTokens(Leaf):
+            pass
+
+        expected = {
+            "root": [("c", Text), ("a", Text), inherit, ("d", Text), ("e", Text)],
+            "other": [("f", Text)],
+        }
+        self.assertEqual(expected, lexer_tokens(Leaf))
+        self.assertEqual(expected, lexer_tokens(NoTokens))
+        # Nothing was compiled or spliced into the class's own lists.
+        self.assertNotIn("_tokens", Leaf.__dict__)
+        self.assertEqual([inherit, ("e", Text)], Leaf.tokens["root"])
+
+        self.assertEqual(expected, Leaf().tokens)
+        self.assertEqual(lexer_tokens(Middle), Middle().tokens)
+        # Instantiating spliced the class's own lists, which mustn't be spliced
+        # again.
+        self.assertIn("_tokens", Leaf.__dict__)
+        self.assertEqual(expected, lexer_tokens(Leaf))
+        self.assertEqual(expected, lexer_tokens(NoTokens))
+
+    def test_shared_list_spliced_by_subclass(self):
+        class Base(RegexLexer):
+            tokens = {"root": [("a", Text), inherit]}
+
+        class Middle(Base):
+            tokens = {"root": [("b", Text), inherit]}
+
+        class Leaf(Middle):
+            pass
+
+        # Leaf doesn't define root, so this splices Middle's own list.
+        Leaf()
+        self.assertNotIn("_tokens", Middle.__dict__)
+        expected = {"root": [("b", Text), ("a", Text), inherit]}
+        self.assertEqual(expected, lexer_tokens(Middle))
+
+
+class EffectiveRulesTest(TestCase):
+    def test_splices_includes(self):
+        tokendefs = {
+            "root": [include("a"), ("x", Text), include("b"), default("#pop")],
+            "a": [("y", Text), include("root")],
+            "b": [inherit],
+        }
+        self.assertEqual(
+            [
+                ("a", 0, ("y", Text)),
+                ("root", 1, ("x", Text)),
+                ("root", 3, tokendefs["root"][3]),
+            ],
+            effective_rules(tokendefs, "root"),
+        )
+        # Including itself (through root) adds nothing more.
+        self.assertEqual(
+            effective_rules(tokendefs, "root"), effective_rules(tokendefs, "a")
+        )
+        self.assertEqual([], effective_rules(tokendefs, "missing"))